@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Ingredient Clustering Benchmark
+
+Times near-duplicate clustering on synthetic vocabularies of growing size, with Zipf
+counts and injected plural, spacing and typo variants, and scores the merges against
+the injected ones. On a small vocabulary, the trigram index's typo links are checked
+against comparing every pair, and both are timed. The clusterer's known words come from
+the base vocabulary, as from an earlier top ingredients CSV. Last, the shipped USA
+frequencies are clustered with the shipped lexicon and checked against pairs of
+different real ingredients one edit apart, and known misspellings.
+"""
+
+import json
+import random
+import time
+import argparse
+import logging
+from typing import Dict, List, Set, Tuple
+
+from english_filter import DEFAULT_FREQUENCIES_FILE, build_lexicon, read_frequencies
+from ingredient_clusters import VariantClusterer, canonical_key, max_distance, within_distance
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+# English letter frequencies (percent), so made-up words share trigrams like real ones
+LETTER_WEIGHTS = (8.2, 1.5, 2.8, 4.3, 12.7, 2.2, 2.0, 6.1, 7.0, 0.2, 0.8, 4.0, 2.4,
+                  6.7, 7.5, 1.9, 0.1, 6.0, 6.3, 9.1, 2.8, 1.0, 2.4, 0.2, 2.0, 0.1)
+
+# Different ingredients one edit (or a plural) apart in US products, which must not merge
+DIFFERENT_INGREDIENTS = (
+    ('lactase', 'lactose'), ('maltase', 'maltose'), ('lectin', 'pectin'), ('greens', 'green'),
+    ('sodium nitrate', 'sodium citrate'), ('sulfite', 'sulfate'), ('chlorine', 'chloride'),
+    ('salted', 'malted'), ('greek', 'green'), ('wafer', 'water'), ('custard', 'mustard'),
+    ('safflower oil', 'sunflower oil'), ('vitamin e', 'vitamin b'), ('range', 'orange'), ('while', 'whole')
+)
+
+# Misspellings in the same data, which should merge
+MISSPELLINGS = (
+    ('carragenan', 'carrageenan'), ('perservative', 'preservative'), ('emulisifier', 'emulsifier'),
+    ('worchestershire', 'worcestershire'), ('maltodextrain', 'maltodextrin'), ('hydrocholoride', 'hydrochloride')
+)
+
+def letter_vocabulary(size: int, rng: random.Random) -> List[str]:
+    """Distinct made-up ingredients of 4 to 10 weighted random letters, some two words long.
+
+    synthetic_off's syllable words are too alike for this: many of them are one edit
+    from another, which real ingredient vocabularies aren't.
+    """
+    vocabulary = []
+    seen = set()
+    while len(vocabulary) < size:
+        words = 2 if rng.random() < 0.3 else 1
+        name = ' '.join(''.join(rng.choices(LETTERS, weights=LETTER_WEIGHTS, k=rng.randint(4, 10))) for _ in range(words))
+        if name not in seen:
+            seen.add(name)
+            vocabulary.append(name)
+    return vocabulary
+
+def typo(name: str, rng: random.Random) -> str:
+    """name with one letter substituted, deleted or inserted."""
+    position = rng.randrange(len(name))
+    kind = rng.random()
+    if kind < 0.4:
+        return name[:position] + rng.choice(LETTERS) + name[position + 1:]
+    if kind < 0.7:
+        return name[:position] + name[position + 1:]
+    return name[:position] + rng.choice(LETTERS) + name[position:]
+
+def synthetic_counts(size: int, variant_rate: float, seed: int) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """Zipf counts of a vocabulary of size base ingredients plus injected variants.
+
+    Returns (counts, {variant: base}). Typos only go to ingredients counted at least
+    20 times and get a twentieth of their count, as a misspelling would.
+    """
+    rng = random.Random(seed)
+    bases = letter_vocabulary(size, rng)
+    counts = {name: max(1, int(100000 / rank ** 1.1)) for rank, name in enumerate(bases, 1)}
+    truth: Dict[str, str] = {}
+    for base in rng.sample(bases, int(size * variant_rate)):
+        roll = rng.random()
+        if roll < 0.4:
+            variant = base + 's'
+        elif roll < 0.6 and ' ' in base:
+            variant = base.replace(' ', '', 1)
+        elif counts[base] >= 20 and len(base) >= 5:
+            variant = typo(base, rng)
+        else:
+            continue
+        if variant in counts or variant in truth or ' ' in (variant[0], variant[-1]):
+            continue
+        truth[variant] = base
+        counts[variant] = max(1, counts[base] // 20)
+    return counts, truth
+
+def score(mapping: Dict[str, str], truth: Dict[str, str]) -> Dict[str, float]:
+    """Precision of the merges and recall of the injected variants."""
+    def origin(name: str) -> str:
+        return truth.get(name, name)
+    correct = sum(1 for variant, canonical in mapping.items() if origin(variant) == origin(canonical))
+    found = sum(1 for variant, base in truth.items() if origin(mapping.get(variant, variant)) == base)
+    return {
+        'precision': round(correct / len(mapping), 4) if mapping else None,
+        'recall': round(found / len(truth), 4) if truth else None
+    }
+
+def known_words(counts: Dict[str, int], truth: Dict[str, str], min_count: int) -> frozenset:
+    """Lexicon of the base ingredients counted at least min_count times, as an earlier CSV would give."""
+    if min_count <= 0:
+        return frozenset()
+    return build_lexicon({name: count for name, count in counts.items() if name not in truth}, min_count)
+
+def naive_typo_links(names: List[str], counts: Dict[str, int], clusterer: VariantClusterer) -> Set[Tuple[str, str]]:
+    """The clusterer's typo links, found by comparing every pair of names."""
+    candidates = [name for name in names if len(name) >= clusterer.min_typo_length]
+    links = set()
+    for name in candidates:
+        if clusterer.is_known(name):
+            continue
+        matches = [other for other in candidates
+                   if counts[other] >= counts[name] * clusterer.typo_ratio
+                   and within_distance(name, other, max_distance(min(len(name), len(other))))
+                   and clusterer.may_be_typo(name, other)]
+        if matches:
+            links.add((name, min(matches, key=lambda other: canonical_key(other, counts[other]))))
+    return links
+
+def run_size(size: int, variant_rate: float, seed: int, known_min_count: int) -> dict:
+    """Cluster one synthetic vocabulary and log its timing and accuracy."""
+    counts, truth = synthetic_counts(size, variant_rate, seed)
+    clusterer = VariantClusterer(known_words=known_words(counts, truth, known_min_count))
+    start = time.perf_counter()
+    mapping = clusterer.cluster(counts)
+    elapsed = time.perf_counter() - start
+    result = {
+        'ingredients': len(counts),
+        'injected_variants': len(truth),
+        'seconds': round(elapsed, 3),
+        'ingredients_per_sec': round(len(counts) / elapsed) if elapsed else None,
+        'pairs_checked': clusterer.stats['pairs_checked'],
+        'all_pairs': len(counts) * (len(counts) - 1) // 2,
+        'typo_links': clusterer.stats['typo_links'],
+        'merged_variants': len(mapping),
+        **score(mapping, truth)
+    }
+    logger.info(json.dumps(result))
+    return result
+
+def compare_naive(size: int, variant_rate: float, seed: int) -> dict:
+    """Check the trigram index finds exactly the typo links of the all-pairs scan, timing both."""
+    counts, truth = synthetic_counts(size, variant_rate, seed)
+    names = list(counts)
+    clusterer = VariantClusterer(known_words=known_words(counts, truth, 1))
+
+    start = time.perf_counter()
+    indexed = {(names[typo], names[canonical]) for typo, canonical in clusterer.typo_links(names, counts)}
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive = naive_typo_links(names, counts, clusterer)
+    naive_time = time.perf_counter() - start
+
+    result = {
+        'ingredients': len(names),
+        'index_seconds': round(indexed_time, 3),
+        'naive_seconds': round(naive_time, 3),
+        'speedup': round(naive_time / indexed_time, 1) if indexed_time else None,
+        'typo_links': len(naive),
+        'identical_links': indexed == naive
+    }
+    logger.info(json.dumps(result))
+    return result
+
+def check_real(frequencies_file: str) -> dict:
+    """Cluster real ingredient frequencies with the shipped lexicon and check the listed pairs."""
+    counts = read_frequencies(frequencies_file)
+    # The listed pairs are scored even when the file lacks them
+    for pairs in (DIFFERENT_INGREDIENTS, MISSPELLINGS):
+        for rare, common in pairs:
+            counts.setdefault(common, 1000)
+            counts.setdefault(rare, 20)
+    clusterer = VariantClusterer()
+    mapping = clusterer.cluster(counts)
+    merged = [f'{rare}->{common}' for rare, common in DIFFERENT_INGREDIENTS
+              if mapping.get(rare, rare) == mapping.get(common, common)]
+    missed = [f'{rare}->{common}' for rare, common in MISSPELLINGS if mapping.get(rare) != mapping.get(common, common)]
+    result = {
+        'ingredients': len(counts),
+        'typo_links': clusterer.stats['typo_links'],
+        'plural_links': clusterer.stats['plural_links'],
+        'different_ingredients_merged': merged,
+        'misspellings_missed': missed
+    }
+    logger.info(json.dumps(result))
+    return result
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark near-duplicate ingredient clustering')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000, 200000],
+                       help='Base vocabulary sizes to cluster (default: 10000 50000 100000 200000)')
+    parser.add_argument('--variant-rate', type=float, default=0.05,
+                       help='Share of base ingredients given an injected variant (default: 0.05)')
+    parser.add_argument('--naive-size', type=int, default=3000,
+                       help='Vocabulary size for the all-pairs comparison, 0 to skip it (default: 3000)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Seed for the synthetic vocabularies (default: 42)')
+    parser.add_argument('--known-min-count', type=int, default=1,
+                       help='Count a base ingredient needs for its words to be known, 0 for no known words (default: 1)')
+    parser.add_argument('--frequencies', default=DEFAULT_FREQUENCIES_FILE,
+                       help='Real extractor CSV output to check the listed pairs on (default: data/top_10000_usa_ingredients.csv)')
+
+    args = parser.parse_args()
+
+    if args.naive_size:
+        compare_naive(args.naive_size, args.variant_rate, args.seed)
+    for size in args.sizes:
+        run_size(size, args.variant_rate, args.seed, args.known_min_count)
+    check_real(args.frequencies)
+
+if __name__ == "__main__":
+    main()
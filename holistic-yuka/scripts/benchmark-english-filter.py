@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+English Filter Benchmark
+
+Compares the scraper's old per-character is_english_word heuristic with the lexicon
+filter on speed and accuracy. English examples are the ingredients of
+top_10000_usa_ingredients.csv, split in two: the lexicon is rebuilt from one half and
+scored on the other, so its words aren't tested against themselves. Foreign examples
+are ingredient lists in the other languages OFF labels carry. Speed is measured on
+the token stream of a synthetic dump.
+"""
+
+import json
+import os
+import tempfile
+import time
+import argparse
+import logging
+from typing import Callable, Dict, List, Set
+
+from english_filter import DEFAULT_FREQUENCIES_FILE, EnglishFilter, build_lexicon, read_frequencies
+from ingredient_tokenizer import tokenize_with_parentheses
+from tsv_reader import read_columns
+from synthetic_off import write_synthetic_tsv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FOREIGN_TEXTS = (
+    "Fromage frais 93% (lait de vache pasteurisé (origine : France), ferments (lait)), extrait de vanille",
+    "Farine de blé, sucre, huile de palme, beurre concentré, sel, poudre à lever (carbonates de sodium)",
+    "Eau, tomates pelées, oignons, huile d'olive vierge extra, sel, basilic, ail, poivre",
+    "Lait entier, crème, sucre, jaunes d'œufs, arôme naturel de vanille, épaississant : farine de graines de caroube",
+    "Pâte de cacao, sucre, beurre de cacao, émulsifiant : lécithine de soja, arôme naturel",
+    "Sirop de glucose-fructose, amidon de maïs, gélifiant : pectine, acidifiant : acide citrique, colorant",
+    "Viande de porc, sel, dextrose, épices, conservateur : nitrite de sodium, ferments",
+    "pasteurisierte Kuhmilch, Milchsäurebakterien",
+    "Weizenmehl, Zucker, pflanzliche Fette (Palm, Raps), Vollmilchpulver, Salz, Backtriebmittel: Natriumcarbonate",
+    "Wasser, Gerstenmalz, Hopfen, Hefe",
+    "Schweinefleisch, Speck, Nitritpökelsalz, Gewürze, Dextrose, Zucker, Antioxidationsmittel: Ascorbinsäure",
+    "Vollmilchschokolade (Zucker, Kakaobutter, Vollmilchpulver, Kakaomasse, Emulgator: Lecithine), Haselnüsse",
+    "Sonnenblumenöl, Wasser, Eigelb, Branntweinessig, Zucker, Salz, Senfsaat, Gewürze",
+    "Harina de trigo, azúcar, aceite de girasol, huevo, sal, gasificantes, aroma",
+    "Leche entera, azúcar, cacao desgrasado en polvo, estabilizantes, sal, aroma de vainilla",
+    "Agua, garbanzos cocidos, aceite de oliva virgen extra, zumo de limón, ajo, sal",
+    "Tomate, cebolla, pimiento verde, aceite de oliva, azúcar, sal, ajo",
+    "Farina di grano tenero, zucchero, olio di girasole, uova fresche, sale, agenti lievitanti",
+    "Semola di grano duro, acqua",
+    "Pomodoro, olio extravergine di oliva, cipolla, basilico, sale, aglio, pepe nero",
+    "Latte pastorizzato, sale, caglio, fermenti lattici",
+    "Tarwebloem, suiker, plantaardige olie (palm, koolzaad), zout, gist",
+    "Melk, room, suiker, vanille-extract, emulgator (sojalecithine)",
+    "Varkensvlees, zout, specerijen, dextrose, conserveermiddel (natriumnitriet)"
+)
+
+ENGLISH_TEXTS_WITH_ACCENTS = (
+    "Cream, whole milk, crème fraîche (cultured cream), salt, natural flavor",
+    "Tomatoes, water, jalapeño peppers, onions, salt, vinegar, garlic, spices",
+    "Potato purée (potatoes, butter, milk), sautéed onions, sea salt, black pepper",
+    "Organic rolled oats, organic cane sugar, organic crème de cacao flavor, sea salt, cinnamon"
+)
+
+def legacy_is_english_word(word: str) -> bool:
+    """CleanIngredientsExtractor.is_english_word before the lexicon filter."""
+    if not word.isalpha():
+        return False
+    if len(word) < 2:
+        return False
+    if word.isupper() and len(word) <= 4:
+        return False
+    consonants_in_row = 0
+    for char in word.lower():
+        if char not in 'aeiou':
+            consonants_in_row += 1
+            if consonants_in_row > 4:
+                return False
+        else:
+            consonants_in_row = 0
+    return True
+
+def legacy_filter_tokens(tokens: List[str]) -> List[str]:
+    """Tokens whose every word passes the old heuristic (it rejects any string with a space)."""
+    return [token for token in tokens if all(legacy_is_english_word(word) for word in token.split())]
+
+def legacy_is_english_text(text: str) -> bool:
+    """The old heuristic has no text-level check."""
+    return True
+
+def scores(name: str, keep: Callable[[List[str]], List[str]], is_text: Callable[[str], bool],
+           english: List[str], foreign: List[str], english_texts: List[str]) -> Dict[str, object]:
+    """Token and text accuracy of one filter."""
+    kept_english = len(keep(english))
+    # Foreign tokens reach the token filter only from texts that pass the text check
+    foreign_passing = [token for text in FOREIGN_TEXTS if is_text(text)
+                       for token in tokenize_with_parentheses(text) if token in foreign]
+    kept_foreign = len(keep(foreign_passing))
+    return {
+        'filter': name,
+        'english_token_recall': round(kept_english / len(english), 4),
+        'foreign_token_rejection': round(1 - kept_foreign / sum(1 for text in FOREIGN_TEXTS
+                                                                for token in tokenize_with_parentheses(text) if token in foreign), 4),
+        'token_precision': round(kept_english / (kept_english + kept_foreign), 4) if kept_english + kept_foreign else None,
+        'foreign_texts_rejected': sum(1 for text in FOREIGN_TEXTS if not is_text(text)),
+        'english_texts_rejected': sum(1 for text in english_texts if not is_text(text)),
+        'texts': f'{len(FOREIGN_TEXTS)} foreign, {len(english_texts)} english'
+    }
+
+def throughput(name: str, keep: Callable[[List[str]], List[str]], batches: List[List[str]]) -> Dict[str, object]:
+    """Tokens per second of one filter over batches of tokens."""
+    total = sum(map(len, batches))
+    start = time.perf_counter()
+    kept = sum(len(keep(batch)) for batch in batches)
+    elapsed = time.perf_counter() - start
+    return {'filter': name, 'tokens': total, 'kept': kept, 'seconds': round(elapsed, 3),
+            'tokens_per_sec': round(total / elapsed) if elapsed else None}
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the lexicon English filter against the old heuristic')
+    parser.add_argument('--frequencies', default=DEFAULT_FREQUENCIES_FILE,
+                       help='Extractor CSV output for the English examples (default: data/top_10000_usa_ingredients.csv)')
+    parser.add_argument('--rows', type=int, default=50000,
+                       help='Rows of the synthetic dump timed (default: 50000)')
+
+    args = parser.parse_args()
+
+    frequencies = read_frequencies(args.frequencies)
+    items = sorted(frequencies.items(), key=lambda item: -item[1])
+    train = dict(items[0::2])
+    test = [ingredient for ingredient, _ in items[1::2]]
+    test_texts = [', '.join(test[start:start + 12]) for start in range(0, 600, 12)] + list(ENGLISH_TEXTS_WITH_ACCENTS)
+    english = set(test) | set(frequencies)
+    foreign: Set[str] = {token for text in FOREIGN_TEXTS for token in tokenize_with_parentheses(text)} - english
+
+    held_out = EnglishFilter(build_lexicon(train))
+    shipped = EnglishFilter()
+    strict = EnglishFilter(build_lexicon(train), accept_unknown=False)
+    for name, keep, is_text in (('legacy_heuristic', legacy_filter_tokens, legacy_is_english_text),
+                                ('lexicon_held_out', held_out.filter_tokens, held_out.is_english_text),
+                                ('lexicon_held_out_strict', strict.filter_tokens, strict.is_english_text),
+                                ('lexicon_shipped', shipped.filter_tokens, shipped.is_english_text)):
+        logger.info(json.dumps(scores(name, keep, is_text, test, sorted(foreign), test_texts)))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        tsv = os.path.join(workdir, 'synthetic.tsv')
+        write_synthetic_tsv(tsv, args.rows)
+        batches = [tokenize_with_parentheses(en or text)
+                   for en, text in read_columns(tsv, ('ingredients_text_en', 'ingredients_text')) if en or text]
+
+    logger.info(json.dumps(throughput('legacy_heuristic', legacy_filter_tokens, batches)))
+    cold = EnglishFilter()
+    logger.info(json.dumps(throughput('lexicon_first_pass', cold.filter_tokens, batches)))
+    logger.info(json.dumps(throughput('lexicon_memoized', cold.filter_tokens, batches)))
+
+if __name__ == "__main__":
+    main()
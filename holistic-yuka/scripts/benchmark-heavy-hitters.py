@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Approximate Top-K Benchmark
+
+Compares exact Counter counting against the bounded-memory Space-Saving summary on the
+same ingredient stream, reporting throughput, peak memory and top-K accuracy.
+"""
+
+import csv
+import json
+import random
+import time
+import tracemalloc
+import argparse
+import logging
+from collections import Counter
+from typing import Callable, List
+
+from heavy_hitters import SpaceSaving
+from ingredient_tokenizer import tokenize_with_parentheses
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def load_ingredients_from_tsv(filename: str, max_rows: int) -> List[str]:
+    """Tokenize the ingredients texts of an OpenFoodFacts TSV file into one ingredient stream."""
+    ingredients = []
+    with open(filename, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file, delimiter='\t')
+        for row_num, row in enumerate(reader, 1):
+            if row_num > max_rows:
+                break
+            text = row.get('ingredients_text_en', '') or row.get('ingredients_text', '')
+            ingredients.extend(tokenize_with_parentheses(text))
+    return ingredients
+
+def synthetic_ingredients(count: int, vocabulary: int, exponent: float, seed: int) -> List[str]:
+    """Zipf-distributed ingredient stream, the long-tailed shape of real ingredient frequencies."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** exponent) for rank in range(1, vocabulary + 1)]
+    names = [f"ingredient {rank}" for rank in range(1, vocabulary + 1)]
+    return rng.choices(names, weights=weights, k=count)
+
+def measure(build: Callable[[], object], ingredients: List[str]) -> tuple:
+    """Count the stream with a fresh counter, returning (counter, seconds, peak bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    counter = build()
+    counter.update(ingredients)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return counter, elapsed, peak
+
+def run_benchmark(ingredients: List[str], top: int, capacities: List[int]) -> List[dict]:
+    """Benchmark exact counting and Space-Saving at each capacity."""
+    exact, exact_time, exact_peak = measure(Counter, ingredients)
+    exact_top = exact.most_common(top)
+    exact_items = {item for item, _ in exact_top}
+
+    baseline = {
+        'counter': 'exact',
+        'ingredients': len(ingredients),
+        'distinct': len(exact),
+        'ingredients_per_sec': round(len(ingredients) / exact_time) if exact_time else None,
+        'peak_mb': round(exact_peak / 1024 / 1024, 2)
+    }
+    logger.info(json.dumps(baseline))
+    results = [baseline]
+
+    for capacity in capacities:
+        summary, summary_time, summary_peak = measure(lambda: SpaceSaving(capacity), ingredients)
+        approximate_top = summary.most_common(top)
+        found = sum(1 for item, _ in approximate_top if item in exact_items)
+        relative_errors = [abs(count - exact[item]) / exact[item] for item, count in approximate_top if exact[item]]
+
+        result = {
+            'counter': 'space_saving',
+            'capacity': capacity,
+            'ingredients_per_sec': round(len(ingredients) / summary_time) if summary_time else None,
+            'peak_mb': round(summary_peak / 1024 / 1024, 2),
+            'recall_at_top': round(found / len(exact_top), 4) if exact_top else None,
+            'guaranteed_in_top': len(summary.guaranteed_top(top)),
+            'max_relative_error': round(max(relative_errors, default=0), 4),
+            'max_error': summary.error_bounds()['max_error']
+        }
+        logger.info(json.dumps(result))
+        results.append(result)
+
+    return results
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark approximate top-K ingredient counting')
+    parser.add_argument('--tsv', help='OpenFoodFacts TSV file to take ingredients from (default: synthetic stream)')
+    parser.add_argument('--max-rows', type=int, default=100000,
+                       help='Maximum TSV rows to load (default: 100000)')
+    parser.add_argument('--synthetic-count', type=int, default=2000000,
+                       help='Ingredients in the synthetic stream (default: 2000000)')
+    parser.add_argument('--synthetic-vocabulary', type=int, default=500000,
+                       help='Distinct ingredients in the synthetic stream (default: 500000)')
+    parser.add_argument('--top', type=int, default=1000,
+                       help='Top-K size to score (default: 1000)')
+    parser.add_argument('--capacities', type=int, nargs='+', default=[2000, 5000, 20000],
+                       help='Space-Saving capacities to try (default: 2000 5000 20000)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Seed for the synthetic stream (default: 42)')
+
+    args = parser.parse_args()
+
+    if args.tsv:
+        ingredients = load_ingredients_from_tsv(args.tsv, args.max_rows)
+    else:
+        ingredients = synthetic_ingredients(args.synthetic_count, args.synthetic_vocabulary, 1.1, args.seed)
+
+    if not ingredients:
+        logger.error("No ingredients found")
+        return
+
+    run_benchmark(ingredients, args.top, args.capacities)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Input Format Throughput Benchmark
+
+Writes a TSV dump as .gz, .bz2, .xz and .zst copies plus JSONL and Parquet exports of
+its product columns, then times reading the extractor's columns from each against the
+uncompressed TSV. The .zst JSONL copy is written and read back through ndjson_io, so
+the streaming codec is checked both ways.
+"""
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import time
+import argparse
+import logging
+from typing import Callable, List, Optional
+
+from ndjson_io import NDJSONWriter, iter_ndjson
+from product_sources import read_products
+from tsv_reader import read_columns
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('code', 'countries_en', 'ingredients_text_en', 'ingredients_text')
+
+def compress_copy(source: str, target: str, opener: Callable) -> None:
+    """Write a compressed copy of source."""
+    with open(source, 'rb') as src, opener(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+def zstd_copy(source: str, target: str) -> Optional[str]:
+    """Write a .zst copy of source, or return None when zstandard isn't installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+    return target
+
+def write_jsonl(source: str, target: str) -> None:
+    """Export the product columns of a TSV as line-delimited JSON."""
+    with open(target, 'w', encoding='utf-8') as f:
+        for row in read_columns(source, COLUMNS):
+            f.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False))
+            f.write('\n')
+
+def zstd_round_trip(source: str, target: str) -> Optional[str]:
+    """Copy a JSONL file to .zst with NDJSONWriter and check iter_ndjson reads it back unchanged,
+    or return None when zstandard isn't installed."""
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return None
+    with NDJSONWriter(target) as writer:
+        for record in iter_ndjson(source):
+            writer.write(record)
+    if list(iter_ndjson(target)) != list(iter_ndjson(source)):
+        raise RuntimeError(f"{target} doesn't read back as {source}")
+    return target
+
+def write_parquet(source: str, target: str) -> Optional[str]:
+    """Export the product columns of a TSV as Parquet, or return None when pyarrow isn't installed."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    columns = list(zip(*read_columns(source, COLUMNS)))
+    table = pa.table({name: pa.array(values, pa.string()) for name, values in zip(COLUMNS, columns)})
+    pq.write_table(table, target, compression='zstd')
+    return target
+
+def time_read(filename: str, engine: str, repeat: int) -> tuple:
+    """Return the best wall time over repeat full reads and the row count."""
+    best = float('inf')
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = sum(1 for _ in read_products(filename, COLUMNS, engine=engine))
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+def run_benchmark(tsv: str, workdir: str, engines: List[str], repeat: int) -> List[dict]:
+    """Create every format in workdir and time reading each one."""
+    base = os.path.join(workdir, 'products')
+    plain = base + '.tsv'
+    shutil.copyfile(tsv, plain)
+
+    inputs = [plain]
+    for extension, opener in (('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open)):
+        compress_copy(plain, plain + extension, opener)
+        inputs.append(plain + extension)
+    if zstd_copy(plain, plain + '.zst'):
+        inputs.append(plain + '.zst')
+    else:
+        logger.warning("zstandard is not installed, skipping .zst")
+
+    write_jsonl(plain, base + '.jsonl')
+    compress_copy(base + '.jsonl', base + '.jsonl.gz', gzip.open)
+    inputs += [base + '.jsonl', base + '.jsonl.gz']
+    if zstd_round_trip(base + '.jsonl', base + '.jsonl.zst'):
+        inputs.append(base + '.jsonl.zst')
+    if write_parquet(plain, base + '.parquet'):
+        inputs.append(base + '.parquet')
+    else:
+        logger.warning("pyarrow is not installed, skipping Parquet")
+
+    uncompressed_mb = os.path.getsize(plain) / 1024 / 1024
+    results = []
+    baselines = {}
+    for engine in engines:
+        for filename in inputs:
+            tabular = not filename.endswith(('.jsonl', '.jsonl.gz', '.jsonl.zst', '.parquet'))
+            if not tabular and engine != engines[0]:
+                continue  # JSON and Parquet don't use the TSV engines
+
+            elapsed, rows = time_read(filename, engine, repeat)
+            baselines.setdefault(engine, elapsed)
+            result = {
+                'input': os.path.basename(filename),
+                'engine': engine if tabular else None,
+                'file_mb': round(os.path.getsize(filename) / 1024 / 1024, 1),
+                'rows': rows,
+                'rows_per_sec': round(rows / elapsed) if elapsed else None,
+                'tsv_mb_per_sec': round(uncompressed_mb / elapsed, 1) if elapsed else None,
+                'relative_to_plain': round(baselines[engine] / elapsed, 2) if elapsed else None
+            }
+            logger.info(json.dumps(result))
+            results.append(result)
+    return results
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark reading compressed, JSONL and Parquet inputs')
+    parser.add_argument('--tsv', required=True, help='OpenFoodFacts TSV file to convert and read')
+    parser.add_argument('--engines', nargs='+', default=['projected'],
+                       help='TSV reader engines to time (default: projected)')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timing repetitions, best run is reported (default: 3)')
+    parser.add_argument('--workdir', help='Directory for the converted files (default: a temporary directory)')
+
+    args = parser.parse_args()
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        run_benchmark(args.tsv, args.workdir, args.engines, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            run_benchmark(args.tsv, workdir, args.engines, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Barcode Lookup Server Load Test
+
+Starts product-lookup-server.py on a barcode index (built from a synthetic dump unless
+one is given) or targets a running server, then fires barcode lookups over keep-alive
+connections and reports requests per second and p50/p90/p99 latency. Barcodes are
+drawn with a Zipf skew, as a few popular products make up most scans, plus a share of
+unknown ones. Each cache size is a separate server run, to show what the LRU cache buys.
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import argparse
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from product_lookup import ProductLookup, build_lookup
+from synthetic_off import write_synthetic_tsv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(SCRIPTS_DIR, 'product-lookup-server.py')
+
+# Seconds to wait for a started server to answer /health
+STARTUP_TIMEOUT = 30.0
+
+def sample_barcodes(index_file: str, count: int, miss_rate: float, exponent: float, seed: int) -> List[str]:
+    """count barcodes to look up: indexed codes by a Zipf skew over a shuffled order, and miss_rate unknown ones."""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(index_file)
+    codes = [code for (code,) in connection.execute('SELECT code FROM products')]
+    connection.close()
+    rng.shuffle(codes)
+    weights = [1.0 / (rank ** exponent) for rank in range(1, len(codes) + 1)]
+    barcodes = rng.choices(codes, weights=weights, k=count)
+    for position in range(count):
+        if rng.random() < miss_rate:
+            barcodes[position] = str(rng.randrange(10 ** 12, 10 ** 13) * 10 + 9)
+    return barcodes
+
+def percentiles(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """p50, p90, p99 and max of latencies in milliseconds."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+
+    def percentile(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+    return {
+        'latency_p50_ms': percentile(0.50),
+        'latency_p90_ms': percentile(0.90),
+        'latency_p99_ms': percentile(0.99),
+        'latency_max_ms': round(latencies[-1] * 1000, 3)
+    }
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str) -> Tuple[int, bytes]:
+    """(status, body) of one GET on a keep-alive connection."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode('latin-1'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    length = 0
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return int(status_line.split(' ')[1]), await reader.readexactly(length)
+
+async def load_test(url: str, barcodes: List[str], concurrency: int) -> Dict[str, object]:
+    """Look every barcode up through concurrency connections, each taking the next barcode in turn."""
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    queue = iter(barcodes)
+    latencies: List[float] = []
+    stats = {'found': 0, 'not_found': 0, 'errors': 0}
+
+    async def client() -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for barcode in queue:
+                start = time.perf_counter()
+                try:
+                    status, body = await request(reader, writer, host, f'/api/v0/product/{barcode}.json')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    stats['errors'] += 1
+                    break
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    stats['errors'] += 1
+                elif json.loads(body)['status'] == 1:
+                    stats['found'] += 1
+                else:
+                    stats['not_found'] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed) if elapsed else None,
+        **percentiles(latencies),
+        **stats
+    }
+
+def free_port() -> int:
+    """A port the OS considers free right now."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(index_file: str, cache_size: int) -> Tuple[subprocess.Popen, str]:
+    """Start the lookup server on a free port and wait until it answers. Returns (process, base URL)."""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--index', index_file, '--port', str(port),
+                                '--cache-size', str(cache_size)], stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Lookup server didn't start on port {port}")
+
+def direct_lookups(index_file: str, barcodes: List[str], cache_size: int) -> Dict[str, object]:
+    """Time ProductLookup.get in-process, the floor under the HTTP numbers."""
+    latencies = []
+    with ProductLookup(index_file, cache_size) as lookup:
+        for barcode in barcodes:
+            start = time.perf_counter()
+            lookup.get(barcode)
+            latencies.append(time.perf_counter() - start)
+        hits = lookup.cache.hits
+    return {
+        'mode': 'direct',
+        'cache_size': cache_size,
+        'lookups_per_sec': round(len(latencies) / sum(latencies)) if latencies else None,
+        **percentiles(latencies),
+        'cache_hit_rate': round(hits / len(barcodes), 4) if barcodes else None
+    }
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Load test the barcode lookup server')
+    parser.add_argument('--index',
+                       help='Barcode lookup index to serve and sample barcodes from (default: built from a synthetic dump)')
+    parser.add_argument('--url',
+                       help='Load test this running server instead of starting one; --index is still needed for barcodes')
+    parser.add_argument('--rows', type=int, default=200000,
+                       help='Products in the synthetic dump (default: 200000)')
+    parser.add_argument('--requests', type=int, default=50000,
+                       help='Lookups per run (default: 50000)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                       help='Concurrent keep-alive connections (default: 32)')
+    parser.add_argument('--cache-sizes', type=int, nargs='+', default=[0, 10000],
+                       help='LRU cache sizes to start the server with, one run each (default: 0 10000)')
+    parser.add_argument('--miss-rate', type=float, default=0.05,
+                       help='Share of barcodes that are not in the index (default: 0.05)')
+    parser.add_argument('--zipf', type=float, default=1.0,
+                       help='Zipf exponent of barcode popularity (default: 1.0)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Seed for the barcode sample (default: 42)')
+
+    args = parser.parse_args()
+    if args.url and not args.index:
+        parser.error('--url needs --index to sample barcodes from')
+
+    with tempfile.TemporaryDirectory() as workdir:
+        index_file = args.index
+        if not index_file:
+            tsv = os.path.join(workdir, 'synthetic.tsv')
+            write_synthetic_tsv(tsv, args.rows)
+            index_file = os.path.join(workdir, 'products.lookup.sqlite')
+            start = time.perf_counter()
+            count = build_lookup(index_file, tsv)
+            logger.info(f"Indexed {count} products in {time.perf_counter() - start:.1f}s "
+                        f"({os.path.getsize(index_file) / 1024 / 1024:.1f} MB)")
+
+        barcodes = sample_barcodes(index_file, args.requests, args.miss_rate, args.zipf, args.seed)
+
+        if args.url:
+            result = asyncio.run(load_test(args.url, barcodes, args.concurrency))
+            logger.info(json.dumps({'mode': 'http', 'url': args.url, **result}))
+            return
+
+        for cache_size in args.cache_sizes:
+            logger.info(json.dumps(direct_lookups(index_file, barcodes, cache_size)))
+            process, url = start_server(index_file, cache_size)
+            try:
+                result = asyncio.run(load_test(url, barcodes, args.concurrency))
+            finally:
+                process.terminate()
+                process.wait()
+            logger.info(json.dumps({'mode': 'http', 'cache_size': cache_size, **result}))
+
+if __name__ == "__main__":
+    main()
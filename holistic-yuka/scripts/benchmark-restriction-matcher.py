@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Restriction Matcher Benchmark
+
+Times the allergen and diet matcher over the ingredient texts of a dump: a naive scan
+with one regular expression per term, the combined regex one text at a time and in
+batches, and the Aho-Corasick automaton when pyahocorasick is installed. Every engine's
+flags are checked against the naive scan, and against hand-written cases of safe
+phrases, negations and overlapping terms.
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+import argparse
+import logging
+from typing import Iterable, List, Optional, Set
+
+from restriction_matcher import (DEFAULT_BATCH_SIZE, DEFAULT_RESTRICTIONS_FILE, PLURAL_SUFFIXES,
+                                 RestrictionMatcher, drop_contained, load_restrictions, normalize_text)
+from product_sources import read_products
+from synthetic_off import write_synthetic_tsv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# (ingredients text, labels it must flag, labels it must not flag)
+CASES = (
+    ('Cocoa butter, sugar', ('Keto',), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('shea butter', (), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('coconut milk, water, guar gum', (), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('oat milk (water, oats)', ('en:gluten', 'Gluten Free'), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('almond milk', ('en:nuts',), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('peanut butter', ('en:peanuts',), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('cream of tartar', (), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('butter beans', ('Keto',), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('gluten-free oats', ('Keto',), ('en:gluten', 'Gluten Free')),
+    ('gluten free rolled oats', (), ('Gluten Free',)),
+    ('no milk', (), ('en:milk', 'Dairy Free', 'Vegan')),
+    ('dairy-free cheese', ('Vegan',), ('en:milk', 'Dairy Free')),
+    ('sugar-free syrup', (), ('Keto',)),
+    ('lactose-free milk', ('en:milk', 'Dairy Free', 'Vegan'), ()),
+    ('whole milk, free range eggs', ('en:milk', 'Dairy Free', 'en:eggs', 'Vegan'), ()),
+    ('butter, salt', ('en:milk', 'Dairy Free', 'Vegan'), ()),
+    ('wheat flour, peanut butter (peanuts, salt), milk chocolate', ('en:gluten', 'en:peanuts', 'en:milk', 'Dairy Free'), ())
+)
+
+def load_texts(filename: str, max_rows: Optional[int]) -> List[str]:
+    """Ingredients texts of a dump or export, English first as the scripts read them."""
+    texts = []
+    for en, text in read_products(filename, ('ingredients_text_en', 'ingredients_text')):
+        if en or text:
+            texts.append(en or text)
+            if max_rows and len(texts) >= max_rows:
+                break
+    return texts
+
+def naive_labels(matcher: RestrictionMatcher, texts: List[str]) -> List[Set[str]]:
+    """Labels of each text found by searching for every term variant separately."""
+    plural = '|'.join(PLURAL_SUFFIXES)
+    patterns = [(re.compile(rf'\b{re.escape(variant)}(?:{plural})?\b'), canonical)
+                for variant, canonical in matcher.variants.items()]
+    results = []
+    for text in texts:
+        normalized = normalize_text(text)
+        matches = [(match.start(), match.end(), canonical)
+                   for pattern, canonical in patterns for match in pattern.finditer(normalized)]
+        matches.sort(key=lambda match: (match[0], -match[1]))
+        results.append(set(matcher.labels_of(normalized, drop_contained(matches))))
+    return results
+
+def matcher_labels(matcher: RestrictionMatcher, texts: List[str], batch_size: int) -> List[Set[str]]:
+    """Labels of each text found by the compiled matcher, batch_size texts per scan."""
+    results = []
+    for start in range(0, len(texts), batch_size):
+        results.extend(set(matches) for matches in matcher.match_batch(texts[start:start + batch_size]))
+    return results
+
+def run_engine(name: str, run, texts: List[str], reference: Optional[List[Set[str]]]) -> List[Set[str]]:
+    """Time one engine, log its throughput and disagreements with the reference labels, and return its labels."""
+    start = time.perf_counter()
+    labels = run(texts)
+    elapsed = time.perf_counter() - start
+    result = {
+        'engine': name,
+        'texts': len(texts),
+        'seconds': round(elapsed, 3),
+        'texts_per_sec': round(len(texts) / elapsed) if elapsed else None,
+        'flagged': sum(1 for text_labels in labels if text_labels)
+    }
+    if reference is not None:
+        result['mismatches'] = sum(1 for ours, theirs in zip(labels, reference) if ours != theirs)
+    logger.info(json.dumps(result))
+    return labels
+
+def check_cases(name: str, matcher: RestrictionMatcher, cases: Iterable[tuple] = CASES) -> List[str]:
+    """Log and return the cases whose flags miss a required label or carry a forbidden one."""
+    failed = []
+    for text, required, forbidden in cases:
+        labels = set(matcher.match(text))
+        if not labels.issuperset(required) or labels.intersection(forbidden):
+            failed.append(f'{text}: {sorted(labels)}')
+    logger.info(json.dumps({'engine': name, 'cases': len(CASES), 'failed': failed}))
+    return failed
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the allergen and diet restriction matcher')
+    parser.add_argument('-i', '--input',
+                       help='TSV dump or JSONL/Parquet export to take ingredients texts from (default: synthetic dump)')
+    parser.add_argument('--rows', type=int, default=100000,
+                       help='Rows of the synthetic dump (default: 100000)')
+    parser.add_argument('--max-rows', type=int,
+                       help='Maximum ingredients texts to load from --input (default: all)')
+    parser.add_argument('--naive-rows', type=int, default=20000,
+                       help='Texts the slow naive scan and the agreement check cover, 0 to skip it (default: 20000)')
+    parser.add_argument('--restrictions', default=DEFAULT_RESTRICTIONS_FILE,
+                       help='Diet restriction list JSON (default: data/restriction_list.json)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Texts per scan for the batched engines (default: {DEFAULT_BATCH_SIZE})')
+
+    args = parser.parse_args()
+
+    if args.input:
+        texts = load_texts(args.input, args.max_rows)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            tsv = os.path.join(workdir, 'synthetic.tsv')
+            write_synthetic_tsv(tsv, args.rows)
+            texts = load_texts(tsv, args.max_rows)
+    if not texts:
+        logger.error("No ingredients texts found")
+        return
+
+    restrictions = load_restrictions(args.restrictions)
+    start = time.perf_counter()
+    matcher = RestrictionMatcher(restrictions)
+    logger.info(f"Compiled {len(matcher.variants)} term variants in {time.perf_counter() - start:.3f}s, "
+                f"{len(texts)} texts to scan")
+
+    sample = texts[:args.naive_rows]
+    reference = None
+    if sample:
+        reference = run_engine('naive', lambda batch: naive_labels(matcher, batch), sample, None)
+        run_engine('regex_single', lambda batch: matcher_labels(matcher, batch, 1), sample, reference)
+
+    engines = {'regex': matcher}
+    automaton = RestrictionMatcher(restrictions, engine='aho-corasick')
+    if automaton.engine == 'aho-corasick':
+        engines['aho-corasick'] = automaton
+
+    for name, engine in engines.items():
+        check_cases(name, engine)
+        if reference is not None:
+            run_engine(f'{name}_batched', lambda batch: matcher_labels(engine, batch, args.batch_size), sample, reference)
+        run_engine(f'{name}_batched_all', lambda batch: matcher_labels(engine, batch, args.batch_size), texts, None)
+
+if __name__ == "__main__":
+    main()
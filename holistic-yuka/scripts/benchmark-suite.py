@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Ingredient Pipeline Benchmark Suite
+
+Times the main steps of the TSV extractor and the scraper on a deterministic synthetic
+OFF dump and on random_products.json. Each case runs in a fresh process so its peak RSS
+is its own. Results are saved as JSON and can be compared with the results of another
+commit.
+"""
+
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import argparse
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Tuple
+
+from synthetic_off import write_synthetic_tsv
+from tsv_reader import read_columns
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PRODUCTS_FILE = os.path.join(SCRIPTS_DIR, '..', 'random_products.json')
+DEFAULT_RESULTS_FILE = 'benchmark_results.json'
+
+def load_script(filename: str, module_name: str):
+    """Import one of the hyphenated scripts as a module, with its logging quietened."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    logging.getLogger(module_name).setLevel(logging.WARNING)
+    return module
+
+def load_texts(config: Dict[str, Any]) -> List[str]:
+    """Ingredients texts of the synthetic dump followed by those of the products file."""
+    texts = [en or text for en, text in read_columns(config['tsv'], ('ingredients_text_en', 'ingredients_text')) if en or text]
+    if os.path.exists(config['products_json']):
+        with open(config['products_json'], 'r', encoding='utf-8') as f:
+            for product in json.load(f):
+                text = product.get('ingredients_text_en') or product.get('ingredients_text')
+                if text:
+                    texts.append(text)
+    return texts
+
+def case_tokenize_with_parentheses(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """TSVIngredientsExtractor.extract_ingredients_with_parentheses over every text."""
+    extractor = load_script('tsv-ingredient-extractor.py', 'tsv_ingredient_extractor').TSVIngredientsExtractor()
+    texts = load_texts(config)
+
+    def run() -> Tuple[int, int]:
+        return len(texts), sum(len(extractor.extract_ingredients_with_parentheses(text)) for text in texts)
+    return run
+
+def case_scraper_extract_ingredients(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """CleanIngredientsExtractor.extract_ingredients over every text."""
+    extractor = load_script('ingredient-scraping-script.py', 'ingredient_scraping_script').CleanIngredientsExtractor()
+    texts = load_texts(config)
+
+    def run() -> Tuple[int, int]:
+        return len(texts), sum(len(extractor.extract_ingredients(text)) for text in texts)
+    return run
+
+def case_process_tsv_file(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """A full TSVIngredientsExtractor.process_tsv_file run over the synthetic dump."""
+    module = load_script('tsv-ingredient-extractor.py', 'tsv_ingredient_extractor')
+
+    def run() -> Tuple[int, int]:
+        extractor = module.TSVIngredientsExtractor()
+        extractor.process_tsv_file(config['tsv'], reader=config['reader'])
+        return config['rows'], sum(extractor.ingredient_counts.values())
+    return run
+
+def case_process_tsv_file_vectorized(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """process_tsv_file over the synthetic dump with the vectorized pyarrow engine."""
+    module = load_script('tsv-ingredient-extractor.py', 'tsv_ingredient_extractor')
+
+    def run() -> Tuple[int, int]:
+        extractor = module.TSVIngredientsExtractor()
+        extractor.process_tsv_file(config['tsv'], reader=module.VECTORIZED_READER)
+        return config['rows'], sum(extractor.ingredient_counts.values())
+    return run
+
+def counted_extractor(config: Dict[str, Any]):
+    """An extractor that has already counted the synthetic dump."""
+    extractor = load_script('tsv-ingredient-extractor.py', 'tsv_ingredient_extractor').TSVIngredientsExtractor()
+    extractor.process_tsv_file(config['tsv'])
+    return extractor
+
+def case_filter_common_words(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """TSVIngredientsExtractor.filter_common_words on the counts of the synthetic dump."""
+    extractor = counted_extractor(config)
+    counts = extractor.ingredient_counts
+
+    def run() -> Tuple[int, int]:
+        extractor.ingredient_counts = Counter(counts)
+        extractor.filter_common_words()
+        return len(counts), sum(counts.values())
+    return run
+
+def case_save_outputs(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """TSVIngredientsExtractor.save_to_csv and save_to_txt of the top ingredients."""
+    extractor = counted_extractor(config)
+    counts = extractor.ingredient_counts
+
+    def run() -> Tuple[int, int]:
+        extractor.ingredient_counts = Counter(counts)
+        extractor.save_to_csv(os.path.join(config['workdir'], 'top.csv'), config['top'])
+        extractor.save_to_txt(os.path.join(config['workdir'], 'top.txt'), config['top'])
+        rows = min(config['top'], len(extractor.ingredient_counts))
+        return 2 * rows, 2 * rows
+    return run
+
+def case_scraper_save_outputs(config: Dict[str, Any]) -> Callable[[], Tuple[int, int]]:
+    """CleanIngredientsExtractor.save_to_csv and save_to_txt of every unique ingredient."""
+    extractor = load_script('ingredient-scraping-script.py', 'ingredient_scraping_script').CleanIngredientsExtractor()
+    ingredients = {ingredient for text in load_texts(config) for ingredient in extractor.extract_ingredients(text)}
+
+    def run() -> Tuple[int, int]:
+        extractor.unique_ingredients = set(ingredients)
+        extractor.save_to_csv(os.path.join(config['workdir'], 'clean.csv'))
+        extractor.save_to_txt(os.path.join(config['workdir'], 'clean.txt'))
+        return 2 * len(extractor.unique_ingredients), 2 * len(extractor.unique_ingredients)
+    return run
+
+# Each case sets up its inputs and returns a callable timing one run, returning (rows, ingredients)
+CASES = {
+    'tokenize_with_parentheses': case_tokenize_with_parentheses,
+    'scraper_extract_ingredients': case_scraper_extract_ingredients,
+    'process_tsv_file': case_process_tsv_file,
+    'process_tsv_file_vectorized': case_process_tsv_file_vectorized,
+    'filter_common_words': case_filter_common_words,
+    'save_outputs': case_save_outputs,
+    'scraper_save_outputs': case_scraper_save_outputs,
+}
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_case(name: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Set up and time one case in the current (fresh) process; the best of config['repeat'] runs is kept."""
+    logging.getLogger().setLevel(logging.WARNING)
+    run = CASES[name](config)
+    best = float('inf')
+    rows = ingredients = 0
+    for _ in range(config['repeat']):
+        start = time.perf_counter()
+        rows, ingredients = run()
+        best = min(best, time.perf_counter() - start)
+
+    return {
+        'seconds': round(best, 4),
+        'rows': rows,
+        'ingredients': ingredients,
+        'rows_per_sec': round(rows / best) if best else None,
+        'ingredients_per_sec': round(ingredients / best) if best else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def git_commit() -> str:
+    """The current commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPTS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(previous: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Log per-case throughput and memory ratios against previous results. Returns the regressed cases."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if not before or not before.get('rows_per_sec') or not result.get('rows_per_sec'):
+            continue
+        speed = result['rows_per_sec'] / before['rows_per_sec']
+        memory = result['peak_rss_mb'] / before['peak_rss_mb'] if before.get('peak_rss_mb') else None
+        regressed = speed < 1 - tolerance
+        if regressed:
+            regressions.append(name)
+        logger.info(json.dumps({'case': name, 'speed_ratio': round(speed, 3),
+                                'rss_ratio': round(memory, 3) if memory else None, 'regressed': regressed}))
+    return regressions
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the ingredient extraction pipeline')
+    parser.add_argument('--rows', type=int, default=200000,
+                       help='Rows in the synthetic TSV dump (default: 200000)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Seed for the synthetic dump (default: 42)')
+    parser.add_argument('--vocabulary', type=int, default=20000,
+                       help='Distinct ingredients in the synthetic dump (default: 20000)')
+    parser.add_argument('--products-json', default=DEFAULT_PRODUCTS_FILE,
+                       help='JSON products file added to the tokenizer inputs (default: random_products.json)')
+    parser.add_argument('--reader', default='projected',
+                       help='Row reader for process_tsv_file (default: projected)')
+    parser.add_argument('--top', type=int, default=10000,
+                       help='Ingredients written by the save cases (default: 10000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timing repetitions per case, best run is reported (default: 3)')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES),
+                       help='Cases to run (default: all)')
+    parser.add_argument('-o', '--output', default=DEFAULT_RESULTS_FILE,
+                       help=f'Results JSON file (default: {DEFAULT_RESULTS_FILE})')
+    parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                       help='Relative slowdown reported as a regression by --compare (default: 0.1)')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        tsv = os.path.join(workdir, 'synthetic.tsv')
+        start = time.perf_counter()
+        write_synthetic_tsv(tsv, args.rows, args.seed, args.vocabulary)
+        logger.info(f"Generated {args.rows} synthetic rows ({os.path.getsize(tsv) / 1024 / 1024:.1f} MB) "
+                    f"in {time.perf_counter() - start:.1f}s")
+
+        config = {
+            'tsv': tsv, 'workdir': workdir, 'rows': args.rows, 'products_json': args.products_json,
+            'reader': args.reader, 'top': args.top, 'repeat': args.repeat
+        }
+
+        results = {}
+        for name in args.cases:
+            # A fresh process per case keeps peak RSS and warm caches from leaking between cases
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                results[name] = executor.submit(run_case, name, config).result()
+            logger.info(json.dumps({'case': name, **results[name]}))
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'rows': args.rows, 'seed': args.seed, 'vocabulary': args.vocabulary,
+                   'reader': args.reader, 'top': args.top, 'repeat': args.repeat},
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('config') != report['config']:
+            logger.warning("Compared runs used different configurations")
+        regressions = compare_results(previous, report, args.tolerance)
+        if regressions:
+            logger.warning(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Ingredient Tokenizer Micro-Benchmark
+
+Compares the shared precompiled tokenizer against the original per-ingredient regex
+implementations, checks that both produce identical output and reports ingredients per second.
+"""
+
+import re
+import csv
+import json
+import time
+import os
+import argparse
+import logging
+from typing import Callable, List
+
+from ingredient_tokenizer import tokenize_with_parentheses, tokenize_without_parentheses
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'random_products.json')
+
+def reference_extract_ingredients_with_parentheses(ingredients_text: str) -> List[str]:
+    """Original TSVIngredientsExtractor.extract_ingredients_with_parentheses."""
+    if not ingredients_text:
+        return []
+
+    parentheses_content = re.findall(r'\(([^)]+)\)', ingredients_text)
+    text_without_parens = re.sub(r'\([^)]*\)', '', ingredients_text)
+
+    all_text = text_without_parens
+    for content in parentheses_content:
+        all_text += ', ' + content
+
+    ingredients = re.split(r'[,;]', all_text)
+
+    clean_ingredients = []
+    for ingredient in ingredients:
+        cleaned = re.sub(r'[^a-zA-Z\s]', '', ingredient)
+        cleaned = ' '.join(cleaned.split()).lower().strip()
+
+        if cleaned and len(cleaned) >= 3:
+            words = cleaned.split()
+            if len(words) > 1:
+                clean_ingredients.append(cleaned)
+                for word in words:
+                    if len(word) >= 3:
+                        clean_ingredients.append(word)
+            else:
+                clean_ingredients.append(cleaned)
+
+    return clean_ingredients
+
+def reference_extract_ingredients(ingredients_text: str) -> List[str]:
+    """Original CleanIngredientsExtractor.extract_ingredients."""
+    if not ingredients_text:
+        return []
+
+    ingredients = ingredients_text.split(',')
+
+    clean_ingredients = []
+    for ingredient in ingredients:
+        cleaned = re.sub(r'\([^)]*\)', '', ingredient)
+        cleaned = re.sub(r'[^a-zA-Z\s]', '', cleaned)
+        cleaned = ' '.join(cleaned.split()).lower().strip()
+
+        if cleaned and len(cleaned) >= 3:
+            clean_ingredients.append(cleaned)
+
+    return clean_ingredients
+
+def load_texts_from_json(filename: str) -> List[str]:
+    """Load ingredients texts from a JSON array of products."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+
+    texts = []
+    for product in products:
+        for field in ('ingredients_text_en', 'ingredients_text'):
+            if product.get(field):
+                texts.append(product[field])
+    return texts
+
+def load_texts_from_tsv(filename: str, max_rows: int) -> List[str]:
+    """Load ingredients texts from an OpenFoodFacts TSV file."""
+    texts = []
+    with open(filename, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file, delimiter='\t')
+        for row_num, row in enumerate(reader, 1):
+            if row_num > max_rows:
+                break
+            text = row.get('ingredients_text_en', '') or row.get('ingredients_text', '')
+            if text:
+                texts.append(text)
+    return texts
+
+def time_tokenizer(tokenize: Callable[[str], List[str]], texts: List[str], repeat: int) -> tuple:
+    """Return the best wall time over repeat runs and the number of ingredients emitted per run."""
+    best = float('inf')
+    emitted = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        emitted = 0
+        for text in texts:
+            emitted += len(tokenize(text))
+        best = min(best, time.perf_counter() - start)
+    return best, emitted
+
+def run_benchmark(texts: List[str], repeat: int) -> List[dict]:
+    """Benchmark each tokenizer pair and verify identical output."""
+    pairs = [
+        ('with_parentheses', reference_extract_ingredients_with_parentheses, tokenize_with_parentheses),
+        ('without_parentheses', reference_extract_ingredients, tokenize_without_parentheses),
+    ]
+
+    results = []
+    for name, reference, tokenizer in pairs:
+        mismatches = sum(1 for text in texts if reference(text) != tokenizer(text))
+
+        reference_time, emitted = time_tokenizer(reference, texts, repeat)
+        tokenizer_time, _ = time_tokenizer(tokenizer, texts, repeat)
+
+        result = {
+            'tokenizer': name,
+            'texts': len(texts),
+            'ingredients': emitted,
+            'mismatches': mismatches,
+            'reference_ingredients_per_sec': round(emitted / reference_time) if reference_time else None,
+            'shared_ingredients_per_sec': round(emitted / tokenizer_time) if tokenizer_time else None,
+            'speedup': round(reference_time / tokenizer_time, 2) if tokenizer_time else None
+        }
+        results.append(result)
+        logger.info(json.dumps(result))
+
+    return results
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the shared ingredient tokenizer')
+    parser.add_argument('--json', default=DEFAULT_PRODUCTS_FILE,
+                       help='JSON products file to take ingredients texts from (default: random_products.json)')
+    parser.add_argument('--tsv', help='OpenFoodFacts TSV file to take ingredients texts from instead')
+    parser.add_argument('--max-rows', type=int, default=100000,
+                       help='Maximum TSV rows to load (default: 100000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                       help='Timing repetitions, best run is reported (default: 5)')
+
+    args = parser.parse_args()
+
+    texts = load_texts_from_tsv(args.tsv, args.max_rows) if args.tsv else load_texts_from_json(args.json)
+    if not texts:
+        logger.error("No ingredients texts found")
+        return
+
+    # Small corpora are repeated so each timing run is long enough to measure
+    if len(texts) < 10000:
+        texts = texts * (10000 // len(texts) + 1)
+
+    results = run_benchmark(texts, args.repeat)
+    if any(result['mismatches'] for result in results):
+        logger.error("Shared tokenizer output differs from the reference implementation")
+
+if __name__ == "__main__":
+    main()
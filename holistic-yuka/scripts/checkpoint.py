@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Extraction Checkpoints
+
+Atomic JSON checkpoints that let long TSV and API extraction runs resume after a crash.
+"""
+
+import json
+import os
+import tempfile
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(filename: str, state: Dict[str, Any]) -> None:
+    """Write state to filename atomically, so a crash mid-write never leaves a truncated checkpoint."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(prefix='.checkpoint-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': CHECKPOINT_VERSION, **state}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def load_checkpoint(filename: str) -> Optional[Dict[str, Any]]:
+    """Load a checkpoint, returning None if it doesn't exist or can't be used."""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.error(f"Error parsing checkpoint {filename}: {e}")
+        return None
+
+    if state.get('version') != CHECKPOINT_VERSION:
+        logger.warning(f"Ignoring checkpoint {filename} with unsupported version {state.get('version')}")
+        return None
+
+    return state
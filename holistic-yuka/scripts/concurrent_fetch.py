@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Concurrent Page Fetching
+
+Thread-pool page fetching with a bounded number of in-flight requests, a token-bucket
+rate limiter and results delivered in page order.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available, then take it. A non-positive rate never blocks."""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def fetch_pages_in_order(fetch_page: Callable[[int], T], first_page: int = 1, last_page: Optional[int] = None,
+                         concurrency: int = 4, limiter: Optional[TokenBucket] = None) -> Iterator[Tuple[int, T]]:
+    """Yield (page, fetch_page(page)) in page order while up to `concurrency` pages are fetched ahead.
+
+    Stopping iteration early (break or close) cancels pages that haven't started;
+    requests already in flight finish and are discarded.
+    """
+    def fetch(page: int) -> T:
+        if limiter:
+            limiter.acquire()
+        return fetch_page(page)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='page-fetch')
+    pending = deque()
+    next_page = first_page
+
+    try:
+        while True:
+            # Keep the window of in-flight pages full
+            while len(pending) < max(1, concurrency) and (last_page is None or next_page <= last_page):
+                pending.append((next_page, executor.submit(fetch, next_page)))
+                next_page += 1
+
+            if not pending:
+                return
+
+            page, future = pending.popleft()
+            yield page, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
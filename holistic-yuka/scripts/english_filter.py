@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+English Ingredient Filter
+
+Keeps English ingredients and drops the French, German, Spanish and Italian text that
+OpenFoodFacts labels often carry, in two cheap passes: a character-class check of the
+raw ingredients text (accented letters and foreign function words, which tokenization
+strips or splits off), then a lookup of every word of each token in a frozen set of
+English food words. Verdicts are memoized per distinct token, so a batch of tokens
+costs a few dict lookups.
+
+The lexicon (data/english_food_lexicon.txt) is build_lexicon over the words of
+data/top_10000_usa_ingredients.csv counted at least LEXICON_MIN_COUNT times.
+"""
+
+import csv
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+DEFAULT_LEXICON_FILE = os.path.join(DATA_DIR, 'english_food_lexicon.txt')
+DEFAULT_FREQUENCIES_FILE = os.path.join(DATA_DIR, 'top_10000_usa_ingredients.csv')
+
+LEXICON_MIN_COUNT = 20
+
+# Common ingredient and function words of the other languages on OFF labels that are
+# not English words, however often they turn up in US products
+FOREIGN_WORDS = frozenset('''
+    de du des la le les et avec sans ou au aux une un pour dont issu issus origine
+    sucre sel farine lait huile eau beurre oeuf oeufs sirop amidon levure jus poudre arome aromes
+    naturel naturelle naturels fromage vinaigre creme chocolat pomme pommes poivre oignon oignons
+    ble mais riz colza tournesol graines viande porc boeuf poulet epices conservateur emulsifiant
+    und mit von der die das den dem oder aus zucker salz mehl milch wasser sahne hefe pflanzliche
+    weizen weizenmehl vollmilch magermilch eier kakaobutter rapsol sonnenblumenol gewurze
+    con del los las por sin azucar sal harina leche aceite agua huevo huevos sabor vainilla
+    di il della dello delle zucchero olio acqua uova aromi girasole
+    van het een en suiker zout bloem melk olie
+'''.split())
+
+# Function words that mark English ingredient lists
+ENGLISH_WORDS = frozenset('and or of with contains from less than the in for to as by may'.split())
+
+# Letters that English ingredient lists use in a loanword or two ('crème', 'jalapeño'),
+# and the share of a text's words carrying them above which they mark it as foreign
+ACCENTED_SHARE = 0.25
+ACCENTED = re.compile(r'[À-ÖØ-öø-ɏ]')
+WORD = re.compile(r'[^\W\d_]+')
+
+# The consonant-run test of the scraper's old per-character heuristic, as one regex
+CONSONANT_RUN = re.compile(r'[^aeiou\s]{5,}')
+LOWERCASE_WORDS = re.compile(r'[a-z]+(?: [a-z]+)*')
+
+def build_lexicon(frequencies: Mapping[str, int], min_count: int = LEXICON_MIN_COUNT) -> FrozenSet[str]:
+    """English words of an ingredient frequency table: the words of its ingredients counted at least min_count times, without FOREIGN_WORDS."""
+    counts = Counter()
+    for ingredient, frequency in frequencies.items():
+        for word in set(ingredient.split()):
+            counts[word] += frequency
+    return frozenset(word for word, count in counts.items()
+                     if count >= min_count and word.isalpha() and word.isascii() and word not in FOREIGN_WORDS) | ENGLISH_WORDS
+
+def read_frequencies(filename: str = DEFAULT_FREQUENCIES_FILE) -> Dict[str, int]:
+    """{ingredient: frequency} of an extractor CSV output."""
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        return {row['ingredient']: int(row['frequency']) for row in csv.DictReader(f)}
+
+def save_lexicon(filename: str, lexicon: Iterable[str]) -> None:
+    """Write a lexicon one word per line, sorted."""
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(f'# English food words: english_filter.build_lexicon(top_10000_usa_ingredients.csv, {LEXICON_MIN_COUNT})\n')
+        f.writelines(f'{word}\n' for word in sorted(lexicon))
+
+def load_lexicon(filename: str = DEFAULT_LEXICON_FILE) -> FrozenSet[str]:
+    """Words of a lexicon file, skipping comments."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return frozenset(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+def looks_english(word: str) -> bool:
+    """Character-class check for words outside the lexicon: lowercase ASCII letters without a run of five consonants."""
+    return LOWERCASE_WORDS.fullmatch(word) is not None and CONSONANT_RUN.search(word) is None
+
+class EnglishFilter:
+    """Lexicon-based English check of ingredients texts and tokens."""
+
+    def __init__(self, lexicon: FrozenSet[str] = None, foreign_words: FrozenSet[str] = FOREIGN_WORDS,
+                 accept_unknown: bool = True):
+        self.lexicon = lexicon if lexicon is not None else load_lexicon()
+        self.foreign_words = foreign_words
+        # Whether single words outside the lexicon pass on looks_english alone
+        self.accept_unknown = accept_unknown
+        self.verdicts: Dict[str, bool] = {}
+        self.texts_rejected = 0
+        self.tokens_rejected = 0
+
+    @classmethod
+    def from_file(cls, filename: Optional[str] = None, **kwargs) -> 'EnglishFilter':
+        """Filter with the lexicon in filename, or the default one."""
+        return cls(load_lexicon(filename or DEFAULT_LEXICON_FILE), **kwargs)
+
+    def is_english_text(self, text: str) -> bool:
+        """False (and counted as rejected) when a raw ingredients text has more foreign words,
+        and accented letters, than English function words."""
+        words = WORD.findall(text.lower())
+        foreign = english = 0
+        for word in words:
+            if word in self.foreign_words:
+                foreign += 1
+            elif word in ENGLISH_WORDS:
+                english += 1
+        accented = sum(1 for word in words if ACCENTED.search(word))
+        if accented and accented >= ACCENTED_SHARE * len(words):
+            foreign += 1
+        if foreign == 0 or foreign <= english:
+            return True
+        self.texts_rejected += 1
+        return False
+
+    def is_english(self, token: str) -> bool:
+        """Verdict for one token from the tokenizer (lowercase words separated by single spaces)."""
+        verdict = self.verdicts.get(token)
+        if verdict is None:
+            verdict = self.verdicts[token] = self._classify(token)
+        return verdict
+
+    def _classify(self, token: str) -> bool:
+        words = token.split(' ')
+        unknown = 0
+        for word in words:
+            if word in self.lexicon:
+                continue
+            if word in self.foreign_words or not looks_english(word):
+                return False
+            unknown += 1
+        if unknown == 0:
+            return True
+        # Unknown words pass alone only if accepted, and in phrases only next to as many known ones
+        if len(words) == 1:
+            return self.accept_unknown
+        return unknown * 2 <= len(words)
+
+    def filter_tokens(self, tokens: List[str]) -> List[str]:
+        """The English tokens of a batch, in order."""
+        verdicts = self.verdicts
+        kept = [token for token in tokens if verdicts.get(token) or (token not in verdicts and self.is_english(token))]
+        self.tokens_rejected += len(tokens) - len(kept)
+        return kept
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Approximate Heavy Hitters
+
+Space-Saving counter that tracks the most frequent items of a stream in bounded memory,
+with per-item error bounds. It supports the subset of the Counter interface the
+extractors use, so it can stand in for the exact ingredient Counter.
+"""
+
+import heapq
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Tuple, Union
+
+# Iterables are pre-aggregated in batches of this many items before touching the summary
+UPDATE_BATCH_SIZE = 8192
+
+class SpaceSaving:
+    """Space-Saving summary (Metwally et al.) holding at most `capacity` counters.
+
+    Every reported count overestimates the true count by at most its error, and
+    every error is at most total / capacity.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        self.total = 0
+        # Lazy min-heap of (count, item); entries go stale as counts grow and are refreshed on pop
+        self.heap: List[Tuple[int, Hashable]] = []
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.counts
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.counts)
+
+    def __getitem__(self, item: Hashable) -> int:
+        return self.counts.get(item, 0)
+
+    def __delitem__(self, item: Hashable) -> None:
+        del self.counts[item]
+        del self.errors[item]
+
+    def keys(self):
+        return self.counts.keys()
+
+    def items(self):
+        return self.counts.items()
+
+    def error(self, item: Hashable) -> int:
+        """Maximum overestimate of item's count."""
+        return self.errors.get(item, 0)
+
+    def min_count(self) -> int:
+        """Smallest tracked count once the summary is full, i.e. the bound for any untracked item."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return self._peek_min()[0]
+
+    def _peek_min(self) -> Tuple[int, Hashable]:
+        """Return the (count, item) with the smallest current count, refreshing stale heap entries."""
+        heap, counts = self.heap, self.counts
+        while True:
+            count, item = heap[0]
+            current = counts.get(item)
+            if current == count:
+                return count, item
+            if current is None:
+                heapq.heappop(heap)  # Deleted item
+            else:
+                heapq.heapreplace(heap, (current, item))
+
+    def _add(self, item: Hashable, increment: int, error: int = 0) -> None:
+        """Add increment to item, replacing the minimum counter if the summary is full."""
+        counts = self.counts
+        self.total += increment
+
+        if item in counts:
+            counts[item] += increment
+            return
+
+        if len(counts) < self.capacity:
+            counts[item] = increment
+            self.errors[item] = error
+            heapq.heappush(self.heap, (increment, item))
+            return
+
+        min_count, min_item = self._peek_min()
+        del counts[min_item]
+        del self.errors[min_item]
+        counts[item] = min_count + increment
+        self.errors[item] = min_count + error
+        heapq.heapreplace(self.heap, (min_count + increment, item))
+
+    def update(self, items: Union[Iterable[Hashable], Mapping[Hashable, int]]) -> None:
+        """Count items from an iterable, or add the counts of a mapping or another summary."""
+        if isinstance(items, SpaceSaving):
+            self.merge(items)
+        elif isinstance(items, Mapping):
+            for item, count in items.items():
+                self._add(item, count)
+        else:
+            # Weighted updates of a pre-aggregated batch keep the same error guarantees
+            counts = self.counts
+            iterator = iter(items)
+            while True:
+                batch = Counter(islice(iterator, UPDATE_BATCH_SIZE))
+                if not batch:
+                    break
+                for item, count in batch.items():
+                    if item in counts:
+                        # Fast path for items already tracked; the heap entry is refreshed lazily
+                        counts[item] += count
+                        self.total += count
+                    else:
+                        self._add(item, count)
+
+    def merge(self, other: 'SpaceSaving') -> None:
+        """Merge another summary into this one, keeping the error guarantees.
+
+        Items missing from one summary may have had up to that summary's minimum
+        count, which is added to both their count and their error.
+        """
+        own_min, other_min = self.min_count(), other.min_count()
+        merged: Dict[Hashable, Tuple[int, int]] = {}
+        for item in set(self.counts) | set(other.counts):
+            count = self.counts.get(item, own_min) + other.counts.get(item, other_min)
+            error = (self.errors[item] if item in self.counts else own_min) + \
+                    (other.errors[item] if item in other.counts else other_min)
+            merged[item] = (count, error)
+
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda entry: entry[1][0])
+        self.counts = {item: count for item, (count, _) in kept}
+        self.errors = {item: error for item, (_, error) in kept}
+        self.heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self.heap)
+        self.total += other.total
+
+    def most_common(self, n: int = None) -> List[Tuple[Hashable, int]]:
+        """Items with their estimated counts, highest first."""
+        if n is None:
+            return sorted(self.counts.items(), key=lambda entry: entry[1], reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=lambda entry: entry[1])
+
+    def guaranteed_top(self, n: int) -> List[Any]:
+        """Items of most_common(n) that are certainly among the true top n.
+
+        An item is guaranteed when its lower bound (count - error) is at least the
+        estimated count of the (n + 1)th item.
+        """
+        top = self.most_common(n + 1)
+        threshold = top[n][1] if len(top) > n else 0
+        return [item for item, count in top[:n] if count - self.errors[item] >= threshold]
+
+    def error_bounds(self) -> Dict[str, int]:
+        """Summary of the overestimation bounds."""
+        return {
+            'total': self.total,
+            'capacity': self.capacity,
+            'max_error': max(self.errors.values(), default=0),
+            'error_bound': self.total // self.capacity
+        }
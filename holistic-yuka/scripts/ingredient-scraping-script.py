@@ -7,82 +7,63 @@ Extracts only clean English ingredients - letters only, no numbers, spaces, or s
 
 import requests
 import csv
-import time
-import re
 from typing import Set, List
+import argparse
 import logging
 
+from ingredient_tokenizer import clean_ingredient, tokenize_without_parentheses
+from checkpoint import load_checkpoint, save_checkpoint
+from concurrent_fetch import TokenBucket, fetch_pages_in_order
+from off_client import OpenFoodFactsClient, SEARCH_URL, add_client_arguments, client_from_args
+from metrics import Metrics, add_metrics_arguments, instrumented
+from ingredient_db import DEFAULT_DATABASE_FILE, IngredientDatabase
+from ingredient_vocabulary import DEFAULT_VOCABULARY_FILE, IngredientVocabulary
+from ingredient_clusters import VariantClusterer
+from english_filter import EnglishFilter, looks_english
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Pages between periodic checkpoints
+CHECKPOINT_EVERY_PAGES = 10
+DEFAULT_CHECKPOINT_FILE = 'ingredient_scraping.checkpoint.json'
+
 class CleanIngredientsExtractor:
-    def __init__(self):
-        self.base_url = "https://world.openfoodfacts.org/cgi/search.pl"
+    def __init__(self, client: OpenFoodFactsClient = None, metrics: Metrics = None, english_only: bool = False):
+        self.base_url = SEARCH_URL
+        self.client = client or OpenFoodFactsClient()
+        self.metrics = metrics or Metrics()
+        if self.client.metrics is None:
+            self.client.metrics = self.metrics
         self.unique_ingredients: Set[str] = set()
         self.processed_count = 0
         self.rate_limit_delay = 0.1
+        # ingredients_text_en still holds untranslated text; with english_only it is left out
+        self.english_only = english_only
+        self.english_filter = EnglishFilter() if english_only else None
         
     def is_english_word(self, word: str) -> bool:
-        """Check if word appears to be English (basic heuristic)."""
-        # Must contain only letters
-        if not word.isalpha():
-            return False
-        
-        # Must be at least 2 characters
-        if len(word) < 2:
+        """Check if word appears to be English, by the English food lexicon when english_only is set."""
+        # Must contain only letters, at least 2 of them
+        if not word.isalpha() or len(word) < 2:
             return False
         
         # Skip if it looks like abbreviations or codes
         if word.isupper() and len(word) <= 4:
             return False
         
-        # Basic English pattern - avoid words with too many consonants in a row
-        consonants_in_row = 0
-        for char in word.lower():
-            if char not in 'aeiou':
-                consonants_in_row += 1
-                if consonants_in_row > 4:  # Likely not English
-                    return False
-            else:
-                consonants_in_row = 0
-        
-        return True
+        if self.english_filter is None:
+            return looks_english(word.lower())
+        return self.english_filter.is_english(word.lower())
     
     def clean_ingredient(self, ingredient: str) -> str:
         """Clean ingredient to letters only."""
-        # Remove everything except letters and spaces
-        cleaned = re.sub(r'[^a-zA-Z\s]', '', ingredient)
-        
-        # Remove extra whitespace and convert to lowercase
-        cleaned = ' '.join(cleaned.split()).lower()
-        
-        return cleaned.strip()
+        return clean_ingredient(ingredient)
     
     def extract_ingredients(self, ingredients_text: str) -> List[str]:
         """Extract individual ingredients from comma-separated text."""
-        if not ingredients_text:
-            return []
-        
-        # Split by commas to get individual ingredients
-        ingredients = ingredients_text.split(',')
-        
-        clean_ingredients = []
-        for ingredient in ingredients:
-            # Remove anything in parentheses
-            cleaned = re.sub(r'\([^)]*\)', '', ingredient)
-            
-            # Clean up the text - keep only letters and spaces
-            cleaned = re.sub(r'[^a-zA-Z\s]', '', cleaned)
-            
-            # Remove extra whitespace and convert to lowercase
-            cleaned = ' '.join(cleaned.split()).lower().strip()
-            
-            # Only keep if it's a reasonable ingredient (not empty, not too short)
-            if cleaned and len(cleaned) >= 3:
-                clean_ingredients.append(cleaned)
-        
-        return clean_ingredients
+        return tokenize_without_parentheses(ingredients_text)
     
     def fetch_products_page(self, page: int = 1, page_size: int = 100) -> List[dict]:
         """Fetch a page of products from OpenFoodFacts."""
@@ -95,9 +76,7 @@ class CleanIngredientsExtractor:
         }
         
         try:
-            response = requests.get(self.base_url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = self.client.get_json(self.base_url, params=params)
             return data.get('products', [])
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching page {page}: {e}")
@@ -113,61 +92,121 @@ class CleanIngredientsExtractor:
         product_name = product.get('product_name', 'Unknown Product')
         
         if ingredients_text:
+            if self.english_only and not self.english_filter.is_english_text(ingredients_text):
+                self.metrics.inc('scraper_foreign_texts_total')
+                return
             ingredients = self.extract_ingredients(ingredients_text)
+            if self.english_only:
+                ingredients = self.english_filter.filter_tokens(ingredients)
             self.unique_ingredients.update(ingredients)
+            self.metrics.inc('scraper_ingredients_emitted_total', len(ingredients))
+    
+    def save_checkpoint(self, checkpoint_file: str, page: int, consecutive_empty_pages: int) -> None:
+        """Save the next page to fetch and the ingredients found so far."""
+        save_checkpoint(checkpoint_file, {
+            'base_url': self.base_url,
+            'page': page,
+            'consecutive_empty_pages': consecutive_empty_pages,
+            'processed_count': self.processed_count,
+            'unique_ingredients': sorted(self.unique_ingredients)
+        })
     
-    def extract_all_ingredients(self, max_pages: int = None, max_products: int = None, target_ingredients: int = None) -> None:
-        """Extract ingredients from all products."""
+    def restore_checkpoint(self, checkpoint_file: str) -> tuple:
+        """Restore state from a checkpoint. Returns (page, consecutive_empty_pages)."""
+        state = load_checkpoint(checkpoint_file)
+        if not state or state.get('base_url') != self.base_url:
+            logger.info(f"No usable checkpoint at {checkpoint_file}, starting from page 1")
+            return 1, 0
+        
+        self.unique_ingredients = set(state['unique_ingredients'])
+        self.processed_count = state['processed_count']
+        logger.info(f"Resuming from checkpoint at page {state['page']}: {self.processed_count} products, {len(self.unique_ingredients)} unique ingredients")
+        return state['page'], state['consecutive_empty_pages']
+    
+    def extract_all_ingredients(self, max_pages: int = None, max_products: int = None, target_ingredients: int = None,
+                                checkpoint_file: str = None, resume: bool = False, concurrency: int = 1) -> None:
+        """Extract ingredients from all products, checkpointing progress to checkpoint_file if given.
+        
+        Up to `concurrency` pages are fetched ahead in worker threads, rate limited by a
+        token bucket of 1 / rate_limit_delay requests per second; pages are still
+        processed strictly in order.
+        """
         page = 1
         consecutive_empty_pages = 0
         max_empty_pages = 5
         
+        if checkpoint_file and resume:
+            page, consecutive_empty_pages = self.restore_checkpoint(checkpoint_file)
+        
         logger.info("Starting clean English ingredient extraction...")
         
-        while True:
-            if max_pages and page > max_pages:
-                logger.info(f"Reached maximum pages limit: {max_pages}")
-                break
-            
-            if max_products and self.processed_count >= max_products:
-                logger.info(f"Reached maximum products limit: {max_products}")
-                break
-                
-            if target_ingredients and len(self.unique_ingredients) >= target_ingredients:
-                logger.info(f"Reached target ingredients: {len(self.unique_ingredients)}")
-                break
-            
-            logger.info(f"Processing page {page}...")
-            
-            products = self.fetch_products_page(page)
-            
-            if not products:
-                consecutive_empty_pages += 1
-                if consecutive_empty_pages >= max_empty_pages:
-                    logger.info("Too many consecutive empty pages, stopping...")
+        # The client applies the limiter to network requests only, so cache hits aren't throttled
+        rate = 1 / self.rate_limit_delay if self.rate_limit_delay > 0 else 0
+        self.client.limiter = TokenBucket(rate, capacity=concurrency)
+        pages = fetch_pages_in_order(self.fetch_products_page, page, max_pages, concurrency)
+        
+        try:
+            while True:
+                if max_pages and page > max_pages:
+                    logger.info(f"Reached maximum pages limit: {max_pages}")
                     break
-            else:
-                consecutive_empty_pages = 0
-                products_with_english = 0
                 
-                for product in products:
-                    if product.get('ingredients_text_en'):
-                        self.process_product(product)
-                        products_with_english += 1
+                if max_products and self.processed_count >= max_products:
+                    logger.info(f"Reached maximum products limit: {max_products}")
+                    break
                     
-                    self.processed_count += 1
-                    if max_products and self.processed_count >= max_products:
+                if target_ingredients and len(self.unique_ingredients) >= target_ingredients:
+                    logger.info(f"Reached target ingredients: {len(self.unique_ingredients)}")
+                    break
+                
+                logger.info(f"Processing page {page}...")
+                
+                with self.metrics.timer('scraper_page_wait_seconds'):
+                    _, products = next(pages)
+                self.metrics.inc('scraper_pages_total')
+                
+                if not products:
+                    self.metrics.inc('scraper_empty_pages_total')
+                    consecutive_empty_pages += 1
+                    if consecutive_empty_pages >= max_empty_pages:
+                        logger.info("Too many consecutive empty pages, stopping...")
                         break
+                else:
+                    consecutive_empty_pages = 0
+                    products_with_english = 0
+                    
+                    for product in products:
+                        if product.get('ingredients_text_en'):
+                            self.process_product(product)
+                            products_with_english += 1
                         
-                    if target_ingredients and len(self.unique_ingredients) >= target_ingredients:
-                        break
+                        self.processed_count += 1
+                        if max_products and self.processed_count >= max_products:
+                            break
+                            
+                        if target_ingredients and len(self.unique_ingredients) >= target_ingredients:
+                            break
+                    
+                    self.metrics.set_counter('scraper_products_total', self.processed_count)
+                    self.metrics.inc('scraper_products_english_total', products_with_english)
+                    self.metrics.set_gauge('scraper_unique_ingredients', len(self.unique_ingredients))
+                    
+                    if page % 10 == 0:  # Log every 10 pages
+                        logger.info(f"Page {page} completed. Products with English ingredients: {products_with_english}")
+                        logger.info(f"Total processed: {self.processed_count}, Unique ingredients: {len(self.unique_ingredients)}")
                 
-                if page % 10 == 0:  # Log every 10 pages
-                    logger.info(f"Page {page} completed. Products with English ingredients: {products_with_english}")
-                    logger.info(f"Total processed: {self.processed_count}, Unique ingredients: {len(self.unique_ingredients)}")
-            
-            page += 1
-            time.sleep(self.rate_limit_delay)
+                page += 1
+                
+                if checkpoint_file and page % CHECKPOINT_EVERY_PAGES == 0:
+                    self.save_checkpoint(checkpoint_file, page, consecutive_empty_pages)
+        finally:
+            # Stop fetching ahead once we're done with the pages
+            pages.close()
+        
+        if checkpoint_file:
+            self.save_checkpoint(checkpoint_file, page, consecutive_empty_pages)
+        
+        logger.info(f"HTTP metrics: {self.client.latency_summary()}")
     
     def filter_common_words(self) -> None:
         """Remove very common words that aren't actual ingredients."""
@@ -183,6 +222,17 @@ class CleanIngredientsExtractor:
             if ingredient not in common_words and len(ingredient) >= 3
         }
     
+    def merge_variants(self) -> None:
+        """Replace plural and differently spaced variants with their canonical form.
+        
+        The scraper doesn't count, so every ingredient weighs the same: typo links,
+        which need a much more frequent canonical form, never apply.
+        """
+        clusterer = VariantClusterer()
+        variant_map = clusterer.cluster(dict.fromkeys(self.unique_ingredients, 1))
+        self.unique_ingredients = {variant_map.get(ingredient, ingredient) for ingredient in self.unique_ingredients}
+        logger.info(f"Merged {len(variant_map)} ingredient variants in {clusterer.stats['seconds']}s")
+    
     def save_to_csv(self, filename: str = 'clean_ingredients.csv') -> None:
         """Save clean ingredients to CSV file."""
         self.filter_common_words()
@@ -208,6 +258,24 @@ class CleanIngredientsExtractor:
         
         logger.info(f"Saved {len(sorted_ingredients)} clean ingredients to {filename}")
     
+    def save_to_sqlite(self, filename: str = DEFAULT_DATABASE_FILE) -> None:
+        """Save clean ingredients to an indexed SQLite database; the scraper doesn't count, so frequencies are left empty."""
+        self.filter_common_words()
+        with IngredientDatabase.build(filename) as database:
+            database.add_ingredients((ingredient, None) for ingredient in sorted(self.unique_ingredients))
+        
+        logger.info(f"Saved {len(self.unique_ingredients)} clean ingredients to {filename}")
+    
+    def save_to_vocabulary(self, filename: str = DEFAULT_VOCABULARY_FILE) -> None:
+        """Save clean ingredients as a memory-mappable vocabulary file, in name order with zero counts."""
+        self.filter_common_words()
+        vocabulary = IngredientVocabulary()
+        for ingredient in sorted(self.unique_ingredients):
+            vocabulary.intern(ingredient)
+        vocabulary.save(filename)
+        
+        logger.info(f"Saved {len(vocabulary)} clean ingredients to {filename}")
+    
     def preview_results(self, count: int = 20) -> None:
         """Preview first N ingredients found."""
         sample = sorted(list(self.unique_ingredients))[:count]
@@ -217,36 +285,74 @@ class CleanIngredientsExtractor:
 
 def main():
     """Main function."""
-    extractor = CleanIngredientsExtractor()
+    parser = argparse.ArgumentParser(description='Extract clean English ingredients from OpenFoodFacts')
+    parser.add_argument('--checkpoint', nargs='?', const=DEFAULT_CHECKPOINT_FILE,
+                       help=f'Save a checkpoint every {CHECKPOINT_EVERY_PAGES} pages to this file (default file: {DEFAULT_CHECKPOINT_FILE})')
+    parser.add_argument('--resume', action='store_true',
+                       help='Resume from the last checkpoint, implies --checkpoint')
+    parser.add_argument('-c', '--concurrency', type=int, default=1,
+                       help='Number of pages to fetch concurrently (default: 1)')
+    parser.add_argument('--base-url',
+                       help='Search endpoint to use instead of world.openfoodfacts.org, e.g. a local stub server')
+    parser.add_argument('--sqlite', nargs='?', const=DEFAULT_DATABASE_FILE,
+                       help=f'Also save the ingredients to this SQLite database (default file: {DEFAULT_DATABASE_FILE})')
+    parser.add_argument('--vocabulary', nargs='?', const=DEFAULT_VOCABULARY_FILE,
+                       help=f'Also save the ingredients as a memory-mappable vocabulary file (default file: {DEFAULT_VOCABULARY_FILE})')
+    parser.add_argument('--cluster-variants', action='store_true',
+                       help='Merge plural and differently spaced variants of an ingredient before saving')
+    parser.add_argument('--english-only', action='store_true',
+                       help='Leave out foreign ingredients texts and tokens, by the English food lexicon in data/english_food_lexicon.txt')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    metrics = Metrics()
+    extractor = CleanIngredientsExtractor(client_from_args(args, pool_size=max(10, args.concurrency)), metrics,
+                                          english_only=args.english_only)
+    if args.base_url:
+        extractor.base_url = args.base_url
     
     # Configuration for 10,000 unique ingredients
     TARGET_INGREDIENTS = 10000
     MAX_PAGES = 1000  # Allow more pages to reach target
+    CHECKPOINT_FILE = args.checkpoint or (DEFAULT_CHECKPOINT_FILE if args.resume else None)
     
-    try:
-        extractor.extract_all_ingredients(
-            max_pages=MAX_PAGES,
-            target_ingredients=TARGET_INGREDIENTS
-        )
-        
-        # Preview results
-        extractor.preview_results(30)
-        
-        # Save results
-        extractor.save_to_csv('unique_ingredients.csv')
-        extractor.save_to_txt('unique_ingredients.txt')
-        
-        logger.info("Extraction completed!")
-        logger.info(f"Total products processed: {extractor.processed_count}")
-        logger.info(f"Clean English ingredients found: {len(extractor.unique_ingredients)}")
-        
-    except KeyboardInterrupt:
-        logger.info("Extraction interrupted by user")
-        extractor.preview_results(20)
-        
-        if extractor.unique_ingredients:
-            extractor.save_to_csv('clean_ingredients_partial.csv')
-            logger.info("Saved partial results")
+    with instrumented(args, metrics):
+        try:
+            extractor.extract_all_ingredients(
+                max_pages=MAX_PAGES,
+                target_ingredients=TARGET_INGREDIENTS,
+                checkpoint_file=CHECKPOINT_FILE,
+                resume=args.resume,
+                concurrency=args.concurrency
+            )
+            
+            if args.cluster_variants:
+                extractor.merge_variants()
+            
+            # Preview results
+            extractor.preview_results(30)
+            
+            # Save results
+            extractor.save_to_csv('unique_ingredients.csv')
+            extractor.save_to_txt('unique_ingredients.txt')
+            if args.sqlite:
+                extractor.save_to_sqlite(args.sqlite)
+            if args.vocabulary:
+                extractor.save_to_vocabulary(args.vocabulary)
+            
+            logger.info("Extraction completed!")
+            logger.info(f"Total products processed: {extractor.processed_count}")
+            logger.info(f"Clean English ingredients found: {len(extractor.unique_ingredients)}")
+            
+        except KeyboardInterrupt:
+            logger.info("Extraction interrupted by user")
+            extractor.preview_results(20)
+            
+            if extractor.unique_ingredients:
+                extractor.save_to_csv('clean_ingredients_partial.csv')
+                logger.info("Saved partial results")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Ingredient Clustering
+
+Groups spelling variants of the same ingredient (plurals, spacing differences and OCR
+or typing errors such as 'sugars', 'corn syrup'/'cornsyrup' and 'suger') and maps each
+onto one canonical form, so their counts can be merged. Typo candidates come from a
+prefix-filtered trigram index and are verified with a bounded edit distance, which keeps
+the work far below comparing every pair on 100k+ ingredients. A rare string one edit
+from a common one is often a different real ingredient ('lactase', 'lactose'), so it is
+only taken for a typo when the words that differ are neither in the English food
+lexicon nor protected, and the two don't differ in the first letter or a chemical
+ending.
+"""
+
+import time
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from english_filter import load_lexicon
+
+logger = logging.getLogger(__name__)
+
+GRAM_SIZE = 3
+
+# Typo links only between ingredients at least this long: short words one edit apart
+# are usually different words ('salt', 'malt')
+MIN_TYPO_LENGTH = 5
+
+# Ingredients this long may be two edits apart, shorter ones one
+LONG_INGREDIENT_LENGTH = 12
+
+# A typo must be this many times rarer than the ingredient it is merged into
+DEFAULT_TYPO_RATIO = 10.0
+
+# Singular endings tried for plurals, most specific first
+PLURAL_ENDINGS = (('ies', 'y'), ('oes', 'o'), ('ses', 's'), ('xes', 'x'), ('ches', 'ch'), ('shes', 'sh'), ('s', ''))
+
+# Endings naming different compounds: enzymes and sugars ('lactase', 'lactose'), salts
+# and acids ('sulfite', 'sulfate', 'sulfide'), 'chlorine' and 'chloride'
+CHEMICAL_ENDINGS = ('ase', 'ose', 'ate', 'ite', 'ide', 'ine')
+
+# Real words outside the food lexicon that sit one edit from, or are the plural of, a
+# much more common ingredient in US products, and are never merged into it
+PROTECTED_WORDS = frozenset('''
+    lectin lactase maltase sucrase lipase invertase
+    greens grounds preserves
+    broad buttery chicle chops coagulant farming mullet pollack present roman string while
+'''.split())
+
+def max_distance(length: int) -> int:
+    """Edit distance allowed for a typo of an ingredient of this length."""
+    return 2 if length >= LONG_INGREDIENT_LENGTH else 1
+
+def within_distance(a: str, b: str, limit: int) -> bool:
+    """True if the Levenshtein distance between a and b is at most limit, computed within a diagonal band."""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= limit else too_far
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char_a != b[j - 1])
+            insertion = current[j - 1] + 1
+            deletion = previous[j] + 1
+            value = min(cost, insertion, deletion)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return False
+        previous = current
+    return previous[len(b)] <= limit
+
+def grams(ingredient: str) -> List[str]:
+    """Distinct padded trigrams of an ingredient."""
+    padded = '#' * (GRAM_SIZE - 1) + ingredient + '#' * (GRAM_SIZE - 1)
+    return list(dict.fromkeys(padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)))
+
+class UnionFind:
+    """Disjoint sets over integer IDs with path halving."""
+
+    def __init__(self, size: int):
+        self.parents = list(range(size))
+
+    def find(self, item: int) -> int:
+        parents = self.parents
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    def union(self, a: int, b: int) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parents[root_b] = root_a
+
+def chemical_ending(name: str) -> Optional[str]:
+    """The CHEMICAL_ENDINGS ending of name, if any."""
+    for ending in CHEMICAL_ENDINGS:
+        if name.endswith(ending):
+            return ending
+    return None
+
+def canonical_key(name: str, count: int) -> Tuple:
+    """Sort key choosing a cluster's canonical form: most frequent, then fewest letters
+    (singular), then most spaces ('corn syrup' over 'cornsyrup'), then alphabetical."""
+    return (-count, len(name) - name.count(' '), -name.count(' '), name)
+
+class VariantClusterer:
+    """Finds near-duplicate ingredients and maps each to its cluster's canonical form."""
+
+    def __init__(self, typo_ratio: float = DEFAULT_TYPO_RATIO, min_typo_length: int = MIN_TYPO_LENGTH,
+                 known_words: FrozenSet[str] = None):
+        self.typo_ratio = typo_ratio
+        self.min_typo_length = min_typo_length
+        # Words that are never typos: the English food lexicon by default, or e.g.
+        # english_filter.build_lexicon over an earlier top ingredients CSV
+        self.known_words = (known_words if known_words is not None else load_lexicon()) | PROTECTED_WORDS
+        self.stats: Dict[str, float] = {}
+
+    def is_known(self, name: str) -> bool:
+        """True if every word of name is a known word, so it can't be anyone's typo."""
+        return all(word in self.known_words for word in name.split())
+
+    def may_be_typo(self, name: str, other: str) -> bool:
+        """Whether name, within edit distance of the more frequent other, may be a misspelling of it."""
+        if name[0] != other[0]:
+            return False
+        endings = chemical_ending(name), chemical_ending(other)
+        if None not in endings and endings[0] != endings[1]:
+            return False
+        other_words = set(other.split())
+        return not any(word in self.known_words for word in name.split() if word not in other_words)
+
+    def typo_links(self, names: List[str], counts: Mapping[str, int]) -> Iterable[Tuple[int, int]]:
+        """(typo, canonical) index pairs linking each name to the best ingredient, by
+        canonical_key, that is within max_distance edits and typo_ratio times more frequent,
+        and that may_be_typo accepts.
+
+        Only ingredients frequent enough to be a canonical form are indexed, by trigram.
+        Two strings within d edits share all but at most GRAM_SIZE * d of their distinct
+        trigrams, so with trigrams in one global rarest-first order, their first
+        GRAM_SIZE * d + 1 trigrams must intersect: only those prefixes are indexed and
+        probed, and the rare trigrams at the front keep the posting lists short.
+        """
+        candidates = [index for index, name in enumerate(names) if len(name) >= self.min_typo_length]
+        name_grams = {index: grams(names[index]) for index in candidates}
+        gram_sets = {index: set(name_grams[index]) for index in candidates}
+        targets = [index for index in candidates if counts[names[index]] >= self.typo_ratio]
+        # Names made only of known words can't be typos, but can still be typo targets
+        probes = [index for index in candidates if not self.is_known(names[index])]
+        frequency = Counter(gram for index in targets for gram in name_grams[index])
+
+        def prefix(index: int) -> List[str]:
+            ordered = sorted(name_grams[index], key=lambda gram: (frequency[gram], gram))
+            return ordered[:GRAM_SIZE * max_distance(len(names[index])) + 1]
+
+        index_by_gram: Dict[str, List[int]] = defaultdict(list)
+        for index in targets:
+            for gram in prefix(index):
+                index_by_gram[gram].append(index)
+
+        checked = 0
+        for index in probes:
+            name = names[index]
+            needed = counts[name] * self.typo_ratio
+            best = None
+            seen = set()
+            for gram in prefix(index):
+                for other in index_by_gram.get(gram, ()):
+                    if other in seen:
+                        continue
+                    seen.add(other)
+                    other_name = names[other]
+                    if counts[other_name] < needed:
+                        continue
+                    # The shorter string sets the allowed distance
+                    limit = max_distance(min(len(name), len(other_name)))
+                    if abs(len(name) - len(other_name)) > limit:
+                        continue
+                    if best is not None and canonical_key(other_name, counts[other_name]) > canonical_key(names[best], counts[names[best]]):
+                        continue
+                    # Count filter: each edit removes at most GRAM_SIZE of the trigrams
+                    shared = len(gram_sets[index] & gram_sets[other])
+                    if shared < max(len(gram_sets[index]), len(gram_sets[other])) - GRAM_SIZE * limit:
+                        continue
+                    checked += 1
+                    if within_distance(name, other_name, limit) and self.may_be_typo(name, other_name):
+                        best = other
+            if best is not None:
+                yield index, best
+
+        self.stats.update({'typo_candidates': len(probes), 'typo_targets': len(targets), 'pairs_checked': checked})
+
+    def cluster(self, counts: Mapping[str, int]) -> Dict[str, str]:
+        """{variant: canonical} for every ingredient that merges into another one."""
+        start = time.perf_counter()
+        names = list(counts)
+        ids = {name: index for index, name in enumerate(names)}
+        sets = UnionFind(len(names))
+        links = Counter()
+
+        # Spacing: the same letters once spaces are dropped
+        by_letters: Dict[str, int] = {}
+        for index, name in enumerate(names):
+            key = name.replace(' ', '')
+            if key in by_letters:
+                sets.union(by_letters[key], index)
+                links['spacing'] += 1
+            else:
+                by_letters[key] = index
+
+        # Plurals, when the singular is in the vocabulary too, except the protected
+        # plurals that name something else ('greens')
+        for index, name in enumerate(names):
+            if name.rpartition(' ')[2] in PROTECTED_WORDS:
+                continue
+            for ending, singular_ending in PLURAL_ENDINGS:
+                if name.endswith(ending) and len(name) > len(ending) + 1:
+                    singular = ids.get(name[:len(name) - len(ending)] + singular_ending)
+                    if singular is not None:
+                        sets.union(singular, index)
+                        links['plural'] += 1
+                        break
+
+        # Typos, each only into one much more frequent ingredient, so a rare string
+        # one edit from two common ones ('malt' and 'salt') can't join them
+        for typo, canonical in self.typo_links(names, counts):
+            sets.union(canonical, typo)
+            links['typo'] += 1
+
+        members: Dict[int, List[int]] = defaultdict(list)
+        for index in range(len(names)):
+            members[sets.find(index)].append(index)
+
+        mapping = {}
+        for cluster in members.values():
+            if len(cluster) < 2:
+                continue
+            canonical = min((names[index] for index in cluster), key=lambda name: canonical_key(name, counts[name]))
+            for index in cluster:
+                if names[index] != canonical:
+                    mapping[names[index]] = canonical
+
+        self.stats.update({
+            'ingredients': len(names),
+            'spacing_links': links['spacing'],
+            'plural_links': links['plural'],
+            'typo_links': links['typo'],
+            'merged_variants': len(mapping),
+            'seconds': round(time.perf_counter() - start, 3)
+        })
+        return mapping
+
+def merge_counts(counts: Mapping[str, int], mapping: Mapping[str, str]) -> Counter:
+    """Counts with every variant's count added to its canonical form."""
+    merged = Counter()
+    for name, count in counts.items():
+        merged[mapping.get(name, name)] += count
+    return merged
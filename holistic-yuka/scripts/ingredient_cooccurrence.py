@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Ingredient Co-occurrence Matrix
+
+Counts, during the extractor's scan, how many selected products list each pair of
+ingredients together. Products' ingredient IDs are buffered; each full buffer becomes
+one sorted run of packed (row, column) keys and counts, with the pairs of every product
+of the same length generated by one numpy indexing operation. Runs are merged like a
+binary counter, so each pair is re-sorted O(log n) times, and the accumulators of
+parallel workers merge by remapping their IDs. Once the counts are final the matrix is
+restricted to the top-N ingredients, re-keyed by their rank in the CSV output, and saved
+as an upper-triangular COO file that loads into a SciPy CSR matrix.
+
+The diagonal holds the number of products listing each ingredient. Variants are merged
+only after the scan, when the per-product lists are gone, so with --cluster-variants a
+merged ingredient's diagonal and pairs count listings of its variants: a product listing
+both tomato and tomatoes counts twice, as it does in the merged frequencies. Without a fixed
+vocabulary every distinct pair is kept until the end, so memory grows with the pairs
+of the whole dump (16 bytes each); with one (the CSV of an earlier run) only pairs of
+its ingredients are counted, at most N(N + 1)/2.
+
+File layout (little-endian, sections 8-byte aligned):
+    header       magic, version, ingredient, nonzero and product counts, section (offset, size) table
+    names        UTF-8 ingredient names back to back, in rank order; name_offsets uint64[n + 1]
+    counts       int64[n] ingredient frequencies
+    rows, cols   uint32[nnz] (row <= col), sorted by row then column
+    values       int64[nnz] products listing both ingredients
+"""
+
+import csv
+import os
+import struct
+import sys
+import tempfile
+import logging
+from array import array
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COOCCURRENCE_FILE = 'ingredient_cooccurrence.coo'
+
+MAGIC = b'OFFCOOCC'
+VERSION = 1
+
+SECTIONS = ('names', 'name_offsets', 'counts', 'rows', 'cols', 'values')
+
+# magic, version, reserved, ingredient count, nonzero count, product count, then (offset, size) per section
+HEADER = struct.Struct('<8sIIQQQ' + 'QQ' * len(SECTIONS))
+
+SECTION_DTYPES = {'name_offsets': '<u8', 'counts': '<i8', 'rows': '<u4', 'cols': '<u4', 'values': '<i8'}
+
+# Pairs buffered before they are counted into a run: 16 MB of keys
+FLUSH_PAIRS = 1 << 21
+
+KEY_SHIFT = 32
+KEY_MASK = (1 << KEY_SHIFT) - 1
+
+def require_numpy() -> None:
+    """Raise ImportError when numpy is not installed."""
+    if np is None:
+        raise ImportError("Co-occurrence counting requires the numpy package")
+
+def require_scipy() -> None:
+    """Raise ImportError when scipy is not installed."""
+    if sparse is None:
+        raise ImportError("CSR co-occurrence matrices require the scipy package")
+
+def read_vocabulary_csv(filename: str) -> List[str]:
+    """Ingredients of an extractor CSV output, in rank order."""
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        return [row['ingredient'] for row in csv.DictReader(f)]
+
+def sum_pairs(keys: 'np.ndarray', counts: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """Sorted distinct keys and the summed counts of each."""
+    if len(keys) == 0:
+        return keys.astype(np.int64), counts.astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.add.reduceat(counts, starts)
+
+def remap_keys(keys: 'np.ndarray', remap: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """Keys with both IDs translated through remap (-1 drops a pair), re-packed with row <= column.
+    Also returns the mask of the keys kept."""
+    source_rows, source_columns = keys >> KEY_SHIFT, keys & KEY_MASK
+    rows, columns = remap[source_rows], remap[source_columns]
+    kept = (rows >= 0) & (columns >= 0)
+    # Two different ingredients merged into one are not a product listing it twice
+    kept &= (rows != columns) | (source_rows == source_columns)
+    rows, columns = rows[kept], columns[kept]
+    return np.minimum(rows, columns) << KEY_SHIFT | np.maximum(rows, columns), kept
+
+class CooccurrenceAccumulator:
+    """Per-product ingredient pair counts, keyed by IDs interned on first sight or fixed by a vocabulary."""
+
+    def __init__(self, vocabulary: Optional[Sequence[str]] = None, flush_pairs: int = FLUSH_PAIRS):
+        require_numpy()
+        self.names: List[str] = list(vocabulary or ())
+        self.ids: Dict[str, int] = {name: ingredient_id for ingredient_id, name in enumerate(self.names)}
+        # With a vocabulary, ingredients outside it are not counted
+        self.fixed = vocabulary is not None
+        self.flush_pairs = flush_pairs
+        # Sorted (keys, counts) runs, each at most half the size of the one before
+        self.runs: List[Tuple['np.ndarray', 'np.ndarray']] = []
+        self.pending_ids = array('I')
+        self.pending_lengths = array('I')
+        self.pending_pairs = 0
+        self.product_count = 0
+
+    def intern(self, name: str) -> Optional[int]:
+        """ID of name, adding it unless the vocabulary is fixed."""
+        ingredient_id = self.ids.get(name)
+        if ingredient_id is None and not self.fixed:
+            ingredient_id = self.ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return ingredient_id
+
+    def add(self, ingredients: Iterable[str]) -> None:
+        """Count the pairs of one product's ingredients, each distinct ingredient once."""
+        if not ingredients:
+            return
+        self.product_count += 1
+        ids = sorted({ingredient_id for ingredient_id in map(self.intern, ingredients) if ingredient_id is not None})
+        if not ids:
+            return
+        self.pending_ids.extend(ids)
+        self.pending_lengths.append(len(ids))
+        self.pending_pairs += len(ids) * (len(ids) + 1) // 2
+        if self.pending_pairs >= self.flush_pairs:
+            self.flush()
+
+    def flush(self) -> None:
+        """Count the buffered products' pairs into a new run."""
+        if not self.pending_lengths:
+            return
+        ids = np.frombuffer(self.pending_ids, dtype=np.uint32).astype(np.int64)
+        lengths = np.frombuffer(self.pending_lengths, dtype=np.uint32)
+        starts = np.concatenate(([0], np.cumsum(lengths[:-1], dtype=np.int64)))
+        keys = []
+        for length in map(int, np.unique(lengths)):
+            # One row of IDs per product of this length; pairs are the upper triangle, diagonal included
+            matrix = ids[starts[lengths == length][:, None] + np.arange(length)]
+            rows, columns = np.triu_indices(length)
+            keys.append((matrix[:, rows] << KEY_SHIFT | matrix[:, columns]).ravel())
+        keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+        self.add_run(keys, counts.astype(np.int64))
+        self.pending_ids = array('I')
+        self.pending_lengths = array('I')
+        self.pending_pairs = 0
+
+    def add_run(self, keys: 'np.ndarray', counts: 'np.ndarray') -> None:
+        """Add sorted distinct keys with their counts, merging runs of similar size."""
+        runs = self.runs
+        runs.append((keys, counts))
+        while len(runs) > 1 and len(runs[-1][0]) * 2 >= len(runs[-2][0]):
+            (keys, counts), (last_keys, last_counts) = runs[-2], runs.pop()
+            runs[-1] = sum_pairs(np.concatenate((keys, last_keys)), np.concatenate((counts, last_counts)))
+
+    def pair_counts(self) -> Tuple['np.ndarray', 'np.ndarray']:
+        """(keys, counts) of every distinct pair so far, as one run."""
+        self.flush()
+        if len(self.runs) > 1:
+            merged = sum_pairs(np.concatenate([keys for keys, _ in self.runs]),
+                               np.concatenate([counts for _, counts in self.runs]))
+            self.runs = [merged]
+        return self.runs[0] if self.runs else (np.zeros(0, np.int64), np.zeros(0, np.int64))
+
+    def merge(self, other: 'CooccurrenceAccumulator') -> None:
+        """Add the counts of another accumulator, such as a worker's, remapping its IDs to these."""
+        keys, counts = other.pair_counts()
+        self.product_count += other.product_count
+        # Accumulators sharing a vocabulary already agree on every ID
+        if other.names[:len(self.names)] == self.names[:len(other.names)]:
+            for name in other.names[len(self.names):]:
+                self.intern(name)
+            self.add_run(keys, counts)
+            return
+
+        ids = [self.intern(name) for name in other.names]
+        remap = np.array([-1 if ingredient_id is None else ingredient_id for ingredient_id in ids], dtype=np.int64)
+        keys, kept = remap_keys(keys, remap)
+        self.add_run(*sum_pairs(keys, counts[kept]))
+
+    def __len__(self) -> int:
+        """Pair counts held in memory; a pair may be in several runs until they are merged."""
+        return sum(len(keys) for keys, _ in self.runs)
+
+    def top_matrix(self, top_ingredients: Sequence[Tuple[str, int]],
+                   variant_map: Mapping[str, str] = None) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+        """(rows, cols, values) of the counts among top_ingredients, keyed by their rank.
+
+        With variant_map, counts of variants are added to their canonical forms, so they
+        count listings rather than products: a product listing two variants counts twice on
+        the diagonal and in their pairs with a third ingredient. The pair of the two
+        variants themselves is left out rather than added to the diagonal a third time.
+        """
+        keys, counts = self.pair_counts()
+        variant_map = variant_map or {}
+        ranks = {name: rank for rank, (name, _) in enumerate(top_ingredients)}
+        remap = np.array([ranks.get(variant_map.get(name, name), -1) for name in self.names], dtype=np.int64)
+        keys, kept = remap_keys(keys, remap)
+        keys, values = sum_pairs(keys, counts[kept])
+        return keys >> KEY_SHIFT, keys & KEY_MASK, values
+
+    def save(self, filename: str, top_ingredients: Sequence[Tuple[str, int]],
+             variant_map: Mapping[str, str] = None) -> int:
+        """Write the matrix among top_ingredients ((name, frequency) in rank order) to a COO file.
+
+        The file is replaced atomically. Returns the nonzero count.
+        """
+        rows, cols, values = self.top_matrix(top_ingredients, variant_map)
+        encoded = [name.encode('utf-8') for name, _ in top_ingredients]
+        name_offsets = np.concatenate(([0], np.cumsum([len(data) for data in encoded], dtype=np.int64)))
+        arrays = {
+            'name_offsets': name_offsets,
+            'counts': np.array([count for _, count in top_ingredients], dtype=np.int64),
+            'rows': rows,
+            'cols': cols,
+            'values': values
+        }
+        sections = {name: data.astype(SECTION_DTYPES[name]).tobytes() for name, data in arrays.items()}
+        sections['names'] = b''.join(encoded)
+
+        table = []
+        position = HEADER.size
+        for name in SECTIONS:
+            position += -position % 8
+            table += [position, len(sections[name])]
+            position += len(sections[name])
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.cooccurrence-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, len(top_ingredients), len(values), self.product_count, *table))
+                for name, offset in zip(SECTIONS, table[0::2]):
+                    f.write(b'\0' * (offset - f.tell()))
+                    f.write(sections[name])
+            # mkstemp creates the file private to its owner; the matrix is meant to be shared
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, filename)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return len(values)
+
+class CooccurrenceMatrix:
+    """A saved co-occurrence matrix: the top-N names and frequencies, and its COO arrays."""
+
+    def __init__(self, filename: str = DEFAULT_COOCCURRENCE_FILE):
+        require_numpy()
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"{filename} is not an ingredient co-occurrence matrix")
+        magic, version, _, ingredient_count, nonzero_count, self.product_count, *table = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} is not a version {VERSION} ingredient co-occurrence matrix")
+        if table[-2] + table[-1] > len(data):
+            raise ValueError(f"{filename} is truncated")
+
+        sections = {}
+        for name, offset, size in zip(SECTIONS, table[0::2], table[1::2]):
+            if name in SECTION_DTYPES:
+                dtype = np.dtype(SECTION_DTYPES[name])
+                sections[name] = np.frombuffer(data, dtype, size // dtype.itemsize, offset)
+            else:
+                sections[name] = data[offset:offset + size]
+
+        offsets = sections['name_offsets']
+        blob = sections['names']
+        self.names = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(ingredient_count)]
+        self.ids = {name: ingredient_id for ingredient_id, name in enumerate(self.names)}
+        self.counts = sections['counts']
+        self.rows, self.cols, self.values = sections['rows'], sections['cols'], sections['values']
+        if len(self.values) != nonzero_count:
+            raise ValueError(f"{filename} is truncated")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def to_csr(self, symmetric: bool = True) -> 'sparse.csr_matrix':
+        """SciPy CSR matrix of the counts, mirrored below the diagonal unless symmetric is False."""
+        require_scipy()
+        size = len(self.names)
+        if symmetric:
+            off_diagonal = self.rows != self.cols
+            rows = np.concatenate((self.rows, self.cols[off_diagonal]))
+            cols = np.concatenate((self.cols, self.rows[off_diagonal]))
+            values = np.concatenate((self.values, self.values[off_diagonal]))
+        else:
+            rows, cols, values = self.rows, self.cols, self.values
+        return sparse.coo_matrix((values, (rows, cols)), shape=(size, size)).tocsr()
+
+    def neighbours(self, name: str, n: int = 10) -> List[Tuple[str, int]]:
+        """The n ingredients most often listed with name, with their product counts."""
+        ingredient_id = self.ids.get(name)
+        if ingredient_id is None:
+            return []
+        in_row, in_column = self.rows == ingredient_id, self.cols == ingredient_id
+        found = in_row != in_column
+        others = np.where(in_row, self.cols, self.rows)[found]
+        counts = self.values[found]
+        order = np.argsort(-counts, kind='stable')[:n]
+        return [(self.names[others[i]], int(counts[i])) for i in order]
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Ingredient Database
+
+Indexed SQLite export of the extracted products, their normalized ingredients and the
+ingredient frequencies, with an FTS5 index on ingredient names, so the app and the
+analyzeProduct function can look ingredients up instead of re-parsing text.
+
+Schema:
+    products(id, code, name, countries, ingredients_text)
+    ingredients(id, name, frequency)                  frequency is NULL when not counted
+    product_ingredients(product_id, position, ingredient_id)
+    ingredients_fts(name)                             FTS5, external content on ingredients
+    flag_labels(bit, kind, label)                     bit positions of the diet and allergen masks
+    product_flags(code, has_ingredients, diet_mask, allergen_mask, flags)
+                                                      flags is the restriction matcher's JSON record
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import logging
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_FILE = 'ingredients.sqlite'
+
+# Rows per executemany call during bulk loads
+BULK_BATCH_SIZE = 10000
+
+SCHEMA = """
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY,
+        code TEXT NOT NULL,
+        name TEXT,
+        countries TEXT,
+        ingredients_text TEXT
+    );
+    CREATE TABLE ingredients (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        frequency INTEGER
+    );
+    CREATE TABLE product_ingredients (
+        product_id INTEGER NOT NULL REFERENCES products (id),
+        position INTEGER NOT NULL,
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+        PRIMARY KEY (product_id, position)
+    ) WITHOUT ROWID;
+    CREATE VIRTUAL TABLE ingredients_fts USING fts5 (name, content='ingredients', content_rowid='id');
+"""
+
+# Created after the bulk load, which is much faster than maintaining them row by row
+INDEXES = """
+    CREATE UNIQUE INDEX products_code ON products (code);
+    CREATE INDEX product_ingredients_ingredient ON product_ingredients (ingredient_id, product_id);
+    CREATE INDEX ingredients_frequency ON ingredients (frequency DESC);
+"""
+
+# Replaced as a whole, in one transaction, by each restriction scan
+PRODUCT_FLAGS_SCHEMA = (
+    'DROP TABLE IF EXISTS product_flags',
+    'DROP TABLE IF EXISTS flag_labels',
+    'CREATE TABLE flag_labels (bit INTEGER NOT NULL, kind TEXT NOT NULL, label TEXT NOT NULL, PRIMARY KEY (kind, bit))',
+    '''CREATE TABLE product_flags (
+        code TEXT PRIMARY KEY,
+        has_ingredients INTEGER NOT NULL,
+        diet_mask INTEGER NOT NULL,
+        allergen_mask INTEGER NOT NULL,
+        flags TEXT NOT NULL
+    ) WITHOUT ROWID'''
+)
+
+# (code, name, countries, ingredients_text, ingredients)
+ProductRecord = Tuple[str, Optional[str], Optional[str], Optional[str], List[str]]
+
+class IngredientDatabase:
+    """Builds and queries the ingredient database."""
+
+    def __init__(self, filename: str = DEFAULT_DATABASE_FILE):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.ingredient_ids: Dict[str, int] = {}
+
+    @classmethod
+    @contextmanager
+    def build(cls, filename: str = DEFAULT_DATABASE_FILE) -> Iterator['IngredientDatabase']:
+        """Bulk-build a new database in a temporary file that replaces filename only once complete.
+
+        Readers of an existing database never see a half-built one, and a failed
+        build leaves it untouched.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.ingredients-', suffix='.sqlite')
+        os.close(fd)
+        database = cls(temp_path)
+        try:
+            # Durability doesn't matter until the file is complete
+            database.connection.execute('PRAGMA journal_mode=OFF')
+            database.connection.execute('PRAGMA synchronous=OFF')
+            database.connection.executescript(SCHEMA)
+            database.connection.execute('BEGIN')
+            yield database
+            database.finish()
+            database.close()
+            # mkstemp creates the file private to its owner; the database is meant to be shared
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, filename)
+            database.filename = filename
+        except BaseException:
+            database.close()
+            os.unlink(temp_path)
+            raise
+
+    def add_ingredients(self, frequencies: Iterable[Tuple[str, Optional[int]]]) -> None:
+        """Insert ingredients with their frequencies (None when not counted)."""
+        cursor = self.connection.cursor()
+        iterator = iter(frequencies)
+        while True:
+            batch = list(islice(iterator, BULK_BATCH_SIZE))
+            if not batch:
+                break
+            cursor.executemany('INSERT INTO ingredients (name, frequency) VALUES (?, ?)', batch)
+        self.ingredient_ids = dict(self.connection.execute('SELECT name, id FROM ingredients'))
+
+    def add_products(self, products: Iterable[ProductRecord]) -> int:
+        """Insert products and link their ingredients that are in the ingredients table. Returns the product count.
+
+        A repeated code keeps its first product, as in the dump.
+        """
+        cursor = self.connection.cursor()
+        next_id = (self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM products').fetchone()[0]) + 1
+        seen_codes = set(code for (code,) in self.connection.execute('SELECT code FROM products'))
+        ingredient_ids = self.ingredient_ids
+        product_rows = []
+        link_rows = []
+        count = 0
+
+        def flush() -> None:
+            cursor.executemany('INSERT INTO products (id, code, name, countries, ingredients_text) VALUES (?, ?, ?, ?, ?)',
+                               product_rows)
+            cursor.executemany('INSERT INTO product_ingredients (product_id, position, ingredient_id) VALUES (?, ?, ?)',
+                               link_rows)
+            product_rows.clear()
+            link_rows.clear()
+
+        for code, name, countries, ingredients_text, ingredients in products:
+            if code in seen_codes:
+                continue
+            seen_codes.add(code)
+
+            product_id = next_id
+            next_id += 1
+            count += 1
+            product_rows.append((product_id, code, name, countries, ingredients_text))
+            position = 0
+            for ingredient in ingredients:
+                ingredient_id = ingredient_ids.get(ingredient)
+                if ingredient_id is not None:
+                    link_rows.append((product_id, position, ingredient_id))
+                    position += 1
+
+            if len(product_rows) >= BULK_BATCH_SIZE:
+                flush()
+
+        flush()
+        return count
+
+    def finish(self) -> None:
+        """Create the secondary indexes, build the full-text index and commit."""
+        self.connection.executescript(INDEXES)
+        self.connection.execute("INSERT INTO ingredients_fts (ingredients_fts) VALUES ('rebuild')")
+        self.connection.execute('ANALYZE')
+        self.connection.commit()
+
+    def replace_product_flags(self, diets: List[str], allergens: List[str], records: Iterable[Dict]) -> int:
+        """Replace the per-product restriction flags with records from RestrictionMatcher.product_flags.
+
+        Bit i of diet_mask (allergen_mask) is set when the product violates diets[i]
+        (contains allergens[i]). Readers see the old flags until the new ones are
+        committed. Returns the product count; a repeated code keeps its first record.
+        """
+        diet_bits = {diet: 1 << bit for bit, diet in enumerate(diets)}
+        allergen_bits = {allergen: 1 << bit for bit, allergen in enumerate(allergens)}
+        connection = self.connection
+        connection.execute('BEGIN')
+        try:
+            for statement in PRODUCT_FLAGS_SCHEMA:
+                connection.execute(statement)
+            connection.executemany('INSERT INTO flag_labels (bit, kind, label) VALUES (?, ?, ?)',
+                                   [(bit, 'diet', diet) for bit, diet in enumerate(diets)]
+                                   + [(bit, 'allergen', allergen) for bit, allergen in enumerate(allergens)])
+            rows = ((record['code'], int(record['has_ingredients']),
+                     sum(diet_bits.get(diet, 0) for diet in record['diets']),
+                     sum(allergen_bits.get(allergen, 0) for allergen in record['allergens']),
+                     json.dumps(record, ensure_ascii=False)) for record in records)
+            count = 0
+            while True:
+                batch = list(islice(rows, BULK_BATCH_SIZE))
+                if not batch:
+                    break
+                count += connection.executemany('INSERT OR IGNORE INTO product_flags '
+                                                '(code, has_ingredients, diet_mask, allergen_mask, flags) '
+                                                'VALUES (?, ?, ?, ?, ?)', batch).rowcount
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return count
+
+    def product_flags(self, code: str) -> Optional[Dict]:
+        """Restriction flags of a product, or None when it wasn't scanned."""
+        row = self.connection.execute('SELECT flags FROM product_flags WHERE code = ?', (code,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def search_ingredients(self, query: str, limit: int = 20) -> List[Tuple[str, Optional[int]]]:
+        """Full-text search of ingredient names (FTS5 syntax, e.g. 'milk' or 'soy*'), most frequent first."""
+        return self.connection.execute(
+            'SELECT i.name, i.frequency FROM ingredients_fts f JOIN ingredients i ON i.id = f.rowid '
+            'WHERE ingredients_fts MATCH ? ORDER BY i.frequency DESC, i.name LIMIT ?', (query, limit)
+        ).fetchall()
+
+    def product_ingredients(self, code: str) -> List[str]:
+        """Normalized ingredients of a product in label order."""
+        return [name for (name,) in self.connection.execute(
+            'SELECT i.name FROM products p JOIN product_ingredients pi ON pi.product_id = p.id '
+            'JOIN ingredients i ON i.id = pi.ingredient_id WHERE p.code = ? ORDER BY pi.position', (code,)
+        )]
+
+    def products_with_ingredient(self, ingredient: str, limit: int = 100) -> List[str]:
+        """Codes of products listing an ingredient."""
+        return [code for (code,) in self.connection.execute(
+            'SELECT DISTINCT p.code FROM ingredients i JOIN product_ingredients pi ON pi.ingredient_id = i.id '
+            'JOIN products p ON p.id = pi.product_id WHERE i.name = ? LIMIT ?', (ingredient, limit)
+        )]
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Shared Ingredient Tokenizer
+
+Precompiled, single-pass tokenization of OpenFoodFacts ingredients_text used by the extraction scripts.
+"""
+
+import re
+from typing import List
+
+# Splits text into alternating [outside, inside, outside, ...] parts around parentheses
+PARENTHESES_SPLIT = re.compile(r'\(([^)]*)\)')
+
+# Parentheses that do not span a comma, i.e. parentheses inside a single comma-separated ingredient
+PARENTHESES_WITHIN_INGREDIENT = re.compile(r'\([^),]*\)')
+
+# Everything except letters and whitespace, optionally keeping the ingredient separators
+NON_LETTER = re.compile(r'[^a-zA-Z\s]+')
+NON_LETTER_WITH_SEPARATORS = re.compile(r'[^a-zA-Z\s,;]+')
+NON_LETTER_WITH_COMMAS = re.compile(r'[^a-zA-Z\s,]+')
+
+MIN_INGREDIENT_LENGTH = 3
+
+def tokenize_with_parentheses(ingredients_text: str) -> List[str]:
+    """Extract ingredients, moving parentheses content to the end and adding the words of each phrase."""
+    if not ingredients_text:
+        return []
+
+    # One pass separates the text outside parentheses from the content inside them
+    parts = PARENTHESES_SPLIT.split(ingredients_text)
+    all_text = ''.join(parts[0::2])
+    for content in parts[1::2]:
+        if content:
+            all_text += ', ' + content
+
+    # Strip non-letters and lowercase the whole text once instead of per ingredient
+    all_text = NON_LETTER_WITH_SEPARATORS.sub('', all_text).lower().replace(';', ',')
+
+    clean_ingredients = []
+    append = clean_ingredients.append
+    for ingredient in all_text.split(','):
+        words = ingredient.split()
+        if not words:
+            continue
+
+        if len(words) == 1:
+            if len(words[0]) >= MIN_INGREDIENT_LENGTH:
+                append(words[0])
+            continue
+
+        # Keep the full phrase, plus its individual meaningful words
+        append(' '.join(words))
+        for word in words:
+            if len(word) >= MIN_INGREDIENT_LENGTH:
+                append(word)
+
+    return clean_ingredients
+
+def tokenize_without_parentheses(ingredients_text: str) -> List[str]:
+    """Extract comma-separated ingredients, dropping anything in parentheses."""
+    if not ingredients_text:
+        return []
+
+    all_text = PARENTHESES_WITHIN_INGREDIENT.sub('', ingredients_text)
+    all_text = NON_LETTER_WITH_COMMAS.sub('', all_text).lower()
+
+    clean_ingredients = []
+    append = clean_ingredients.append
+    for ingredient in all_text.split(','):
+        words = ingredient.split()
+        if not words:
+            continue
+
+        cleaned = words[0] if len(words) == 1 else ' '.join(words)
+        if len(cleaned) >= MIN_INGREDIENT_LENGTH:
+            append(cleaned)
+
+    return clean_ingredients
+
+def clean_ingredient(ingredient: str) -> str:
+    """Clean a single ingredient to lowercase letters and single spaces."""
+    return ' '.join(NON_LETTER.sub('', ingredient).split()).lower()
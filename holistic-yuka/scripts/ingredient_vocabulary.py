@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Interned Ingredient Vocabulary
+
+Maps each distinct ingredient to an integer ID, with its count in a flat array, and
+stores per-product ingredient lists as compact ID arrays. The vocabulary is saved as
+one binary file that MappedVocabulary memory-maps, so downstream tools get lookups,
+top ingredients and product lists without parsing the CSV outputs.
+
+File layout (little-endian, sections 8-byte aligned):
+    header       magic, version, ingredient and product counts, section (offset, size) table
+    names        UTF-8 ingredient names back to back; name_offsets uint64[n + 1]
+    counts       int64[n]
+    by_name      uint32[n] IDs in name order, for binary search
+    by_count     uint32[n] IDs by descending count
+    codes        product codes back to back; code_offsets uint64[p + 1]
+    products     uint64[p + 1] offsets into product_ids uint32[], one ID list per product
+    by_code      uint32[p] product indices in code order, for binary search
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import logging
+from array import array
+from typing import Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VOCABULARY_FILE = 'ingredients.vocab'
+
+MAGIC = b'OFFVOCAB'
+VERSION = 1
+
+SECTIONS = ('names', 'name_offsets', 'counts', 'by_name', 'by_count',
+            'codes', 'code_offsets', 'product_offsets', 'product_ids', 'by_code')
+
+# magic, version, reserved, ingredient count, product count, then (offset, size) per section
+HEADER = struct.Struct('<8sIIQQ' + 'QQ' * len(SECTIONS))
+
+# Array type codes of the fixed-width sections
+SECTION_TYPES = {'name_offsets': 'Q', 'counts': 'q', 'by_name': 'I', 'by_count': 'I',
+                 'code_offsets': 'Q', 'product_offsets': 'Q', 'product_ids': 'I', 'by_code': 'I'}
+
+if array('I').itemsize != 4 or array('Q').itemsize != 8:
+    raise ImportError("ingredient_vocabulary needs 4-byte 'I' and 8-byte 'Q' arrays")
+
+def _pack_strings(strings: Sequence[str]) -> Tuple[bytes, array]:
+    """UTF-8 blob of strings back to back, with their n + 1 offsets."""
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = array('Q', [0])
+    position = 0
+    for data in encoded:
+        position += len(data)
+        offsets.append(position)
+    return b''.join(encoded), offsets
+
+def _little_endian(values: array) -> bytes:
+    """Bytes of an array in the file's byte order."""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+class IngredientVocabulary:
+    """In-memory vocabulary: interned names, integer IDs and an array of counts."""
+
+    def __init__(self):
+        self.ids: dict = {}
+        self.names: List[str] = []
+        self.counts = array('q')
+
+    @classmethod
+    def from_counts(cls, counts: Mapping[str, int]) -> 'IngredientVocabulary':
+        """Vocabulary of a Counter or mapping, with IDs in most common order when it has most_common."""
+        vocabulary = cls()
+        items = counts.most_common() if hasattr(counts, 'most_common') else counts.items()
+        for name, count in items:
+            vocabulary.add(name, count)
+        return vocabulary
+
+    def intern(self, name: str) -> int:
+        """ID of name, adding it with a zero count if new."""
+        ingredient_id = self.ids.get(name)
+        if ingredient_id is None:
+            ingredient_id = self.ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+            self.counts.append(0)
+        return ingredient_id
+
+    def add(self, name: str, count: int = 1) -> int:
+        """Add count occurrences of name. Returns its ID."""
+        ingredient_id = self.intern(name)
+        self.counts[ingredient_id] += count
+        return ingredient_id
+
+    def update(self, ingredients: Union[Iterable[str], Mapping[str, int]]) -> None:
+        """Count ingredients from an iterable, or add the counts of a mapping, like Counter.update."""
+        if isinstance(ingredients, Mapping):
+            for name, count in ingredients.items():
+                self.add(name, count)
+        else:
+            for name in ingredients:
+                self.add(name)
+
+    def encode(self, ingredients: Iterable[str], add: bool = False) -> array:
+        """ID array of ingredients; unknown ones are skipped unless add is set."""
+        if add:
+            return array('I', [self.intern(name) for name in ingredients])
+        ids = self.ids
+        return array('I', [ids[name] for name in ingredients if name in ids])
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        """Names of an ID array."""
+        names = self.names
+        return [names[ingredient_id] for ingredient_id in ids]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def __getitem__(self, name: str) -> int:
+        ingredient_id = self.ids.get(name)
+        return self.counts[ingredient_id] if ingredient_id is not None else 0
+
+    def most_common(self, n: int = None) -> List[Tuple[str, int]]:
+        """(name, count) pairs by descending count, ties in ID order like Counter."""
+        order = sorted(range(len(self.names)), key=lambda ingredient_id: -self.counts[ingredient_id])
+        return [(self.names[ingredient_id], self.counts[ingredient_id]) for ingredient_id in order[:n]]
+
+    def save(self, filename: str, products: Iterable[Tuple[str, Iterable[str]]] = ()) -> int:
+        """Write the vocabulary and the (code, ingredients) lists of products to a binary file.
+
+        Ingredients not in the vocabulary are left out of the product lists and a
+        repeated code keeps its first list. The file is replaced atomically. Returns
+        the product count.
+        """
+        codes: List[str] = []
+        seen_codes = set()
+        product_offsets = array('Q', [0])
+        product_ids = array('I')
+        for code, ingredients in products:
+            if code in seen_codes:
+                continue
+            seen_codes.add(code)
+            codes.append(code)
+            product_ids.extend(self.encode(ingredients))
+            product_offsets.append(len(product_ids))
+
+        names_blob, name_offsets = _pack_strings(self.names)
+        codes_blob, code_offsets = _pack_strings(codes)
+        counts = self.counts
+        sections = {
+            'names': names_blob,
+            'name_offsets': _little_endian(name_offsets),
+            'counts': _little_endian(counts),
+            'by_name': _little_endian(array('I', sorted(range(len(self.names)), key=self.names.__getitem__))),
+            'by_count': _little_endian(array('I', sorted(range(len(counts)), key=lambda i: -counts[i]))),
+            'codes': codes_blob,
+            'code_offsets': _little_endian(code_offsets),
+            'product_offsets': _little_endian(product_offsets),
+            'product_ids': _little_endian(product_ids),
+            'by_code': _little_endian(array('I', sorted(range(len(codes)), key=codes.__getitem__)))
+        }
+
+        table = []
+        position = HEADER.size
+        for name in SECTIONS:
+            position += -position % 8
+            table += [position, len(sections[name])]
+            position += len(sections[name])
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.vocabulary-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, len(self.names), len(codes), *table))
+                for name, offset in zip(SECTIONS, table[0::2]):
+                    f.write(b'\0' * (offset - f.tell()))
+                    f.write(sections[name])
+            # mkstemp creates the file private to its owner; the vocabulary is meant to be shared
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, filename)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return len(codes)
+
+class MappedVocabulary:
+    """Read-only, memory-mapped view of a saved vocabulary; opening it parses nothing."""
+
+    def __init__(self, filename: str = DEFAULT_VOCABULARY_FILE):
+        if sys.byteorder != 'little':
+            raise ValueError("Mapped vocabularies need a little-endian host")
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) < HEADER.size:
+            self.close()
+            raise ValueError(f"{filename} is not an ingredient vocabulary")
+
+        magic, version, _, self.ingredient_count, self.product_count, *table = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{filename} is not a version {VERSION} ingredient vocabulary")
+
+        buffer = memoryview(self.mmap)
+        self.views = {}
+        for name, offset, size in zip(SECTIONS, table[0::2], table[1::2]):
+            view = buffer[offset:offset + size]
+            self.views[name] = view.cast(SECTION_TYPES[name]) if name in SECTION_TYPES else view
+        buffer.release()
+
+    def __len__(self) -> int:
+        return self.ingredient_count
+
+    def name(self, ingredient_id: int) -> str:
+        """Name of an ingredient ID."""
+        offsets = self.views['name_offsets']
+        return bytes(self.views['names'][offsets[ingredient_id]:offsets[ingredient_id + 1]]).decode('utf-8')
+
+    def count(self, ingredient_id: int) -> int:
+        """Count of an ingredient ID."""
+        return self.views['counts'][ingredient_id]
+
+    def _search(self, key: str, order: memoryview, blob: str, offsets: str) -> Optional[int]:
+        """Binary search for key among the strings of a blob, visited in the given sorted order."""
+        target = key.encode('utf-8')
+        data = self.views[blob]
+        offsets = self.views[offsets]
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            index = order[middle]
+            candidate = bytes(data[offsets[index]:offsets[index + 1]])
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return index
+        return None
+
+    def id(self, name: str) -> Optional[int]:
+        """ID of an ingredient, or None if it isn't in the vocabulary."""
+        return self._search(name, self.views['by_name'], 'names', 'name_offsets')
+
+    def __contains__(self, name: str) -> bool:
+        return self.id(name) is not None
+
+    def __getitem__(self, name: str) -> int:
+        ingredient_id = self.id(name)
+        return self.count(ingredient_id) if ingredient_id is not None else 0
+
+    def most_common(self, n: int = None) -> List[Tuple[str, int]]:
+        """(name, count) pairs by descending count."""
+        by_count = self.views['by_count']
+        limit = len(by_count) if n is None else min(n, len(by_count))
+        return [(self.name(by_count[rank]), self.count(by_count[rank])) for rank in range(limit)]
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.name(ingredient_id) for ingredient_id in range(self.ingredient_count))
+
+    def product_ids(self, code: str) -> Optional[array]:
+        """Ingredient ID array of a product, or None if the code isn't in the file."""
+        index = self._search(code, self.views['by_code'], 'codes', 'code_offsets')
+        if index is None:
+            return None
+        offsets = self.views['product_offsets']
+        # A copy, so no view of the map outlives close()
+        return array('I', self.views['product_ids'][offsets[index]:offsets[index + 1]].tobytes())
+
+    def product_ingredients(self, code: str) -> Optional[List[str]]:
+        """Ingredients of a product in label order, or None if the code isn't in the file."""
+        ids = self.product_ids(code)
+        return [self.name(ingredient_id) for ingredient_id in ids] if ids is not None else None
+
+    def close(self) -> None:
+        """Release the views and unmap the file."""
+        for view in getattr(self, 'views', {}).values():
+            view.release()
+        self.views = {}
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self) -> 'MappedVocabulary':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
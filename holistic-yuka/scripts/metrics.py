@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Metrics and Profiling
+
+Small instrumentation layer shared by the scripts: counters, gauges and histograms
+(HTTP latency, phase timings), exported as periodic JSON snapshots or a Prometheus
+text file, plus an optional cProfile or tracemalloc wrapper around a whole run.
+"""
+
+import argparse
+import bisect
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds, from fast cached responses to slow retries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+PROFILE_MODES = ('cpu', 'memory')
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None where it can't be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics (cumulative buckets, sum and count)."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Record one value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within its bucket, as Prometheus' histogram_quantile does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def cumulative_buckets(self) -> List[tuple]:
+        """(upper bound, cumulative count) pairs ending with +Inf."""
+        result = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + [float('inf')], self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        """Count, sum, mean and estimated percentiles."""
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 6) if value is not None else None
+
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': rounded(self.sum / self.count if self.count else None),
+            'p50': rounded(self.quantile(0.50)),
+            'p95': rounded(self.quantile(0.95)),
+            'p99': rounded(self.quantile(0.99))
+        }
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """Add value to a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_counter(self, name: str, value: float) -> None:
+        """Set a counter to a running total kept elsewhere, e.g. rows counted by a hot loop."""
+        with self.lock:
+            self.counters[name] = value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Set a gauge."""
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Record a value in a histogram, creating it with buckets on first use."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Record the duration of the block in seconds in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Point-in-time view of every metric, with per-second rates for the counters."""
+        now = time.time()
+        uptime = max(now - self.started, 1e-9)
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now)),
+            'uptime_seconds': round(uptime, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'counters': counters,
+            'rates_per_second': {name: round(value / uptime, 3) for name, value in counters.items()},
+            'gauges': gauges,
+            'histograms': histograms
+        }
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines += [f'# TYPE {name} counter', f'{name} {value}']
+            for name, value in sorted(self.gauges.items()):
+                lines += [f'# TYPE {name} gauge', f'{name} {value}']
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for bound, cumulative in histogram.cumulative_buckets():
+                    label = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{le="{label}"}} {cumulative}')
+                lines += [f'{name}_sum {histogram.sum}', f'{name}_count {histogram.count}']
+
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines += ['# TYPE process_peak_rss_bytes gauge', f'process_peak_rss_bytes {int(rss * 1024 * 1024)}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename: str) -> None:
+        """Export the metrics to filename.
+
+        A .prom file is replaced atomically with the Prometheus text (for node_exporter's
+        textfile collector); any other file gets one JSON snapshot appended per call.
+        """
+        if filename.endswith('.prom'):
+            directory = os.path.dirname(os.path.abspath(filename))
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(self.to_prometheus())
+                os.replace(temp_path, filename)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        else:
+            with open(filename, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.snapshot()) + '\n')
+
+class MetricsReporter:
+    """Background thread exporting metrics every interval seconds, and once more when stopped."""
+
+    def __init__(self, metrics: Metrics, filename: str, interval: float = 30.0):
+        self.metrics = metrics
+        self.filename = filename
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='metrics-reporter', daemon=True)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self) -> None:
+        """Write one export, logging rather than raising on I/O errors."""
+        try:
+            self.metrics.write(self.filename)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {self.filename}: {e}")
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and write the final export."""
+        self.stopped.set()
+        self.thread.join()
+        self.export()
+
+@contextmanager
+def profiled(mode: Optional[str], top: int = 25, output: str = None) -> Iterator[None]:
+    """Run the block under cProfile ('cpu') or tracemalloc ('memory') and log the top hot spots.
+
+    With output, the cProfile stats (for pstats or snakeviz) or the tracemalloc report
+    is also written to that file. A mode of None profiles nothing.
+    """
+    if mode is None:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+
+    if mode == 'cpu':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top)
+            logger.info(f"CPU profile, top {top} by cumulative time:\n{report.getvalue()}")
+            if output:
+                profiler.dump_stats(output)
+                logger.info(f"Saved CPU profile to {output}")
+        return
+
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        tracemalloc.stop()
+        report = '\n'.join(str(statistic) for statistic in statistics)
+        logger.info(f"Memory profile: {current / 1024 / 1024:.1f} MB live, {peak / 1024 / 1024:.1f} MB peak traced; "
+                    f"top {top} allocation sites:\n{report}")
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                f.write(report + '\n')
+            logger.info(f"Saved memory profile to {output}")
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the shared metrics and profiling command line options to a script's parser."""
+    parser.add_argument('--metrics',
+                       help='Export metrics to this file: Prometheus text if it ends in .prom, else appended JSON snapshots')
+    parser.add_argument('--metrics-interval', type=float, default=30,
+                       help='Seconds between metrics exports (default: 30)')
+    parser.add_argument('--profile', choices=PROFILE_MODES,
+                       help='Profile the run with cProfile (cpu) or tracemalloc (memory) and log the top hot spots')
+    parser.add_argument('--profile-top', type=int, default=25,
+                       help='Hot spots to report when profiling (default: 25)')
+    parser.add_argument('--profile-output',
+                       help='Also save the profile to this file (cProfile stats or the tracemalloc report)')
+
+@contextmanager
+def instrumented(args: argparse.Namespace, metrics: Metrics) -> Iterator[None]:
+    """Export metrics periodically and profile the block, as configured by add_metrics_arguments."""
+    reporter = MetricsReporter(metrics, args.metrics, args.metrics_interval) if args.metrics else None
+    if reporter:
+        reporter.start()
+    try:
+        with profiled(args.profile, args.profile_top, args.profile_output):
+            yield
+    finally:
+        if reporter:
+            reporter.stop()
+            logger.info(f"Saved metrics to {args.metrics}")
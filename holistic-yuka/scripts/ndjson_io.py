@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+NDJSON Files
+
+Streaming newline-delimited JSON writer and lazy reader, with compression picked from the
+file extension (.gz, .bz2, .xz, or .zst when the zstandard package is installed).
+"""
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+from typing import Any, IO, Iterator
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz', '.zst')
+
+# Decompressed bytes requested from the codec per read
+READ_BUFFER_SIZE = 1 << 20
+
+def strip_compression_extension(filename: str) -> str:
+    """Filename without a trailing compression extension, e.g. products.tsv for products.tsv.gz."""
+    for extension in COMPRESSED_EXTENSIONS:
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+def is_compressed_filename(filename: str) -> bool:
+    """True if the extension names one of the supported compression codecs."""
+    return filename.endswith(COMPRESSED_EXTENSIONS)
+
+def is_ndjson_filename(filename: str) -> bool:
+    """True for names like products.ndjson, products.jsonl or products.ndjson.gz."""
+    return strip_compression_extension(filename).endswith(NDJSON_EXTENSIONS)
+
+def _open_zstandard(filename: str, mode: str) -> IO[bytes]:
+    """Open a .zst file as a binary stream, reading across concatenated frames. mode is binary ('rb', 'wb' or 'ab')."""
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading or writing .zst files requires the zstandard package") from None
+    raw = open(filename, mode)
+    if 'r' in mode:
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+    return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+
+def open_compressed(filename: str, mode: str = 'rt', buffer_size: int = READ_BUFFER_SIZE) -> IO:
+    """Open a possibly compressed file in text mode ('rt', 'wt' or 'at'), choosing the codec by extension.
+
+    Reads go through a buffer_size buffer so the codec decompresses large blocks
+    instead of the text layer's small default chunks.
+    """
+    if not is_compressed_filename(filename):
+        return open(filename, mode, encoding='utf-8', buffering=buffer_size)
+
+    binary_mode = mode.replace('t', '') + ('b' if 'b' not in mode else '')
+    if filename.endswith('.gz'):
+        stream = gzip.open(filename, binary_mode)
+    elif filename.endswith('.bz2'):
+        stream = bz2.open(filename, binary_mode)
+    elif filename.endswith('.xz'):
+        stream = lzma.open(filename, binary_mode)
+    else:
+        stream = _open_zstandard(filename, binary_mode)
+
+    if 'r' in mode:
+        stream = io.BufferedReader(stream, buffer_size=buffer_size)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+class NDJSONWriter:
+    """Append one JSON document per line to a (possibly compressed) file."""
+
+    def __init__(self, filename: str, append: bool = False):
+        self.filename = filename
+        self.file = open_compressed(filename, 'at' if append else 'wt')
+        self.count = 0
+
+    def write(self, record: Any) -> None:
+        """Serialize and write one record."""
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write('\n')
+        self.count += 1
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        self.file.close()
+
+    def __enter__(self) -> 'NDJSONWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def iter_ndjson(filename: str) -> Iterator[Any]:
+    """Lazily yield the records of a (possibly compressed) NDJSON file, one line at a time."""
+    with open_compressed(filename, 'rt') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
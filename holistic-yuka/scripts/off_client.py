@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+OpenFoodFacts HTTP Client
+
+Shared HTTP layer for the OpenFoodFacts scripts: one pooled keep-alive session, gzip,
+exponential backoff with jitter on 429/5xx and connection errors, latency metrics
+(optionally exported through a metrics.Metrics registry), optional rate limiting and
+an optional on-disk response cache.
+"""
+
+import argparse
+import random
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from concurrent_fetch import TokenBucket
+from metrics import Metrics
+from response_cache import DEFAULT_CACHE_FILE, ResponseCache
+
+logger = logging.getLogger(__name__)
+
+SEARCH_URL = "https://world.openfoodfacts.org/cgi/search.pl"
+
+# OpenFoodFacts asks API clients to identify themselves
+USER_AGENT = "HolisticYuka-Scripts/1.0 (https://github.com/Hokann/buddy-challenge-app)"
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Product fields the scripts request from the API and serve from the local lookup index
+PRODUCT_FIELDS = ('code', 'product_name', 'product_name_en', 'ingredients_text', 'ingredients_text_en', 'brands',
+                  'categories', 'nutriscore_grade', 'nova_group', 'traces', 'traces_tags', 'allergens',
+                  'allergens_tags', 'allergens_from_ingredients', 'allergens_from_user')
+
+class OpenFoodFactsClient:
+    def __init__(self, pool_size: int = 10, max_retries: int = 4, backoff_base: float = 0.5,
+                 backoff_max: float = 30.0, timeout: float = 30.0, cache: ResponseCache = None,
+                 offline: bool = False):
+        self.cache = cache
+        self.offline = offline
+        self.limiter: Optional[TokenBucket] = None
+        self.metrics: Optional[Metrics] = None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.latencies: List[float] = []
+        self.request_count = 0
+        self.retry_count = 0
+        self.error_count = 0
+        self.metrics_lock = threading.Lock()
+
+    def backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before retry number attempt: Retry-After if given, else full-jitter exponential backoff."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def record_request(self, latency: float, retried: bool, failed: bool) -> None:
+        """Record the latency and outcome of one HTTP attempt."""
+        with self.metrics_lock:
+            self.latencies.append(latency)
+            self.request_count += 1
+            self.retry_count += retried
+            self.error_count += failed
+
+        if self.metrics:
+            self.metrics.observe('http_request_duration_seconds', latency)
+            self.metrics.inc('http_requests_total')
+            if retried:
+                self.metrics.inc('http_retries_total')
+            if failed:
+                self.metrics.inc('http_errors_total')
+
+    def cached_response(self, url: str, params: Dict[str, Any] = None) -> Optional[requests.Response]:
+        """Build a response from the cache, or None on a miss."""
+        cached = self.cache.get(url, params) if self.cache else None
+        if cached is None:
+            return None
+
+        body, content_type = cached
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers = CaseInsensitiveDict({'Content-Type': content_type or 'application/json', 'X-Cache': 'HIT'})
+        response.url = url
+        response.encoding = 'utf-8'
+        return response
+
+    def get(self, url: str, params: Dict[str, Any] = None) -> requests.Response:
+        """GET url, retrying 429/5xx and connection errors. Raises requests.exceptions.RequestException when retries run out.
+
+        Fresh cached responses are returned without touching the network or the rate
+        limiter; in offline mode a cache miss raises requests.exceptions.ConnectionError.
+        """
+        response = self.cached_response(url, params)
+        if response is not None:
+            if self.metrics:
+                self.metrics.inc('http_cache_hits_total')
+            return response
+        if self.offline:
+            raise requests.exceptions.ConnectionError(f"{url} is not cached and offline mode is enabled")
+
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                will_retry = attempt < self.max_retries
+                self.record_request(time.perf_counter() - start, will_retry, True)
+                if not will_retry:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Request to {url} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            else:
+                retryable = response.status_code in RETRY_STATUS_CODES
+                will_retry = retryable and attempt < self.max_retries
+                self.record_request(time.perf_counter() - start, will_retry, not response.ok)
+                if not will_retry:
+                    response.raise_for_status()
+                    if self.cache:
+                        self.cache.put(url, params, response.content, response.headers.get('Content-Type'))
+                    return response
+                delay = self.backoff_delay(attempt, response)
+                logger.warning(f"Request to {url} returned {response.status_code}, retrying in {delay:.2f}s")
+
+            attempt += 1
+            time.sleep(delay)
+
+    def get_json(self, url: str, params: Dict[str, Any] = None) -> Any:
+        """GET url and decode the JSON body. Raises ValueError if the body isn't JSON."""
+        return self.get(url, params).json()
+
+    def latency_summary(self) -> Dict[str, Any]:
+        """Summarize request count, retries, errors and latency percentiles in milliseconds."""
+        with self.metrics_lock:
+            latencies = sorted(self.latencies)
+            summary = {
+                'requests': self.request_count,
+                'retries': self.retry_count,
+                'errors': self.error_count
+            }
+
+        if self.cache:
+            summary.update({'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses})
+
+        if latencies:
+            def percentile(p: float) -> float:
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+            summary.update({
+                'latency_mean_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                'latency_p50_ms': percentile(0.50),
+                'latency_p95_ms': percentile(0.95),
+                'latency_p99_ms': percentile(0.99),
+                'latency_max_ms': round(latencies[-1] * 1000, 1)
+            })
+        return summary
+
+    def close(self) -> None:
+        """Close the pooled connections and the cache."""
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+def add_client_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the shared HTTP cache command line options to a script's parser."""
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_FILE,
+                       help=f'Cache responses in this SQLite file (default file: {DEFAULT_CACHE_FILE})')
+    parser.add_argument('--cache-ttl', type=float, default=86400,
+                       help='Seconds before a cached response expires, 0 for never (default: 86400)')
+    parser.add_argument('--cache-max-mb', type=float, default=512,
+                       help='Maximum compressed cache size in MB (default: 512)')
+    parser.add_argument('--offline', action='store_true',
+                       help='Serve responses only from the cache, of any age, implies --cache')
+
+def client_from_args(args: argparse.Namespace, pool_size: int = 10) -> OpenFoodFactsClient:
+    """Create a client configured from the options added by add_client_arguments."""
+    cache_file = args.cache or (DEFAULT_CACHE_FILE if args.offline else None)
+    # Offline, an expired response is the only copy there is: don't skip or evict it by age
+    ttl = 0 if args.offline else args.cache_ttl
+    cache = ResponseCache(cache_file, ttl=ttl, max_bytes=int(args.cache_max_mb * 1024 * 1024)) if cache_file else None
+    return OpenFoodFactsClient(pool_size=pool_size, cache=cache, offline=args.offline)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Staged Pipeline With Artifact Caching
+
+Runs a DAG of stages, each a function that writes its output files into a directory
+from the output directories of the stages it depends on and a dict of parameters.
+Every output is cached under cache_dir/<stage>/<key>, where the key hashes the stage
+name and version, its parameters and the content digests of its inputs; a stage whose
+key is already cached is skipped. Because keys follow input content, not upstream keys,
+an upstream stage that reruns but produces identical files doesn't invalidate the
+stages after it. Stages whose inputs are ready run in parallel worker processes.
+
+Artifact directory:
+    <output files>    written by the stage
+    manifest.json     stage, key, digest, parameters, input digests, run time and stats
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '.pipeline-cache'
+MANIFEST_FILE = 'manifest.json'
+
+# Bytes read at a time when hashing files
+HASH_BLOCK_SIZE = 1 << 20
+
+# Stage functions take (input directories by stage name, parameters, output directory)
+# and may return a dict of statistics to record in the manifest
+StageFunction = Callable[[Dict[str, str], Dict[str, Any], str], Optional[Dict[str, Any]]]
+
+def file_digest(filename: str) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_fingerprint(filename: str) -> Dict[str, Any]:
+    """Path, size and modification time of a file: a cheap stand-in for its digest when it is too large to hash on every run."""
+    stat = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def directory_digest(directory: str) -> str:
+    """Digest of the files of an artifact directory, other than the manifest.
+
+    A symlink counts by its target's fingerprint rather than its content, so a stage
+    can pass a large external file on without copying or hashing it.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name == MANIFEST_FILE:
+            continue
+        path = os.path.join(directory, name)
+        if os.path.islink(path):
+            entry = json.dumps(file_fingerprint(os.path.realpath(path)), sort_keys=True)
+        else:
+            entry = file_digest(path)
+        digest.update(f'{name}\0{entry}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+def stage_key(name: str, version: int, params: Dict[str, Any], input_digests: Dict[str, str]) -> str:
+    """Cache key of a stage run."""
+    description = json.dumps({'stage': name, 'version': version, 'params': params, 'inputs': input_digests},
+                             sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()[:32]
+
+class Stage:
+    """One step of a pipeline. params must be JSON-serializable; bump version when function's output changes."""
+
+    def __init__(self, name: str, function: StageFunction, inputs: Sequence[str] = (),
+                 params: Dict[str, Any] = None, version: int = 1, publish: bool = False):
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.version = version
+        # Published stages have their files copied to the run's output directory
+        self.publish = publish
+
+class Artifact:
+    """Output directory of a finished stage, with its manifest."""
+
+    def __init__(self, directory: str, manifest: Dict[str, Any], cached: bool):
+        self.directory = directory
+        self.manifest = manifest
+        self.cached = cached
+
+    @property
+    def digest(self) -> str:
+        return self.manifest['digest']
+
+    def files(self) -> List[str]:
+        """Paths of the output files."""
+        return [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory)) if name != MANIFEST_FILE]
+
+def _run_stage(function: StageFunction, inputs: Dict[str, str], params: Dict[str, Any],
+               output_dir: str) -> Optional[Dict[str, Any]]:
+    """Worker entry point: run one stage function into its output directory."""
+    return function(inputs, params, output_dir)
+
+class Pipeline:
+    """A DAG of stages run with a content-addressed artifact cache."""
+
+    def __init__(self, stages: Iterable[Stage], cache_dir: str = DEFAULT_CACHE_DIR, jobs: int = 2,
+                 metrics: Metrics = None):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in self.stages.values():
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self.metrics = metrics or Metrics()
+
+    def required(self, targets: Iterable[str] = None) -> List[str]:
+        """Names of the targets and every stage they depend on, in dependency order."""
+        order: List[str] = []
+        visiting = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in targets or self.stages:
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+            visit(name)
+        return order
+
+    def artifact_dir(self, stage: Stage, key: str) -> str:
+        return os.path.join(self.cache_dir, stage.name, key)
+
+    def cached_artifact(self, stage: Stage, key: str) -> Optional[Artifact]:
+        """The artifact of a previous run with this key, if complete."""
+        directory = self.artifact_dir(stage, key)
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return Artifact(directory, json.load(f), cached=True)
+        except (OSError, ValueError):
+            return None
+
+    def run(self, targets: Iterable[str] = None, force: Iterable[str] = ()) -> Dict[str, Artifact]:
+        """Run the targets (every stage by default) and what they depend on, skipping cached stages.
+
+        force names stages to rerun even when cached. Returns the artifact of each stage
+        run or reused; raises RuntimeError when a stage fails, after the running ones finish.
+        """
+        order = self.required(targets)
+        force = set(force)
+        artifacts: Dict[str, Artifact] = {}
+        running: Dict[Future, tuple] = {}
+        failed: List[str] = []
+
+        with ProcessPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            while True:
+                for name in order:
+                    stage = self.stages[name]
+                    if (name in artifacts or name in failed or any(job[0] == name for job in running.values())
+                            or not all(dependency in artifacts for dependency in stage.inputs)):
+                        continue
+                    input_digests = {dependency: artifacts[dependency].digest for dependency in stage.inputs}
+                    key = stage_key(name, stage.version, stage.params, input_digests)
+                    cached = self.cached_artifact(stage, key) if name not in force else None
+                    if cached:
+                        logger.info(f"Stage {name}: cached ({key})")
+                        self.metrics.inc('pipeline_stages_cached_total')
+                        artifacts[name] = cached
+                        continue
+
+                    os.makedirs(os.path.join(self.cache_dir, name), exist_ok=True)
+                    temp_dir = tempfile.mkdtemp(dir=os.path.join(self.cache_dir, name), prefix=f'.{key}-')
+                    inputs = {dependency: artifacts[dependency].directory for dependency in stage.inputs}
+                    logger.info(f"Stage {name}: running ({key})")
+                    future = pool.submit(_run_stage, stage.function, inputs, stage.params, temp_dir)
+                    running[future] = (name, key, temp_dir, input_digests, time.perf_counter())
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key, temp_dir, input_digests, start = running.pop(future)
+                    try:
+                        stats = future.result()
+                    except Exception as e:
+                        logger.error(f"Stage {name} failed: {e}")
+                        shutil.rmtree(temp_dir, ignore_errors=True)
+                        failed.append(name)
+                        continue
+                    artifacts[name] = self.store(self.stages[name], key, temp_dir, input_digests,
+                                                 time.perf_counter() - start, stats)
+
+        if failed:
+            skipped = [name for name in order if name not in artifacts and name not in failed]
+            raise RuntimeError(f"Stages failed: {', '.join(failed)}"
+                               + (f"; not run: {', '.join(skipped)}" if skipped else ''))
+        return artifacts
+
+    def store(self, stage: Stage, key: str, temp_dir: str, input_digests: Dict[str, str], seconds: float,
+              stats: Optional[Dict[str, Any]]) -> Artifact:
+        """Write the manifest of a finished stage and move its directory into the cache."""
+        manifest = {
+            'stage': stage.name,
+            'version': stage.version,
+            'key': key,
+            'digest': directory_digest(temp_dir),
+            'params': stage.params,
+            'inputs': input_digests,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seconds': round(seconds, 3),
+            'stats': stats or {}
+        }
+        with open(os.path.join(temp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        # mkdtemp creates the directory private to its owner; artifacts are meant to be shared
+        os.chmod(temp_dir, 0o755)
+
+        directory = self.artifact_dir(stage, key)
+        if os.path.exists(directory):
+            # A forced rerun, or another run finished the same stage first
+            shutil.rmtree(directory)
+        os.replace(temp_dir, directory)
+
+        self.metrics.inc('pipeline_stages_run_total')
+        self.metrics.set_gauge(f'pipeline_{stage.name}_seconds', manifest['seconds'])
+        logger.info(f"Stage {stage.name}: done in {manifest['seconds']}s ({key})")
+        return Artifact(directory, manifest, cached=False)
+
+def publish(artifacts: Dict[str, Artifact], stages: Iterable[Stage], output_dir: str) -> List[str]:
+    """Copy the files of the published stages' artifacts into output_dir. Returns the paths written."""
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for stage in stages:
+        if stage.publish and stage.name in artifacts:
+            for path in artifacts[stage.name].files():
+                target = os.path.join(output_dir, os.path.basename(path))
+                shutil.copyfile(path, target)
+                written.append(target)
+    return written
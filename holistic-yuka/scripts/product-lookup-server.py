@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+OpenFoodFacts Barcode Lookup Server
+
+Serves product lookups from a local barcode index over HTTP, in the response format of
+the OFF API's /api/v0/product/<barcode>.json endpoint, so the app's openFoodFacts
+service can point its BASE_URL at it instead of calling the public API on every scan.
+Builds the index from a dump or export first when given one.
+"""
+
+import asyncio
+import json
+import time
+import argparse
+import logging
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from product_lookup import DEFAULT_CACHE_SIZE, DEFAULT_LOOKUP_FILE, ProductLookup, build_lookup
+from tsv_reader import READER_ENGINES
+from metrics import Metrics, add_metrics_arguments, instrumented
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PRODUCT_PATH_PREFIX = '/api/v0/product/'
+
+# Request latencies are well under the default buckets' 5 ms floor
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+# Largest request head accepted, and seconds an idle keep-alive connection stays open
+MAX_HEADER_BYTES = 16384
+IDLE_TIMEOUT = 30.0
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+class LookupServer:
+    """HTTP/1.1 keep-alive server answering barcode lookups from a ProductLookup."""
+
+    def __init__(self, lookup: ProductLookup, metrics: Metrics = None):
+        self.lookup = lookup
+        self.metrics = metrics or Metrics()
+
+    def product_response(self, barcode: str, query: Dict[str, Any]) -> Dict[str, Any]:
+        """OFF API v0 body for a barcode, with only the requested fields when query has fields."""
+        product = self.lookup.get(barcode)
+        if product is None:
+            self.metrics.inc('lookup_not_found_total')
+            return {'code': barcode, 'status': 0, 'status_verbose': 'product not found'}
+
+        fields = query.get('fields')
+        if fields:
+            wanted = set(','.join(fields).split(','))
+            product = {key: value for key, value in product.items() if key in wanted}
+        return {'code': barcode, 'product': product, 'status': 1, 'status_verbose': 'product found'}
+
+    def route(self, method: str, target: str) -> Tuple[int, str, bytes]:
+        """(status, content type, body) for a request."""
+        if method not in ('GET', 'HEAD'):
+            return 405, 'application/json', b'{"error":"method not allowed"}'
+
+        url = urlsplit(target)
+        path = unquote(url.path)
+        if path.startswith(PRODUCT_PATH_PREFIX) and path.endswith('.json'):
+            barcode = path[len(PRODUCT_PATH_PREFIX):-len('.json')]
+            if not barcode or '/' in barcode:
+                return 400, 'application/json', b'{"error":"bad barcode"}'
+            body = self.product_response(barcode, parse_qs(url.query))
+            return 200, 'application/json', json.dumps(body, ensure_ascii=False).encode('utf-8')
+        if path == '/health':
+            return 200, 'application/json', json.dumps({'status': 'ok', 'products': len(self.lookup)}).encode('utf-8')
+        if path == '/metrics':
+            self.publish_cache_metrics()
+            return 200, 'text/plain; version=0.0.4', self.metrics.to_prometheus().encode('utf-8')
+        return 404, 'application/json', b'{"error":"not found"}'
+
+    def publish_cache_metrics(self) -> None:
+        """Copy the LRU cache statistics into the metrics registry."""
+        cache = self.lookup.cache
+        self.metrics.set_counter('lookup_cache_hits_total', cache.hits)
+        self.metrics.set_counter('lookup_cache_misses_total', cache.misses)
+        self.metrics.set_gauge('lookup_cache_entries', len(cache))
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        """(method, target, headers) of the next request, or None when the client is done."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            return None
+
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        parts = request_line.split(' ')
+        if len(parts) != 3:
+            return None
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        # Lookups carry no body; skip one if a client sends it anyway
+        length = int(headers.get('content-length') or 0)
+        if length:
+            await reader.readexactly(length)
+        return parts[0], parts[1], headers
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests on one connection until it closes."""
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers = request
+
+                start = time.perf_counter()
+                status, content_type, body = self.route(method, target)
+                self.metrics.observe('lookup_request_seconds', time.perf_counter() - start, LATENCY_BUCKETS)
+                self.metrics.inc('lookup_requests_total')
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                        f'Content-Type: {content_type}\r\n'
+                        f'Content-Length: {len(body)}\r\n'
+                        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+                writer.write(head.encode('latin-1') + (body if method != 'HEAD' else b''))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        """Accept connections until cancelled."""
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        addresses = ', '.join(f'{socket.getsockname()[0]}:{socket.getsockname()[1]}' for socket in server.sockets)
+        logger.info(f"Serving {len(self.lookup)} products on {addresses} "
+                    f"(GET {PRODUCT_PATH_PREFIX}<barcode>.json, /health, /metrics)")
+        async with server:
+            await server.serve_forever()
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Serve OpenFoodFacts barcode lookups from a local product index')
+    parser.add_argument('-i', '--input',
+                       help='Build the index from this TSV dump, optionally compressed, or JSONL/Parquet export first')
+    parser.add_argument('--index', default=DEFAULT_LOOKUP_FILE,
+                       help=f'Barcode lookup index to serve (default: {DEFAULT_LOOKUP_FILE})')
+    parser.add_argument('--reader', choices=READER_ENGINES, default='projected',
+                       help='Row reader for TSV dumps when building (default: projected)')
+    parser.add_argument('--build-only', action='store_true',
+                       help='Build the index from --input and exit without serving')
+    parser.add_argument('--host', default='127.0.0.1',
+                       help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080,
+                       help='Port to listen on (default: 8080)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                       help=f'Lookups kept in the in-process LRU cache, 0 to disable it (default: {DEFAULT_CACHE_SIZE})')
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    if args.build_only and not args.input:
+        parser.error('--build-only needs --input')
+
+    metrics = Metrics()
+    with instrumented(args, metrics):
+        if args.input:
+            start = time.perf_counter()
+            count = build_lookup(args.index, args.input, reader=args.reader)
+            logger.info(f"Indexed {count} products from {args.input} into {args.index} in {time.perf_counter() - start:.1f}s")
+            if args.build_only:
+                return
+
+        with ProductLookup(args.index, args.cache_size) as lookup:
+            server = LookupServer(lookup, metrics)
+            try:
+                asyncio.run(server.serve(args.host, args.port))
+            except KeyboardInterrupt:
+                logger.info("Server stopped")
+            finally:
+                server.publish_cache_metrics()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Per-Product Ingredient Index
+
+SQLite store of the ingredients each product contributed to the frequency table, plus
+the table itself, so a newer dump or a delta file can be applied by subtracting a
+changed product's old ingredients and adding its new ones.
+"""
+
+import hashlib
+import json
+import sqlite3
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_FILE = 'ingredient_index.sqlite'
+
+def product_fingerprint(*fields: Optional[str]) -> str:
+    """Digest of the source fields a product's ingredients are derived from."""
+    joined = '\t'.join(field or '' for field in fields)
+    return hashlib.blake2b(joined.encode('utf-8'), digest_size=16).hexdigest()
+
+class ProductIndex:
+    """Products that passed the country filter, their fingerprints and ingredients, and the summed counts."""
+
+    def __init__(self, filename: str = DEFAULT_INDEX_FILE):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS products (
+                code TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                ingredients TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ingredient_counts (
+                ingredient TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+        """)
+        self.connection.commit()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Stored metadata value, or None."""
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        """Store a metadata value (committed with the next commit)."""
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def check_country_terms(self, country_terms: Sequence[str]) -> None:
+        """Record the country terms of a new index, or raise ValueError if an existing index used others."""
+        stored = self.get_meta('country_terms')
+        if stored is None:
+            self.set_meta('country_terms', json.dumps(list(country_terms)))
+            self.connection.commit()
+        elif json.loads(stored) != list(country_terms):
+            raise ValueError(f"{self.filename} was built for countries {json.loads(stored)}, "
+                             f"not {list(country_terms)}; use a new index file")
+
+    def fingerprints(self) -> Dict[str, str]:
+        """Fingerprint of every indexed product, keyed on product code."""
+        return dict(self.connection.execute('SELECT code, fingerprint FROM products'))
+
+    def ingredients(self, code: str) -> List[str]:
+        """Ingredients a product contributed, or an empty list if it isn't indexed."""
+        row = self.connection.execute('SELECT ingredients FROM products WHERE code = ?', (code,)).fetchone()
+        return row[0].split('\n') if row and row[0] else []
+
+    def put(self, code: str, fingerprint: str, ingredients: List[str]) -> None:
+        """Store or replace a product. Ingredients never contain newlines, so they are stored newline-joined."""
+        self.connection.execute('INSERT OR REPLACE INTO products (code, fingerprint, ingredients) VALUES (?, ?, ?)',
+                                (code, fingerprint, '\n'.join(ingredients)))
+
+    def remove(self, code: str) -> None:
+        """Drop a product from the index."""
+        self.connection.execute('DELETE FROM products WHERE code = ?', (code,))
+
+    def product_count(self) -> int:
+        """Number of indexed products."""
+        return self.connection.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def load_counts(self) -> Counter:
+        """The persisted ingredient frequency table."""
+        return Counter(dict(self.connection.execute('SELECT ingredient, count FROM ingredient_counts ORDER BY rowid')))
+
+    def save_counts(self, counts: Counter, changed: Iterable[str]) -> None:
+        """Write the changed ingredients of the frequency table, deleting those whose count dropped to zero."""
+        upserts = []
+        deletes = []
+        for ingredient in changed:
+            count = counts.get(ingredient, 0)
+            if count > 0:
+                upserts.append((ingredient, count))
+            else:
+                deletes.append((ingredient,))
+        self.connection.executemany('INSERT INTO ingredient_counts (ingredient, count) VALUES (?, ?) '
+                                    'ON CONFLICT (ingredient) DO UPDATE SET count = excluded.count', upserts)
+        self.connection.executemany('DELETE FROM ingredient_counts WHERE ingredient = ?', deletes)
+
+    def commit(self) -> None:
+        """Commit pending changes in one transaction."""
+        self.connection.commit()
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
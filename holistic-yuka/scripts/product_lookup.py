@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Barcode Product Lookup
+
+Compact barcode -> product index built from an OpenFoodFacts dump or export, for
+serving the fields the app asks the OFF API for without a network round trip. Each
+product is one zlib-compressed JSON blob in a WITHOUT ROWID SQLite table keyed on the
+barcode, so a lookup is a single B-tree probe; an in-process LRU cache keeps the
+frequently scanned products decoded. Fields are stored with the OFF API's JSON types:
+tag lists as arrays and scores and nutrient amounts as numbers, not the dump's text.
+
+Schema:
+    products(code, data)      data is the zlib-compressed JSON of the non-empty fields
+    meta(key, value)          fields, source and build time of the index
+"""
+
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+import logging
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from off_client import PRODUCT_FIELDS
+from product_sources import read_products
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOOKUP_FILE = 'products.lookup.sqlite'
+DEFAULT_CACHE_SIZE = 10000
+
+# Bytes of the index SQLite reads through a memory map
+MMAP_SIZE = 1 << 30
+
+# Rows per executemany call while building
+BUILD_BATCH_SIZE = 10000
+
+# Fields the OFF API returns as integers; *_100g and *_serving nutrient amounts are floats
+INTEGER_FIELDS = frozenset({'nova_group', 'nutriscore_score', 'ecoscore_score', 'additives_n'})
+FLOAT_SUFFIXES = ('_100g', '_serving')
+
+LOOKUP_SCHEMA = """
+    CREATE TABLE products (
+        code TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID;
+"""
+
+def barcode_candidates(barcode: str) -> Tuple[str, ...]:
+    """Codes a scanned barcode may be stored under: as scanned, and as EAN-13 or without
+    leading zeros, since a UPC-A scan and the dump can disagree on the padding."""
+    code = barcode.strip()
+    candidates = [code]
+    if code.isdigit():
+        for variant in (code.zfill(13), code.lstrip('0')):
+            if variant and variant not in candidates:
+                candidates.append(variant)
+    return tuple(candidates)
+
+def encode_product(product: Dict[str, Any]) -> bytes:
+    """Compressed blob of a product's fields."""
+    return zlib.compress(json.dumps(product, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def decode_product(data: bytes) -> Dict[str, Any]:
+    """Fields of a compressed product blob."""
+    return json.loads(zlib.decompress(data))
+
+def api_value(field: str, value: str) -> Any:
+    """A dump field's text as the OFF API types it, or None when a number doesn't parse or isn't finite,
+    since JSON has no NaN or Infinity."""
+    if field.endswith('_tags'):
+        return [tag for tag in (tag.strip() for tag in value.split(',')) if tag]
+    if field not in INTEGER_FIELDS and not field.endswith(FLOAT_SUFFIXES):
+        return value
+    try:
+        number = float(value)
+        if not math.isfinite(number):
+            return None
+        return int(number) if field in INTEGER_FIELDS else number
+    except (ValueError, OverflowError):
+        return None
+
+def api_fields(columns: Sequence[str], row: Tuple[Optional[str], ...]) -> Dict[str, Any]:
+    """Non-empty fields of a row, typed as in the OFF API."""
+    product = {}
+    for column, value in zip(columns, row):
+        if value:
+            value = api_value(column, value)
+            if value or value == 0:
+                product[column] = value
+    return product
+
+def _product_rows(rows: Iterable[Tuple[Optional[str], ...]], columns: Sequence[str]) -> Iterable[Tuple[str, bytes]]:
+    """(code, blob) of each row with a code, leaving out its empty fields."""
+    for row in rows:
+        code = (row[0] or '').strip()
+        if code:
+            yield code, encode_product(api_fields(columns, row))
+
+def build_lookup(filename: str, input_filename: str, fields: Sequence[str] = PRODUCT_FIELDS,
+                 reader: str = 'projected') -> int:
+    """Build the lookup index of every product with a code in input_filename. Returns the product count.
+
+    Empty fields and numbers that don't parse or aren't finite are left out, and a repeated code keeps
+    its first product, as in the ingredient database. The index is built in a temporary file that replaces filename
+    only once complete, so a running server never sees a half-built one.
+    """
+    columns = ('code',) + tuple(field for field in fields if field != 'code')
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.lookup-', suffix='.sqlite')
+    os.close(fd)
+    connection = sqlite3.connect(temp_path)
+    try:
+        # Durability doesn't matter until the file is complete
+        connection.execute('PRAGMA journal_mode=OFF')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.executescript(LOOKUP_SCHEMA)
+
+        rows = _product_rows(read_products(input_filename, columns, engine=reader), columns)
+        count = 0
+        while True:
+            batch = list(islice(rows, BUILD_BATCH_SIZE))
+            if not batch:
+                break
+            cursor = connection.executemany('INSERT OR IGNORE INTO products (code, data) VALUES (?, ?)', batch)
+            count += cursor.rowcount
+
+        connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+            ('fields', json.dumps(list(columns))),
+            ('source', os.path.abspath(input_filename)),
+            ('built', time.strftime('%Y-%m-%dT%H:%M:%S'))
+        ])
+        connection.commit()
+        # Pack the pages tightly: the file is read-only from here on
+        connection.execute('VACUUM')
+        connection.close()
+        # mkstemp creates the file private to its owner; the index is meant to be shared
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, filename)
+    except BaseException:
+        connection.close()
+        os.unlink(temp_path)
+        raise
+    return count
+
+class LRUCache:
+    """Bounded mapping evicting the least recently used entry, with hit and miss counts."""
+
+    def __init__(self, capacity: int = DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value of key, marking it as most recently used."""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store value under key, evicting the least recently used entry when full."""
+        if self.capacity <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class ProductLookup:
+    """Read-only barcode lookups in a built index, behind an LRU cache."""
+
+    def __init__(self, filename: str = DEFAULT_LOOKUP_FILE, cache_size: int = DEFAULT_CACHE_SIZE):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"Lookup index {filename} not found")
+        self.filename = filename
+        self.connection = sqlite3.connect(f'file:{os.path.abspath(filename)}?mode=ro', uri=True,
+                                          check_same_thread=False)
+        # Read pages straight from the page cache instead of copying them into SQLite's
+        self.connection.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        self.cache = LRUCache(cache_size)
+        self.meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        self.fields = json.loads(self.meta.get('fields', '[]'))
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def get(self, barcode: str) -> Optional[Dict[str, Any]]:
+        """Fields of the product with this barcode, or None. Misses are cached too."""
+        cached = self.cache.get(barcode, self)
+        if cached is not self:
+            return cached
+
+        product = None
+        for code in barcode_candidates(barcode):
+            row = self.connection.execute('SELECT data FROM products WHERE code = ?', (code,)).fetchone()
+            if row is not None:
+                product = decode_product(row[0])
+                break
+        self.cache.put(barcode, product)
+        return product
+
+    def close(self) -> None:
+        """Close the index."""
+        self.connection.close()
+
+    def __enter__(self) -> 'ProductLookup':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+OpenFoodFacts Product Sources
+
+Reads the same product columns from any of the OpenFoodFacts export formats: the TSV
+dump (plain or .gz/.bz2/.xz/.zst compressed), line-delimited JSON exports and deltas,
+and the Parquet export.
+"""
+
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ndjson_io import is_compressed_filename, is_ndjson_filename, iter_ndjson, strip_compression_extension
+from tsv_reader import read_columns
+
+logger = logging.getLogger(__name__)
+
+# Record batch size for the Parquet reader
+PARQUET_BATCH_SIZE = 65536
+
+# Parquet columns a product's fields are derived from, when present in the file
+PARQUET_SOURCE_COLUMNS = ('code', 'product_name', 'countries_en', 'countries', 'countries_tags',
+                          'ingredients_text_en', 'ingredients_text', 'allergens_tags', 'traces_tags')
+
+def is_json_products_filename(filename: str) -> bool:
+    """True for line-delimited JSON product exports, such as OFF's .json.gz delta files."""
+    return strip_compression_extension(filename).endswith('.json') or is_ndjson_filename(filename)
+
+def is_parquet_filename(filename: str) -> bool:
+    """True for Parquet exports."""
+    return filename.endswith('.parquet')
+
+def is_plain_tsv_filename(filename: str) -> bool:
+    """True for an uncompressed TSV dump, the only format that supports byte offsets."""
+    return not (is_compressed_filename(filename) or is_json_products_filename(filename) or is_parquet_filename(filename))
+
+def _localized_text(entries: List[Dict[str, Any]], lang: str) -> Optional[str]:
+    """Text for lang from a list of {'lang', 'text'} entries, as in the Parquet export."""
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('lang') == lang:
+            return entry.get('text')
+    return None
+
+def _tags_field(value: Any) -> Optional[str]:
+    """A tags list joined with commas as in the TSV dump; strings pass through."""
+    if isinstance(value, list):
+        return ','.join(tag for tag in value if isinstance(tag, str))
+    return value
+
+def _raw_field(value: Any) -> Optional[str]:
+    """A product field as the TSV dump would hold it: tag lists joined, numbers as text."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return _tags_field(value) if isinstance(value, (str, list)) else None
+
+def product_fields(product: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """Map a JSON or Parquet product onto the TSV column names.
+
+    These exports may only carry country tags such as 'en:united-states', so all
+    country fields are joined with dashes turned into spaces.
+    """
+    country_fields = [product.get('countries_en'), product.get('countries')] + list(product.get('countries_tags') or [])
+    countries = ','.join(field for field in country_fields if isinstance(field, str)).replace('-', ' ')
+    ingredients_text = product.get('ingredients_text')
+    ingredients_text_en = product.get('ingredients_text_en')
+    if isinstance(ingredients_text, list):
+        ingredients_text_en = ingredients_text_en or _localized_text(ingredients_text, 'en')
+        ingredients_text = _localized_text(ingredients_text, 'main')
+    product_name = product.get('product_name')
+    if isinstance(product_name, list):
+        product_name = _localized_text(product_name, 'main')
+    return {
+        'code': str(product.get('code') or ''),
+        'product_name': product_name,
+        'countries_en': countries,
+        'ingredients_text_en': ingredients_text_en,
+        'ingredients_text': ingredients_text,
+        'allergens': _tags_field(product.get('allergens_tags') or product.get('allergens')),
+        'traces_tags': _tags_field(product.get('traces_tags'))
+    }
+
+def _project(product: Dict[str, Any], columns: Sequence[str]) -> Tuple[Optional[str], ...]:
+    """The TSV columns of a JSON or Parquet product; columns product_fields doesn't map are taken as they are."""
+    fields = product_fields(product)
+    return tuple(fields[column] if column in fields else _raw_field(product.get(column)) for column in columns)
+
+def _read_json_rows(filename: str, columns: Sequence[str]) -> Iterator[Tuple[Optional[str], ...]]:
+    """Project each product of a line-delimited JSON export."""
+    for product in iter_ndjson(filename):
+        yield _project(product, columns)
+
+def _read_parquet_rows(filename: str, columns: Sequence[str], batch_size: int) -> Iterator[Tuple[Optional[str], ...]]:
+    """Project each product of a Parquet export, reading only the source columns."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet files requires the pyarrow package") from None
+
+    parquet = pq.ParquetFile(filename)
+    available = set(parquet.schema_arrow.names)
+    wanted = list(PARQUET_SOURCE_COLUMNS) + [column for column in columns if column not in PARQUET_SOURCE_COLUMNS]
+    source_columns = [column for column in wanted if column in available]
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=source_columns):
+        for product in batch.to_pylist():
+            yield _project(product, columns)
+
+def read_products(filename: str, columns: Sequence[str], engine: str = 'projected',
+                  prefilter_terms: Sequence[str] = None, stats: Dict[str, int] = None) -> Iterator[Tuple[Optional[str], ...]]:
+    """Yield a tuple of the requested TSV columns for each product, whatever the export format.
+
+    TSV dumps go through read_columns with the given engine; JSON and Parquet exports
+    ignore engine and the prefilter.
+    """
+    if is_json_products_filename(filename):
+        return _read_json_rows(filename, columns)
+    if is_parquet_filename(filename):
+        return _read_parquet_rows(filename, columns, PARQUET_BATCH_SIZE)
+    return read_columns(filename, columns, engine=engine, prefilter_terms=prefilter_terms, stats=stats)
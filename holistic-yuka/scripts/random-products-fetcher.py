@@ -7,11 +7,16 @@ Fetches N random English products from OpenFoodFacts and logs the API responses.
 
 import requests
 import json
-import time
+import random
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import argparse
 
+from concurrent_fetch import TokenBucket
+from off_client import OpenFoodFactsClient, PRODUCT_FIELDS, SEARCH_URL, add_client_arguments, client_from_args
+from ndjson_io import NDJSONWriter, is_ndjson_filename, iter_ndjson
+from metrics import Metrics, add_metrics_arguments, instrumented
+
 # Configure logging for JSON output
 class JSONFormatter(logging.Formatter):
     def format(self, record):
@@ -23,46 +28,85 @@ class JSONFormatter(logging.Formatter):
         }
         return json.dumps(log_record)
 
+class LazyJSON:
+    """Log message that is only serialized if a handler actually emits the record."""
+    __slots__ = ('data',)
+    
+    def __init__(self, data: Any):
+        self.data = data
+        
+    def __str__(self) -> str:
+        return json.dumps(self.data)
+
 logger = logging.getLogger(__name__)
 handler = logging.StreamHandler()
 handler.setFormatter(JSONFormatter())
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# Metrics exports and profiling reports go through the same JSON handler
+metrics_logger = logging.getLogger('metrics')
+metrics_logger.addHandler(handler)
+metrics_logger.setLevel(logging.INFO)
+
 class RandomProductsFetcher:
-    def __init__(self):
-        self.base_url = "https://world.openfoodfacts.org/cgi/search.pl"
+    def __init__(self, client: OpenFoodFactsClient = None, metrics: Metrics = None):
+        self.base_url = SEARCH_URL
+        self.client = client or OpenFoodFactsClient()
+        self.metrics = metrics or Metrics()
+        if self.client.metrics is None:
+            self.client.metrics = self.metrics
         self.random_url = "https://world.openfoodfacts.org/api/v0/product"
         self.rate_limit_delay = 0.1
+        self.raw_sink: Optional[NDJSONWriter] = None
+        self.max_page = 1000
+        self.page_size = 20
+        self.output_file = 'random_products.json'
         
-    def fetch_random_products(self, count: int = 10) -> List[Dict[str, Any]]:
+    def fetch_random_products(self, count: int = 10, seed: int = None, output: NDJSONWriter = None) -> List[Dict[str, Any]]:
         """
         Fetch random English products from OpenFoodFacts.
         Uses search with random page numbers to simulate randomness.
+        
+        Pages are drawn without replacement and products are deduplicated by barcode,
+        so no request is spent on a page or product already seen. Passing a seed makes
+        the page order reproducible.
+        
+        With output, each accepted product is reordered and written to it immediately
+        instead of being kept in memory, and an empty list is returned.
         """
         products = []
+        accepted = 0
         attempts = 0
         max_attempts = count * 3  # Allow more attempts to get desired count
         
+        rng = random.Random(seed)
+        page_order = rng.sample(range(1, self.max_page + 1), self.max_page)
+        seen_codes = set()
+        duplicates_skipped = 0
+        
+        # Rate limit network requests only, so cached pages are served immediately
+        self.client.limiter = TokenBucket(1 / self.rate_limit_delay if self.rate_limit_delay > 0 else 0)
+        
         fetch_start_info = {
             'action': 'fetch_start',
             'requested_count': count,
-            'max_attempts': max_attempts
+            'max_attempts': max_attempts,
+            'seed': seed
         }
-        logger.info(json.dumps(fetch_start_info))
+        logger.info(LazyJSON(fetch_start_info))
         
-        while len(products) < count and attempts < max_attempts:
+        while accepted < count and attempts < max_attempts and attempts < len(page_order):
             try:
-                # Use random page numbers to get variety
-                import random
-                page = random.randint(1, 1000)
+                # Use random page numbers to get variety, never requesting a page twice
+                page = page_order[attempts]
                 
                 params = {
                     'search_terms': '',
                     'page': page,
-                    'page_size': 20,
+                    'page_size': self.page_size,
                     'json': 1,
-                    'fields': 'code,product_name,product_name_en,ingredients_text,ingredients_text_en,brands,categories,nutriscore_grade,nova_group,traces,traces_tags,allergens,allergens_tags,allergens_from_ingredients,allergens_from_user'
+                    'fields': ','.join(PRODUCT_FIELDS)
                 }
                 
                 fetch_attempt_info = {
@@ -71,32 +115,42 @@ class RandomProductsFetcher:
                     'attempt': attempts + 1,
                     'max_attempts': max_attempts
                 }
-                logger.info(json.dumps(fetch_attempt_info))
-                
-                response = requests.get(self.base_url, params=params, timeout=30)
-                response.raise_for_status()
-                
-                # Log the raw API response
-                api_response_data = {
-                    'api_response_status': response.status_code,
-                    'api_response_headers': dict(response.headers),
-                    'page_number': page,
-                    'attempt': attempts + 1
-                }
-                logger.info(json.dumps(api_response_data))
+                logger.info(LazyJSON(fetch_attempt_info))
                 
+                response = self.client.get(self.base_url, params=params)
                 data = response.json()
                 page_products = data.get('products', [])
+                self.metrics.inc('fetcher_pages_total')
+                self.metrics.inc('fetcher_products_seen_total', len(page_products))
                 
-                raw_response_data = {
-                    'raw_api_response': data,
-                    'products_count': len(page_products)
-                }
-                logger.info(json.dumps(raw_response_data))
+                # Raw responses are only logged at DEBUG level, and can go to a separate NDJSON file
+                if logger.isEnabledFor(logging.DEBUG):
+                    api_response_data = {
+                        'api_response_status': response.status_code,
+                        'api_response_headers': dict(response.headers),
+                        'page_number': page,
+                        'attempt': attempts + 1
+                    }
+                    logger.debug(LazyJSON(api_response_data))
+                    
+                    raw_response_data = {
+                        'raw_api_response': data,
+                        'products_count': len(page_products)
+                    }
+                    logger.debug(LazyJSON(raw_response_data))
+                
+                if self.raw_sink:
+                    self.raw_sink.write({
+                        'page_number': page,
+                        'attempt': attempts + 1,
+                        'api_response_status': response.status_code,
+                        'api_response_headers': dict(response.headers),
+                        'raw_api_response': data
+                    })
                 
                 # Filter for English products
                 for product in page_products:
-                    if len(products) >= count:
+                    if accepted >= count:
                         break
                         
                     # Check if product has English content
@@ -106,18 +160,28 @@ class RandomProductsFetcher:
                         (product.get('product_name', '').replace(' ', '').isalpha())
                     )
                     
-                    if has_english:
-                        products.append(product)
+                    code = product.get('code')
+                    if has_english and code and code in seen_codes:
+                        duplicates_skipped += 1
+                        self.metrics.inc('fetcher_duplicates_skipped_total')
+                    elif has_english:
+                        if code:
+                            seen_codes.add(code)
+                        if output:
+                            output.write(self.reorder_product_fields(product))
+                        else:
+                            products.append(product)
+                        accepted += 1
+                        self.metrics.inc('fetcher_products_accepted_total')
                         product_added_data = {
                             'action': 'product_added',
-                            'product_number': len(products),
+                            'product_number': accepted,
                             'product_name': product.get('product_name_en', product.get('product_name', 'Unknown')),
                             'product_code': product.get('code')
                         }
-                        logger.info(json.dumps(product_added_data))
+                        logger.info(LazyJSON(product_added_data))
                 
                 attempts += 1
-                time.sleep(self.rate_limit_delay)
                 
             except requests.exceptions.RequestException as e:
                 request_error = {
@@ -126,9 +190,9 @@ class RandomProductsFetcher:
                     'error_type': type(e).__name__,
                     'attempt': attempts + 1
                 }
-                logger.error(json.dumps(request_error))
-                attempts += 1
-                time.sleep(1)  # Wait longer on error
+                logger.error(LazyJSON(request_error))
+                self.metrics.inc('fetcher_request_errors_total')
+                attempts += 1  # The client already retried with backoff
                 continue
             except ValueError as e:
                 json_error = {
@@ -137,28 +201,35 @@ class RandomProductsFetcher:
                     'error_type': type(e).__name__,
                     'attempt': attempts + 1
                 }
-                logger.error(json.dumps(json_error))
+                logger.error(LazyJSON(json_error))
+                self.metrics.inc('fetcher_json_errors_total')
                 attempts += 1
                 continue
         
         fetch_summary = {
             'action': 'fetch_completed',
-            'products_fetched': len(products),
+            'products_fetched': accepted,
             'products_requested': count,
-            'success': True
+            'pages_requested': attempts,
+            'duplicates_skipped': duplicates_skipped,
+            'success': True,
+            'http_metrics': self.client.latency_summary()
         }
-        logger.info(json.dumps(fetch_summary))
+        logger.info(LazyJSON(fetch_summary))
         return products[:count]  # Return exactly the requested count
     
     def log_product_details(self, products: List[Dict[str, Any]]) -> None:
-        """Log detailed information about each product."""
+        """Log detailed information about each product at DEBUG level."""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        
         for i, product in enumerate(products, 1):
             product_detail = {
                 'action': 'product_detail',
                 'product_index': i,
                 'product_data': product
             }
-            logger.info(json.dumps(product_detail))
+            logger.debug(LazyJSON(product_detail))
     
     def reorder_product_fields(self, product: Dict[str, Any]) -> Dict[str, Any]:
         """Reorder product fields to place allergen fields after traces."""
@@ -198,18 +269,56 @@ class RandomProductsFetcher:
             'products_count': len(products),
             'filename': filename
         }
-        logger.info(json.dumps(save_info))
+        logger.info(LazyJSON(save_info))
+    
+    def stream_and_log(self, count: int = 10, filename: str = 'random_products.ndjson.gz', seed: int = None) -> int:
+        """Fetch random products straight into an NDJSON file with flat memory. Returns the number written."""
+        try:
+            with NDJSONWriter(filename) as output:
+                self.fetch_random_products(count, seed, output)
+            
+            # Summarize by reading the file back lazily rather than holding the products
+            total = english_names = english_ingredients = 0
+            for product in iter_ndjson(filename):
+                total += 1
+                english_names += bool(product.get('product_name_en'))
+                english_ingredients += bool(product.get('ingredients_text_en'))
+            
+            save_info = {
+                'action': 'file_saved',
+                'products_count': total,
+                'filename': filename
+            }
+            logger.info(LazyJSON(save_info))
+            
+            summary = {
+                'action': 'final_summary',
+                'total_products_fetched': total,
+                'products_with_english_names': english_names,
+                'products_with_english_ingredients': english_ingredients
+            }
+            logger.info(LazyJSON(summary))
+            return total
+            
+        except Exception as e:
+            error_info = {
+                'action': 'error',
+                'message': f"Error in stream_and_log: {e}",
+                'error_type': type(e).__name__
+            }
+            logger.error(LazyJSON(error_info))
+            return 0
     
-    def fetch_and_log(self, count: int = 10, save_file: bool = True) -> List[Dict[str, Any]]:
+    def fetch_and_log(self, count: int = 10, save_file: bool = True, seed: int = None) -> List[Dict[str, Any]]:
         """Main method to fetch random products and log responses."""
         try:
-            products = self.fetch_random_products(count)
+            products = self.fetch_random_products(count, seed)
             
             if products:
                 self.log_product_details(products)
                 
                 if save_file:
-                    self.save_products_json(products)
+                    self.save_products_json(products, self.output_file)
                 
                 summary = {
                     'action': 'final_summary',
@@ -217,13 +326,13 @@ class RandomProductsFetcher:
                     'products_with_english_names': sum(1 for p in products if p.get('product_name_en')),
                     'products_with_english_ingredients': sum(1 for p in products if p.get('ingredients_text_en'))
                 }
-                logger.info(json.dumps(summary))
+                logger.info(LazyJSON(summary))
             else:
                 warning = {
                     'action': 'warning',
                     'message': 'No products were fetched'
                 }
-                logger.warning(json.dumps(warning))
+                logger.warning(LazyJSON(warning))
             
             return products
             
@@ -233,7 +342,7 @@ class RandomProductsFetcher:
                 'message': f"Error in fetch_and_log: {e}",
                 'error_type': type(e).__name__
             }
-            logger.error(json.dumps(error_info))
+            logger.error(LazyJSON(error_info))
             return []
 
 def main():
@@ -243,10 +352,33 @@ def main():
                        help='Number of random products to fetch (default: 5)')
     parser.add_argument('--no-save', action='store_true', 
                        help='Do not save products to JSON file')
+    parser.add_argument('-o', '--output', default='random_products.json',
+                       help='Output file; .ndjson/.jsonl names (optionally .gz/.zst) are written as products arrive (default: random_products.json)')
+    parser.add_argument('--base-url',
+                       help='Search endpoint to use instead of world.openfoodfacts.org, e.g. a local stub server')
+    parser.add_argument('--seed', type=int,
+                       help='Random seed for a reproducible page sample')
+    parser.add_argument('--page-size', type=int, default=20,
+                       help='Products requested per page (default: 20)')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                       help='Log verbosity; raw API responses and product details are logged at DEBUG (default: INFO)')
+    parser.add_argument('--raw-output',
+                       help='Write raw API responses to this NDJSON file, compressed by extension (e.g. raw_responses.ndjson.gz)')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
+    logger.setLevel(args.log_level)
     
-    fetcher = RandomProductsFetcher()
+    metrics = Metrics()
+    fetcher = RandomProductsFetcher(client_from_args(args), metrics)
+    fetcher.page_size = args.page_size
+    fetcher.output_file = args.output
+    streaming = not args.no_save and is_ndjson_filename(args.output)
+    if args.raw_output:
+        fetcher.raw_sink = NDJSONWriter(args.raw_output)
+    if args.base_url:
+        fetcher.base_url = args.base_url
     
     start_info = {
         'action': 'start',
@@ -254,23 +386,31 @@ def main():
         'requested_count': args.count,
         'save_file': not args.no_save
     }
-    logger.info(json.dumps(start_info))
+    logger.info(LazyJSON(start_info))
     
-    products = fetcher.fetch_and_log(count=args.count, save_file=not args.no_save)
+    try:
+        with instrumented(args, metrics):
+            if streaming:
+                products_retrieved = fetcher.stream_and_log(count=args.count, filename=args.output, seed=args.seed)
+            else:
+                products_retrieved = len(fetcher.fetch_and_log(count=args.count, save_file=not args.no_save, seed=args.seed))
+    finally:
+        if fetcher.raw_sink:
+            fetcher.raw_sink.close()
     
-    if products:
+    if products_retrieved:
         completion_info = {
             'action': 'completion',
             'message': 'Fetch completed successfully',
-            'products_retrieved': len(products)
+            'products_retrieved': products_retrieved
         }
-        logger.info(json.dumps(completion_info))
+        logger.info(LazyJSON(completion_info))
     else:
         error_info = {
             'action': 'error',
             'message': 'No products were fetched'
         }
-        logger.error(json.dumps(error_info))
+        logger.error(LazyJSON(error_info))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+OpenFoodFacts Response Cache
+
+SQLite-backed on-disk cache of HTTP response bodies keyed on URL and query parameters,
+with zlib compression, a TTL and size-based LRU eviction.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = 'off_response_cache.sqlite'
+
+def cache_key(url: str, params: Dict[str, Any] = None) -> str:
+    """Stable key for a GET request, independent of parameter order."""
+    query = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha256(f"{url}?{query}".encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    def __init__(self, filename: str = DEFAULT_CACHE_FILE, ttl: float = 86400.0, max_bytes: int = 512 * 1024 * 1024):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                content_type TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.connection.commit()
+
+    def get(self, url: str, params: Dict[str, Any] = None) -> Optional[Tuple[bytes, Optional[str]]]:
+        """Return (body, content_type) for a fresh cached response, or None."""
+        key = cache_key(url, params)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT body, content_type, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or (self.ttl and now - row[2] > self.ttl):
+                self.misses += 1
+                return None
+
+            self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.connection.commit()
+            self.hits += 1
+
+        return zlib.decompress(row[0]), row[1]
+
+    def put(self, url: str, params: Dict[str, Any], body: bytes, content_type: str = None) -> None:
+        """Store a response body, then evict least recently used entries beyond max_bytes."""
+        compressed = zlib.compress(body, 6)
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses (key, url, content_type, body, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (cache_key(url, params), url, content_type, compressed, len(compressed), now, now)
+            )
+            self.evict()
+            self.connection.commit()
+
+    def evict(self) -> None:
+        """Drop expired entries and the least recently used ones until the cache fits in max_bytes."""
+        if self.ttl:
+            self.connection.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,))
+
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        removed = 0
+        for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            removed += 1
+        logger.info(f"Evicted {removed} cached responses to stay under {self.max_bytes} bytes")
+
+    def close(self) -> None:
+        """Close the database."""
+        with self.lock:
+            self.connection.close()
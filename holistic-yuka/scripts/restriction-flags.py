@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+OpenFoodFacts Restriction Flags
+
+Scans every product of an OFF dump or export for allergens and diet-violating
+ingredients, in batches through one compiled matcher, and saves per-product flags for
+the analyzeProduct function to the product_flags table of the SQLite database and,
+optionally, as NDJSON.
+"""
+
+import time
+import argparse
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from restriction_matcher import (DEFAULT_BATCH_SIZE, DEFAULT_RESTRICTIONS_FILE, MATCHER_ENGINES,
+                                 RestrictionMatcher, load_restrictions)
+from product_sources import read_products
+from tsv_reader import READER_ENGINES
+from ndjson_io import NDJSONWriter
+from ingredient_db import DEFAULT_DATABASE_FILE, IngredientDatabase
+from metrics import Metrics, add_metrics_arguments, instrumented
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Columns the flags are computed from
+FLAG_COLUMNS = ('code', 'ingredients_text_en', 'ingredients_text', 'allergens', 'traces_tags')
+
+class RestrictionFlagsScanner:
+    """Computes the restriction flags of every product in a dump."""
+
+    def __init__(self, matcher: RestrictionMatcher, batch_size: int = DEFAULT_BATCH_SIZE, metrics: Metrics = None):
+        self.matcher = matcher
+        self.batch_size = batch_size
+        self.metrics = metrics or Metrics()
+        self.scanned_count = 0
+        self.flagged_count = 0
+
+    def scan_rows(self, rows: Iterable[Tuple[Optional[str], ...]]) -> Iterator[Dict[str, Any]]:
+        """Yield the flags of each row of FLAG_COLUMNS that has a code and ingredients or allergen tags."""
+        products = (row for row in rows if row[0] and (row[1] or row[2] or row[3]))
+        while True:
+            batch = list(islice(products, self.batch_size))
+            if not batch:
+                break
+
+            texts = [en or text for _, en, text, _, _ in batch]
+            start = time.perf_counter()
+            matches = self.matcher.match_batch(texts)
+            self.metrics.observe('restriction_match_batch_seconds', time.perf_counter() - start)
+
+            for (code, _, _, allergens, traces), text, product_matches in zip(batch, texts, matches):
+                flags = self.matcher.product_flags(code, product_matches, bool(text), allergens, traces)
+                self.scanned_count += 1
+                if flags['diets'] or flags['allergens'] or flags['traces']:
+                    self.flagged_count += 1
+                yield flags
+
+            self.metrics.set_counter('restriction_products_scanned_total', self.scanned_count)
+            self.metrics.set_counter('restriction_products_flagged_total', self.flagged_count)
+
+    def scan_file(self, filename: str, reader: str = 'projected') -> Iterator[Dict[str, Any]]:
+        """scan_rows over a TSV dump or a JSONL/Parquet export."""
+        return self.scan_rows(read_products(filename, FLAG_COLUMNS, engine=reader))
+
+def _tee(records: Iterable[Dict[str, Any]], writer: NDJSONWriter) -> Iterator[Dict[str, Any]]:
+    """Pass records through, writing each one to writer."""
+    for record in records:
+        writer.write(record)
+        yield record
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Precompute allergen and diet flags for every OpenFoodFacts product')
+    parser.add_argument('-i', '--input', default='en.openfoodfacts.org.products.tsv',
+                       help='TSV dump to scan, optionally compressed, or a JSONL or Parquet export (default: en.openfoodfacts.org.products.tsv)')
+    parser.add_argument('--restrictions', default=DEFAULT_RESTRICTIONS_FILE,
+                       help='Diet restriction list JSON (default: data/restriction_list.json)')
+    parser.add_argument('--engine', choices=MATCHER_ENGINES, default='regex',
+                       help='Term matcher; aho-corasick needs the pyahocorasick package (default: regex)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Ingredient texts scanned per pass (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--reader', choices=READER_ENGINES, default='projected',
+                       help='Row reader for TSV dumps (default: projected)')
+    parser.add_argument('--sqlite', default=DEFAULT_DATABASE_FILE,
+                       help=f'SQLite database whose product_flags table is replaced (default: {DEFAULT_DATABASE_FILE})')
+    parser.add_argument('-o', '--output',
+                       help='Also write the flags to this NDJSON file, compressed by extension (e.g. product_flags.ndjson.gz)')
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    matcher = RestrictionMatcher(load_restrictions(args.restrictions), engine=args.engine)
+    scanner = RestrictionFlagsScanner(matcher, args.batch_size, metrics)
+    logger.info(f"Compiled {len(matcher.variants)} term variants for {len(matcher.restrictions)} diets "
+                f"and {len(matcher.allergens)} allergens ({matcher.engine} engine)")
+
+    with instrumented(args, metrics):
+        start = time.perf_counter()
+        records = scanner.scan_file(args.input, args.reader)
+        writer = NDJSONWriter(args.output) if args.output else None
+        if writer:
+            records = _tee(records, writer)
+        try:
+            with metrics.timer('restriction_scan_seconds'):
+                database = IngredientDatabase(args.sqlite)
+                try:
+                    count = database.replace_product_flags(matcher.restrictions, sorted(matcher.allergens), records)
+                finally:
+                    database.close()
+        finally:
+            if writer:
+                writer.close()
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Scanned {scanner.scanned_count} products in {elapsed:.1f}s "
+                    f"({scanner.scanned_count / max(elapsed, 1e-9):.0f} products/s), "
+                    f"{scanner.flagged_count} with at least one flag")
+        logger.info(f"Saved flags of {count} products to {args.sqlite}")
+        if writer:
+            logger.info(f"Saved {writer.count} flag records to {args.output}")
+
+if __name__ == "__main__":
+    main()
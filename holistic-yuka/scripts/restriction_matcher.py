@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Allergen and Diet Restriction Matcher
+
+Compiles the diet restriction terms of data/restriction_list.json and a dictionary of
+allergen synonyms into a single matcher (a trie-factored regular expression, or an
+Aho-Corasick automaton when pyahocorasick is installed) that scans a whole batch of
+ingredient texts in one pass. Only the longest of overlapping terms counts, so safe
+phrases such as 'cocoa butter' and 'coconut milk' hide the dairy terms inside them, and
+negated terms ('no milk', 'gluten-free') don't count. Combined with the OFF allergens
+and traces tags, the matches give the per-product flags served by the analyzeProduct
+function.
+"""
+
+import json
+import os
+import re
+import logging
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESTRICTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'restriction_list.json')
+
+MATCHER_ENGINES = ('regex', 'aho-corasick')
+
+# Ingredient texts joined per scan; enough to amortize the per-call overhead, while
+# much larger batches only add allocation churn
+DEFAULT_BATCH_SIZE = 256
+
+# Ingredient terms for the major allergens, keyed by the OFF allergen tag they imply
+ALLERGEN_TERMS = {
+    'en:milk': ('milk', 'butter', 'buttermilk', 'cream', 'cheese', 'whey', 'casein', 'caseinate', 'lactose',
+                'lactalbumin', 'yogurt', 'ghee', 'curd', 'milk powder', 'milk solids', 'milkfat', 'skim milk'),
+    'en:eggs': ('egg', 'egg white', 'egg yolk', 'albumen', 'ovalbumin', 'lysozyme', 'mayonnaise', 'meringue'),
+    'en:gluten': ('wheat', 'wheat flour', 'barley', 'rye', 'oats', 'spelt', 'malt', 'malt extract', 'semolina',
+                  'durum', 'farro', 'kamut', 'triticale', 'couscous', 'seitan', 'bulgur'),
+    'en:peanuts': ('peanut', 'peanut butter', 'groundnut', 'arachis oil'),
+    'en:nuts': ('almond', 'hazelnut', 'walnut', 'cashew', 'pecan', 'pistachio', 'macadamia', 'brazil nut',
+                'praline', 'marzipan'),
+    'en:soybeans': ('soy', 'soya', 'soybean', 'soy lecithin', 'soy protein', 'tofu', 'edamame', 'miso', 'tempeh'),
+    'en:fish': ('fish', 'anchovy', 'anchovies', 'cod', 'salmon', 'tuna', 'sardine', 'mackerel', 'fish sauce',
+                'fish oil'),
+    'en:crustaceans': ('shrimp', 'prawn', 'crab', 'lobster', 'crayfish', 'krill'),
+    'en:molluscs': ('clam', 'mussel', 'oyster', 'scallop', 'squid', 'octopus'),
+    'en:sesame-seeds': ('sesame', 'sesame seeds', 'tahini'),
+    'en:mustard': ('mustard',),
+    'en:celery': ('celery', 'celeriac'),
+    'en:lupin': ('lupin', 'lupine'),
+    'en:sulphur-dioxide-and-sulphites': ('sulphite', 'sulphur dioxide', 'sodium metabisulphite',
+                                          'potassium metabisulphite'),
+}
+
+# Phrases containing a dairy term that name something else, with that term: plant
+# milks and creams, cocoa, shea and nut butters, cream of tartar. Their other words
+# still count ('peanut' in 'peanut butter').
+SAFE_PHRASES = {
+    'cocoa butter': 'butter', 'cacao butter': 'butter', 'shea butter': 'butter', 'mango butter': 'butter',
+    'kokum butter': 'butter', 'peanut butter': 'butter', 'almond butter': 'butter', 'cashew butter': 'butter',
+    'nut butter': 'butter', 'seed butter': 'butter', 'sunflower butter': 'butter', 'apple butter': 'butter',
+    'butter beans': 'butter', 'coconut milk': 'milk', 'almond milk': 'milk', 'oat milk': 'milk',
+    'soy milk': 'milk', 'rice milk': 'milk', 'cashew milk': 'milk', 'hemp milk': 'milk', 'pea milk': 'milk',
+    'coconut cream': 'cream', 'cream of coconut': 'cream', 'cream of tartar': 'cream'
+}
+
+# Words before a term that negate it ('no milk', 'non dairy', 'without gluten'); a term
+# followed by FREE_WORD is negated too ('gluten free')
+NEGATING_WORDS = frozenset({'no', 'non', 'without'})
+FREE_WORD = 'free'
+
+# Characters before a term searched for an 'X free' qualifier ('gluten free rolled oats')
+QUALIFIER_REACH = 40
+
+# Allergen names whose 'X free' also clears the next term of that allergen, and of the
+# diets only it rules out ('gluten free oats')
+FREE_FROM_ALLERGENS = {
+    'dairy': 'en:milk', 'milk': 'en:milk', 'gluten': 'en:gluten', 'egg': 'en:eggs', 'soy': 'en:soybeans',
+    'peanut': 'en:peanuts', 'nut': 'en:nuts', 'fish': 'en:fish', 'shellfish': 'en:crustaceans',
+    'sesame': 'en:sesame-seeds', 'mustard': 'en:mustard', 'celery': 'en:celery', 'lupin': 'en:lupin',
+    'sulfite': 'en:sulphur-dioxide-and-sulphites', 'sulphite': 'en:sulphur-dioxide-and-sulphites'
+}
+
+# OFF allergen tags that on their own rule a product out for a diet
+ALLERGEN_TAG_RESTRICTIONS = {
+    'en:milk': ('Dairy Free', 'Vegan'),
+    'en:gluten': ('Gluten Free',),
+    'en:eggs': ('Vegan',),
+    'en:fish': ('Vegetarian', 'Vegan'),
+    'en:crustaceans': ('Vegetarian', 'Vegan'),
+    'en:molluscs': ('Vegetarian', 'Vegan'),
+}
+
+# (British, American) spellings; a term containing either also matches the other
+SPELLING_VARIANTS = (
+    ('flavour', 'flavor'), ('colour', 'color'), ('fibre', 'fiber'), ('yoghurt', 'yogurt'),
+    ('sulphite', 'sulfite'), ('sulphur', 'sulfur'), ('caramelised', 'caramelized'), ('alfa', 'alpha')
+)
+
+# Everything but ASCII letters and digits becomes a space, except list separators, which
+# become a comma so no term or negation reaches across them; non-ASCII letters are kept
+LIST_SEPARATORS = ',;:()[]'
+NORMALIZE_TABLE = str.maketrans({chr(code): ',' if chr(code) in LIST_SEPARATORS else ' '
+                                 for code in range(128) if not chr(code).isalnum()})
+
+# Plural suffixes every term also matches with
+PLURAL_SUFFIXES = ('s', 'es')
+
+def normalize_text(text: str) -> str:
+    """Lowercase, turn punctuation into spaces and collapse runs of spaces, so terms match on word boundaries."""
+    return ' '.join(text.lower().translate(NORMALIZE_TABLE).split())
+
+def previous_word(text: str, start: int) -> Tuple[str, int]:
+    """The word before position start of normalized text and where it starts, or ('', start)
+    at the start of a text or after a list separator."""
+    if start < 2 or text[start - 1] != ' ':
+        return '', start
+    word_start = text.rfind(' ', 0, start - 1) + 1
+    word = text[word_start:start - 1]
+    if '\n' in word:
+        newline = word.rindex('\n') + 1
+        word, word_start = word[newline:], word_start + newline
+    return word, word_start
+
+def followed_by(text: str, end: int, word: str) -> bool:
+    """True if word follows position end of normalized text."""
+    after = end + len(word) + 1
+    return text.startswith(word, end + 1) and text[end:end + 1] == ' ' and (after == len(text) or text[after] in ' \n,')
+
+def drop_contained(matches: Iterable[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+    """(start, end, term) matches sorted by start, longest first, without those inside an earlier longer one."""
+    kept = []
+    covered = -1
+    for match in matches:
+        if match[1] > covered:
+            kept.append(match)
+            covered = match[1]
+    return kept
+
+def term_variants(term: str) -> Set[str]:
+    """Normalized spellings of a term: as listed, with hyphens closed up, and with British/American spellings."""
+    lowered = term.lower()
+    variants = {normalize_text(lowered), normalize_text(lowered.replace('-', ''))}
+    for british, american in SPELLING_VARIANTS:
+        for variant in list(variants):
+            if british in variant:
+                variants.add(variant.replace(british, american))
+            if american in variant:
+                variants.add(variant.replace(american, british))
+    variants.discard('')
+    return variants
+
+def load_restrictions(filename: str = DEFAULT_RESTRICTIONS_FILE) -> Dict[str, List[str]]:
+    """Load {diet: [terms]} from a restriction list JSON file."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def split_tags(field: Optional[str]) -> List[str]:
+    """Tags of a comma-separated OFF tags field such as 'en:milk,en:soybeans'."""
+    return [tag.strip().lower() for tag in (field or '').split(',') if tag.strip()]
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """Regex alternation of words factored into a character trie.
+
+    Alternatives sharing a prefix are tried once instead of once per word, and each
+    optional continuation is greedy, so the longest word at a position is tried first.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return f'(?:{body})?'
+        return body
+
+    return build(trie)
+
+class RestrictionMatcher:
+    """Finds the allergen and diet terms in ingredient texts.
+
+    Every term belongs to one or more labels: diet names from the restriction list and
+    OFF allergen tags from ALLERGEN_TERMS. Only the longest term is reported, carrying
+    the labels of every shorter term it contains, so 'beef broth' flags whatever 'beef'
+    would, except the dairy term of a safe phrase: 'peanut butter' flags only peanuts.
+    """
+
+    def __init__(self, restrictions: Dict[str, Sequence[str]], allergens: Dict[str, Sequence[str]] = None,
+                 engine: str = 'regex'):
+        if engine not in MATCHER_ENGINES:
+            raise ValueError(f"Unknown matcher engine: {engine}")
+
+        self.restrictions = list(restrictions)
+        allergens = ALLERGEN_TERMS if allergens is None else allergens
+        self.allergens = frozenset(allergens)
+
+        own_labels: Dict[str, Set[str]] = {}
+        # Every normalized variant -> its canonical term
+        self.variants: Dict[str, str] = {}
+        for dictionary in (restrictions, allergens):
+            for label, terms in dictionary.items():
+                for term in terms:
+                    canonical = normalize_text(term)
+                    if not canonical:
+                        continue
+                    own_labels.setdefault(canonical, set()).add(label)
+                    for variant in term_variants(term):
+                        self.variants.setdefault(variant, canonical)
+        # Safe phrases are terms without labels of their own
+        for phrase in SAFE_PHRASES:
+            canonical = normalize_text(phrase)
+            own_labels.setdefault(canonical, set())
+            for variant in term_variants(phrase):
+                self.variants.setdefault(variant, canonical)
+
+        self.term_labels: Dict[str, Tuple[str, ...]] = {}
+        for term, labels in own_labels.items():
+            implied = set(labels)
+            words = term.split()
+            hidden = self.hidden_spans(words)
+            for first in range(len(words)):
+                for last in range(first + 1, len(words) + 1):
+                    if (first, last) in hidden:
+                        continue
+                    phrase = ' '.join(words[first:last])
+                    # Also the singular of a plural phrase, as the matcher accepts plurals
+                    for candidate in (phrase,) + tuple(phrase[:-len(suffix)] for suffix in PLURAL_SUFFIXES
+                                                       if phrase.endswith(suffix)):
+                        implied |= own_labels.get(candidate, set())
+            self.term_labels[term] = tuple(sorted(implied))
+
+        # Labels an 'X free' qualifier clears from the next term: the allergen and the
+        # diets no other allergen tag rules out
+        self.free_from: Dict[str, FrozenSet[str]] = {}
+        for word, tag in FREE_FROM_ALLERGENS.items():
+            diets = {diet for diet in ALLERGEN_TAG_RESTRICTIONS.get(tag, ())
+                     if not any(diet in other_diets for other_tag, other_diets in ALLERGEN_TAG_RESTRICTIONS.items()
+                                if other_tag != tag)}
+            self.free_from[word] = frozenset({tag} | diets)
+
+        self.engine = engine
+        if engine == 'aho-corasick':
+            try:
+                import ahocorasick
+            except ImportError:
+                logger.warning("pyahocorasick is not installed, falling back to the regex matcher")
+                self.engine = 'regex'
+            else:
+                self.automaton = ahocorasick.Automaton()
+                for variant, canonical in self.variants.items():
+                    for suffix in ('',) + PLURAL_SUFFIXES:
+                        key = variant + suffix
+                        if key not in self.automaton:
+                            self.automaton.add_word(key, (len(key), canonical))
+                self.automaton.make_automaton()
+
+        if self.engine == 'regex':
+            plural = '|'.join(PLURAL_SUFFIXES)
+            self.pattern = re.compile(rf'\b(?:{trie_pattern(self.variants)})(?:{plural})?\b')
+
+    @classmethod
+    def from_file(cls, filename: str = DEFAULT_RESTRICTIONS_FILE, engine: str = 'regex') -> 'RestrictionMatcher':
+        """Matcher for the restriction list in filename and the built-in allergen terms."""
+        return cls(load_restrictions(filename), engine=engine)
+
+    @staticmethod
+    def hidden_spans(words: Sequence[str]) -> Set[Tuple[int, int]]:
+        """(first, last) word spans of a term that are the dairy term of a safe phrase inside it."""
+        hidden = set()
+        for phrase, dairy_term in SAFE_PHRASES.items():
+            phrase_words, dairy_words = phrase.split(), dairy_term.split()
+            offset = next(i for i in range(len(phrase_words)) if phrase_words[i:i + len(dairy_words)] == dairy_words)
+            for first in range(len(words) - len(phrase_words) + 1):
+                if words[first:first + len(phrase_words)] == phrase_words:
+                    hidden.add((first + offset, first + offset + len(dairy_words)))
+        return hidden
+
+    def canonical_term(self, matched: str) -> str:
+        """Canonical term of a matched variant, with any plural suffix removed."""
+        canonical = self.variants.get(matched)
+        if canonical is None:
+            for suffix in PLURAL_SUFFIXES:
+                if matched.endswith(suffix):
+                    canonical = self.variants.get(matched[:-len(suffix)])
+                    if canonical is not None:
+                        break
+        return canonical
+
+    def find_terms(self, normalized: str) -> List[Tuple[int, int, str]]:
+        """(start, end, canonical term) of the longest term at each word of normalized text,
+        leaving out terms inside a longer one ('butter' in 'peanut butter')."""
+        if self.engine == 'aho-corasick':
+            return self._find_terms_automaton(normalized)
+
+        found = []
+        search = self.pattern.search
+        match = search(normalized)
+        while match:
+            found.append((match.start(), match.end(), self.canonical_term(match.group())))
+            # Resume at the next word inside the match, so overlapping terms are found too
+            match = search(normalized, match.start() + 1)
+        return drop_contained(found)
+
+    def _find_terms_automaton(self, normalized: str) -> List[Tuple[int, int, str]]:
+        """find_terms with the automaton, which reports every substring match: keep whole words, longest per start."""
+        longest: Dict[int, Tuple[int, str]] = {}
+        size = len(normalized)
+        for end, (length, canonical) in self.automaton.iter(normalized):
+            start = end - length + 1
+            if (start and normalized[start - 1].isalnum()) or (end + 1 < size and normalized[end + 1].isalnum()):
+                continue
+            if start not in longest or longest[start][0] < length:
+                longest[start] = (length, canonical)
+        return drop_contained((start, start + length, canonical) for start, (length, canonical) in sorted(longest.items()))
+
+    def occurrence_labels(self, normalized: str, start: int, end: int, term: str) -> Tuple[str, ...]:
+        """Labels of a term found at normalized[start:end]: none when negated, and without
+        those an 'X free' qualifier earlier in its list item clears."""
+        if followed_by(normalized, end, FREE_WORD) or previous_word(normalized, start)[0] in NEGATING_WORDS:
+            return ()
+        labels = self.term_labels[term]
+        reach = max(0, start - QUALIFIER_REACH)
+        free_at = normalized.rfind(' ' + FREE_WORD + ' ', reach, start)
+        if free_at >= 0 and normalized.find(',', free_at, start) < 0 and '\n' not in normalized[free_at:start]:
+            qualifier = previous_word(normalized, free_at + 1)[0]
+            cleared = self.free_from.get(qualifier) or self.free_from.get(qualifier[:-1] if qualifier.endswith('s') else '')
+            if cleared:
+                labels = tuple(label for label in labels if label not in cleared)
+        return labels
+
+    def labels_of(self, normalized: str, matches: Iterable[Tuple[int, int, str]]) -> Dict[str, List[str]]:
+        """{label: sorted terms} of the find_terms matches of one normalized text."""
+        found: Dict[str, Set[str]] = {}
+        for start, end, term in matches:
+            for label in self.occurrence_labels(normalized, start, end, term):
+                found.setdefault(label, set()).add(term)
+        return {label: sorted(terms) for label, terms in sorted(found.items())}
+
+    def match(self, text: Optional[str]) -> Dict[str, List[str]]:
+        """{label: sorted matched terms} for one ingredient text."""
+        return self.match_batch([text])[0]
+
+    def match_batch(self, texts: Sequence[Optional[str]]) -> List[Dict[str, List[str]]]:
+        """match for each text, scanning the whole batch as one string."""
+        normalized = [normalize_text(text) if text else '' for text in texts]
+        # A newline is not part of any term, so no match spans two texts
+        ends = []
+        offset = 0
+        for text in normalized:
+            offset += len(text) + 1
+            ends.append(offset)
+
+        # Matches come in text order, so walk the texts alongside them
+        joined = '\n'.join(normalized)
+        found: List[List[Tuple[int, int, str]]] = [[] for _ in texts]
+        index = 0
+        for match in self.find_terms(joined):
+            while match[0] >= ends[index]:
+                index += 1
+            found[index].append(match)
+        return [self.labels_of(joined, matches) for matches in found]
+
+    def product_flags(self, code: str, matches: Dict[str, List[str]], has_ingredients: bool,
+                      allergens_field: Optional[str] = None, traces_field: Optional[str] = None) -> Dict[str, Any]:
+        """Per-product flags from the text matches and the OFF allergens and traces tags.
+
+        'diets' maps each violated diet, and 'allergens' each present allergen, to its
+        evidence: matched terms and tags. An empty 'diets' only means compatible with
+        every diet when has_ingredients is true.
+        """
+        allergens = {label: list(terms) for label, terms in matches.items() if label in self.allergens}
+        diets = {label: list(terms) for label, terms in matches.items() if label not in self.allergens}
+        tags = split_tags(allergens_field)
+        for tag in tags:
+            allergens.setdefault(tag, []).append(tag)
+        for tag in tags:
+            for diet in ALLERGEN_TAG_RESTRICTIONS.get(tag, ()):
+                if diet in self.restrictions and tag not in diets.get(diet, ()):
+                    diets.setdefault(diet, []).append(tag)
+        return {
+            'code': code,
+            'has_ingredients': has_ingredients,
+            'diets': diets,
+            'allergens': allergens,
+            'traces': split_tags(traces_field)
+        }
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+OpenFoodFacts Ingredient Pipeline
+
+One entry point for the ingredient scripts, as cached stages:
+
+    fetch      the dump: downloaded when given a URL, linked when given a local file
+    tokenize   the one pass over the dump: each selected product's ingredients, as a
+               vocabulary file of raw counts and per-product ID lists
+    count      ingredient frequencies, with near-duplicate variants merged if asked
+    filter     without common words and very short ingredients
+    export     top_10000_usa_ingredients.csv/.txt
+    scrape     unique_ingredients.csv/.txt from the OFF search API (--scrape)
+    sample     random_products.json (--samples)
+
+Each stage is cached on its parameters and the content of its inputs (see pipeline.py),
+so a rerun only does what changed: a new --common-words list reruns filter and export
+from the cached counts, not the scan. scrape and sample don't depend on the dump and
+run alongside it. Exported files are copied to the output directory.
+"""
+
+import csv
+import importlib.util
+import os
+import subprocess
+import sys
+import argparse
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from pipeline import DEFAULT_CACHE_DIR, MANIFEST_FILE, Pipeline, Stage, file_fingerprint, publish
+from product_sources import read_products
+from ingredient_vocabulary import IngredientVocabulary, MappedVocabulary
+from english_filter import read_frequencies
+from off_client import USER_AGENT
+from tsv_reader import READER_ENGINES
+from metrics import Metrics, add_metrics_arguments, instrumented
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOKENS_FILE = 'ingredients.vocab'
+COUNTS_FILE = 'ingredient_counts.csv'
+FILTERED_FILE = 'filtered_counts.csv'
+EXPORT_BASENAME = 'top_10000_usa_ingredients'
+
+# Bytes per chunk when downloading the dump
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+def load_script(filename: str, module_name: str):
+    """Import one of the hyphenated scripts as a module."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def load_extractor():
+    """The tsv-ingredient-extractor.py module."""
+    return load_script('tsv-ingredient-extractor.py', 'tsv_ingredient_extractor')
+
+def is_url(source: str) -> bool:
+    return urlsplit(source).scheme in ('http', 'https')
+
+def source_version(source: str) -> Dict[str, Any]:
+    """What identifies the current content of a source: the fingerprint of a local file,
+    or the validators a HEAD request returns for a URL (empty if the server gives none)."""
+    if not is_url(source):
+        return file_fingerprint(source)
+    response = requests.head(source, headers={'User-Agent': USER_AGENT}, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    return {header: response.headers[header] for header in ('ETag', 'Last-Modified', 'Content-Length')
+            if header in response.headers}
+
+def only_file(directory: str) -> str:
+    """The single output file of an artifact directory."""
+    names = [name for name in os.listdir(directory) if name != MANIFEST_FILE]
+    return os.path.join(directory, names[0])
+
+def write_counts(filename: str, counts: List[tuple]) -> None:
+    """Write (ingredient, frequency) pairs as the extractor's CSV output."""
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ingredient', 'frequency'])
+        writer.writerows(counts)
+
+def fetch_stage(inputs: Dict[str, str], params: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """Download the dump, or link the local one into the artifact without copying it."""
+    source = params['source']
+    target = os.path.join(output_dir, os.path.basename(urlsplit(source).path) or 'products.tsv')
+    if not is_url(source):
+        os.symlink(os.path.abspath(source), target)
+        return {'bytes': os.path.getsize(source)}
+
+    with requests.get(source, headers={'User-Agent': USER_AGENT}, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(target, 'wb') as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    logger.info(f"Downloaded {source} ({os.path.getsize(target) / 1024 / 1024:.1f} MB)")
+    return {'bytes': os.path.getsize(target)}
+
+def tokenize_stage(inputs: Dict[str, str], params: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """Tokenize the selected products of the dump, as the extractor counts them, into a vocabulary file."""
+    module = load_extractor()
+    country_terms = tuple(params['countries'])
+    extractor = module.TSVIngredientsExtractor(country_terms, english_only=params['english_only'])
+    vocabulary = IngredientVocabulary()
+    stats = {'rows': 0, 'selected': 0}
+
+    def products():
+        # Every selected row is counted; only rows with a code get an ingredient list
+        for code, countries, ingredients_text_en, ingredients_text in read_products(
+                only_file(inputs['fetch']), module.PRODUCT_COLUMNS, engine=params['reader'], prefilter_terms=country_terms):
+            stats['rows'] += 1
+            countries = (countries or '').lower()
+            text = ingredients_text_en or ingredients_text
+            if not text or not any(term in countries for term in country_terms):
+                continue
+            ingredients = extractor.english_ingredients(text)
+            if ingredients is None:
+                continue
+            vocabulary.update(ingredients)
+            stats['selected'] += 1
+            if code:
+                yield code, ingredients
+
+    stats['products'] = vocabulary.save(os.path.join(output_dir, TOKENS_FILE), products())
+    stats['ingredients'] = len(vocabulary)
+    logger.info(f"Tokenized {stats['selected']} of {stats['rows']} rows into {stats['ingredients']} ingredients")
+    return stats
+
+def count_stage(inputs: Dict[str, str], params: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """Ingredient frequencies of the tokenized products, with variants merged if asked."""
+    module = load_extractor()
+    extractor = module.TSVIngredientsExtractor()
+    with MappedVocabulary(os.path.join(inputs['tokenize'], TOKENS_FILE)) as vocabulary:
+        extractor.ingredient_counts = Counter(dict(vocabulary.most_common()))
+    if params['cluster_variants']:
+        extractor.merge_variants()
+    write_counts(os.path.join(output_dir, COUNTS_FILE), module.rank_ingredients(extractor.ingredient_counts))
+    return {'ingredients': len(extractor.ingredient_counts), 'merged_variants': len(extractor.variant_map)}
+
+def filter_stage(inputs: Dict[str, str], params: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """Frequencies without common words and very short ingredients."""
+    module = load_extractor()
+    extractor = module.TSVIngredientsExtractor()
+    extractor.ingredient_counts = Counter(read_frequencies(os.path.join(inputs['count'], COUNTS_FILE)))
+    extractor.filter_common_words(params['common_words'])
+    write_counts(os.path.join(output_dir, FILTERED_FILE), module.rank_ingredients(extractor.ingredient_counts))
+    return {'ingredients': len(extractor.ingredient_counts)}
+
+def export_stage(inputs: Dict[str, str], params: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """The top ingredients as the extractor's CSV and text outputs; filter writes them ranked as the extractor does."""
+    top = list(read_frequencies(os.path.join(inputs['filter'], FILTERED_FILE)).items())[:params['top']]
+    write_counts(os.path.join(output_dir, EXPORT_BASENAME + '.csv'), top)
+    with open(os.path.join(output_dir, EXPORT_BASENAME + '.txt'), 'w', encoding='utf-8') as f:
+        f.writelines(f'{ingredient}\n' for ingredient, _ in top)
+    return {'ingredients': len(top)}
+
+def script_stage(inputs: Dict[str, str], params: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """Run one of the API scripts with its outputs written into the artifact directory."""
+    subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, params['script']), *params['args']],
+                   cwd=output_dir, check=True)
+    return {}
+
+def build_stages(args: argparse.Namespace, common_words: List[str]) -> List[Stage]:
+    """The stages for the command line arguments."""
+    stages = [
+        Stage('fetch', fetch_stage, params={'source': args.input if is_url(args.input) else os.path.abspath(args.input),
+                                            'version': source_version(args.input)}),
+        Stage('tokenize', tokenize_stage, ['fetch'],
+              {'countries': [term.strip().lower() for term in args.countries.split(',') if term.strip()],
+               'english_only': args.english_only, 'reader': args.reader}),
+        Stage('count', count_stage, ['tokenize'], {'cluster_variants': args.cluster_variants}, version=3),
+        Stage('filter', filter_stage, ['count'], {'common_words': common_words}, version=2),
+        Stage('export', export_stage, ['filter'], {'top': args.top},
+              publish=True)
+    ]
+
+    base_url = ['--base-url', args.base_url] if args.base_url else []
+    if args.scrape:
+        scrape_args = base_url + ['--english-only'] * args.english_only + ['--cluster-variants'] * args.cluster_variants
+        stages.append(Stage('scrape', script_stage, params={'script': 'ingredient-scraping-script.py', 'args': scrape_args},
+                            publish=True))
+    if args.samples:
+        sample_args = base_url + ['-n', str(args.samples), '--seed', str(args.seed)]
+        stages.append(Stage('sample', script_stage, params={'script': 'random-products-fetcher.py', 'args': sample_args},
+                            publish=True))
+    return stages
+
+def read_common_words(filename: Optional[str], extra: str) -> List[str]:
+    """The common words list: a file's words, one per line, or the extractor's, plus extra comma-separated ones."""
+    if filename:
+        with open(filename, 'r', encoding='utf-8') as f:
+            words = {line.strip().lower() for line in f if line.strip() and not line.startswith('#')}
+    else:
+        words = set(load_extractor().COMMON_WORDS)
+    words.update(word.strip().lower() for word in extra.split(',') if word.strip())
+    return sorted(words)
+
+def main():
+    """Main function with command line arguments."""
+    parser = argparse.ArgumentParser(description='Run the ingredient pipeline, skipping stages whose inputs and parameters are unchanged')
+    parser.add_argument('-i', '--input', default='en.openfoodfacts.org.products.tsv',
+                       help='TSV dump, optionally compressed, JSONL or Parquet export, or an http(s) URL to download it from (default: en.openfoodfacts.org.products.tsv)')
+    parser.add_argument('-o', '--output-dir', default='.',
+                       help='Directory the exported files are copied to (default: .)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                       help=f'Directory of the cached stage outputs (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                       help='Stages run at the same time when independent (default: 2)')
+    parser.add_argument('--stages', nargs='+',
+                       help='Only run these stages and those they depend on (default: all)')
+    parser.add_argument('--force', nargs='+', default=[],
+                       help='Rerun these stages even if cached, e.g. scrape to refresh API results')
+    parser.add_argument('--reader', choices=READER_ENGINES, default='projected',
+                       help='Row reader for the tokenize stage (default: projected)')
+    parser.add_argument('--countries', default='united states,usa',
+                       help='Comma-separated terms to match in countries_en (default: united states,usa)')
+    parser.add_argument('--english-only', action='store_true',
+                       help='Leave out foreign ingredients texts and tokens')
+    parser.add_argument('--cluster-variants', action='store_true',
+                       help='Merge near-duplicate ingredients in the count stage')
+    parser.add_argument('--common-words',
+                       help="File of words to filter out, one per line, instead of the extractor's list")
+    parser.add_argument('--extra-common-words', default='',
+                       help='Comma-separated words to filter out as well')
+    parser.add_argument('--top', type=int, default=10000,
+                       help='Ingredients exported (default: 10000)')
+    parser.add_argument('--scrape', action='store_true',
+                       help='Also run the ingredient scraper against the OFF search API')
+    parser.add_argument('--samples', type=int, default=0,
+                       help='Also fetch this many random products (default: 0)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Random seed for --samples, part of its cache key (default: 42)')
+    parser.add_argument('--base-url',
+                       help='Search endpoint for the scrape and sample stages, e.g. a local stub server')
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    if not is_url(args.input) and not os.path.exists(args.input):
+        parser.error(f'{args.input} not found')
+
+    metrics = Metrics()
+    with instrumented(args, metrics):
+        stages = build_stages(args, read_common_words(args.common_words, args.extra_common_words))
+        pipeline = Pipeline(stages, args.cache_dir, args.jobs, metrics)
+        try:
+            artifacts = pipeline.run(args.stages, args.force)
+        except (RuntimeError, ValueError) as e:
+            logger.error(str(e))
+            sys.exit(1)
+
+        for name, artifact in artifacts.items():
+            manifest = artifact.manifest
+            logger.info(f"  {name:<9} {'cached' if artifact.cached else 'ran':<7} {manifest['seconds']:>8.1f}s  {manifest['stats']}")
+        for path in publish(artifacts, stages, args.output_dir):
+            logger.info(f"Wrote {path}")
+
+if __name__ == "__main__":
+    main()
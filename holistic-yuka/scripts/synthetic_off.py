@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Synthetic OpenFoodFacts Corpus
+
+Deterministic generator of OpenFoodFacts-shaped TSV dumps for benchmarks: many unused
+columns around the ones the scripts read, Zipf-distributed ingredients with nested
+sub-ingredients, percentages, non-English texts and a mix of countries. The same seed
+always produces the same file.
+"""
+
+import random
+from typing import Dict, List, Sequence
+
+# Frequent real ingredients at the head of the distribution, in rough OFF frequency order
+COMMON_INGREDIENTS = (
+    'sugar', 'salt', 'water', 'wheat flour', 'soy lecithin', 'citric acid', 'natural flavor',
+    'corn syrup', 'milk', 'palm oil', 'sunflower oil', 'eggs', 'cocoa butter', 'skim milk',
+    'vitamin c', 'riboflavin', 'niacin', 'thiamine mononitrate', 'folic acid', 'reduced iron',
+    'garlic powder', 'onion powder', 'spices', 'yeast', 'baking soda', 'xanthan gum',
+    'whey', 'butter', 'cream', 'corn starch', 'modified food starch', 'canola oil',
+    'high fructose corn syrup', 'dextrose', 'maltodextrin', 'sodium benzoate', 'paprika',
+    'potassium sorbate', 'vinegar', 'tomato paste', 'rice', 'oats', 'honey', 'peanuts',
+    'almonds', 'vanilla extract', 'caramel color', 'red', 'yellow', 'gelatin', 'pectin'
+)
+
+# Non-English texts as found in the dump's ingredients_text column
+FOREIGN_INGREDIENTS = ('sucre', 'sel', 'farine de blé', 'lait écrémé', 'huile de tournesol',
+                       'zucker', 'weizenmehl', 'azúcar', 'harina de trigo', 'sale marino')
+
+# (countries_en value, weight)
+COUNTRIES = (
+    ('United States', 30), ('France', 25), ('Germany', 8), ('Spain', 6), ('Italy', 5),
+    ('United Kingdom', 5), ('Canada,United States', 3), ('Switzerland', 3), ('Belgium,France', 3),
+    ('en:usa', 1), ('', 11)
+)
+
+READ_COLUMNS = ('code', 'product_name', 'countries_en', 'ingredients_text', 'ingredients_text_en')
+
+SYLLABLES = ('ba', 'co', 'di', 'fa', 'ge', 'hi', 'ko', 'la', 'me', 'no', 'pa', 'ri', 'sa', 'to',
+             'vu', 'xan', 'tri', 'glu', 'mal', 'pro', 'ose', 'ate', 'ine', 'ol', 'yl', 'um')
+
+def synthetic_vocabulary(size: int, rng: random.Random) -> List[str]:
+    """The common ingredients followed by pronounceable made-up ones, optionally two words long."""
+    vocabulary = list(COMMON_INGREDIENTS[:size])
+    seen = set(vocabulary)
+    while len(vocabulary) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.3:
+            word += ' ' + ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+class SyntheticOFFGenerator:
+    """Deterministic stream of synthetic OFF products."""
+
+    def __init__(self, seed: int = 42, vocabulary_size: int = 20000, zipf_exponent: float = 1.1,
+                 filler_columns: int = 150):
+        self.rng = random.Random(seed)
+        self.vocabulary = synthetic_vocabulary(vocabulary_size, self.rng)
+        cumulative = 0.0
+        self.cum_weights: List[float] = []
+        for rank in range(1, len(self.vocabulary) + 1):
+            cumulative += 1.0 / (rank ** zipf_exponent)
+            self.cum_weights.append(cumulative)
+        self.countries = [country for country, _ in COUNTRIES]
+        self.country_weights = [weight for _, weight in COUNTRIES]
+        self.columns = list(READ_COLUMNS[:2]) + [f'field_{i}' for i in range(filler_columns)] + list(READ_COLUMNS[2:])
+
+    def ingredient(self) -> str:
+        """One ingredient, sometimes with a percentage or a parenthesised sub-ingredient list."""
+        rng = self.rng
+        name = rng.choices(self.vocabulary, cum_weights=self.cum_weights)[0]
+        roll = rng.random()
+        if roll < 0.1:
+            name += f' {rng.randint(1, 60)}.{rng.randint(0, 9)}%'
+        elif roll < 0.25:
+            inner = rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=rng.randint(1, 4))
+            name += ' (' + ', '.join(inner) + ')'
+        return name
+
+    def ingredients_text(self) -> str:
+        """A comma-separated ingredient list; about one in ten is in another language."""
+        rng = self.rng
+        if rng.random() < 0.1:
+            return ', '.join(rng.choice(FOREIGN_INGREDIENTS) for _ in range(rng.randint(2, 8)))
+        return ', '.join(self.ingredient() for _ in range(rng.randint(1, 25)))
+
+    def product(self, number: int) -> Dict[str, str]:
+        """The columns the scripts read for product number."""
+        rng = self.rng
+        text = self.ingredients_text() if rng.random() < 0.85 else ''
+        english = rng.random() < 0.4
+        return {
+            'code': str(3000000000000 + number),
+            'product_name': f'Product {number}',
+            'countries_en': rng.choices(self.countries, weights=self.country_weights)[0],
+            'ingredients_text': '' if english else text,
+            'ingredients_text_en': text if english else ''
+        }
+
+    def row(self, number: int) -> List[str]:
+        """A full TSV row with sparse filler values."""
+        product = self.product(number)
+        filler = ['', '', 'en:unknown', '0', '12.5'][number % 5]
+        return [product.get(column, filler) for column in self.columns]
+
+def write_synthetic_tsv(filename: str, rows: int, seed: int = 42, vocabulary_size: int = 20000) -> Sequence[str]:
+    """Write a synthetic OFF TSV dump with rows products. Returns the header."""
+    generator = SyntheticOFFGenerator(seed, vocabulary_size)
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        f.write('\t'.join(generator.columns) + '\n')
+        for number in range(rows):
+            f.write('\t'.join(generator.row(number)) + '\n')
+    return generator.columns
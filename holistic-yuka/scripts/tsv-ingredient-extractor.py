@@ -6,110 +6,588 @@ Extracts clean English ingredients from TSV file, including content in parenthes
 """
 
 import csv
+import heapq
+import os
 import re
-from typing import Dict, List
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Iterator, Union
 from collections import Counter
+from multiprocessing import Pool
+import argparse
 import logging
 
+from ingredient_tokenizer import tokenize_with_parentheses
+from tsv_reader import READER_ENGINES, project_rows, read_column_batches, universal_newlines
+from checkpoint import load_checkpoint, save_checkpoint
+from heavy_hitters import SpaceSaving
+from product_sources import is_plain_tsv_filename, read_products
+from product_index import DEFAULT_INDEX_FILE, ProductIndex, product_fingerprint
+from metrics import Metrics, add_metrics_arguments, instrumented
+from ingredient_db import DEFAULT_DATABASE_FILE, IngredientDatabase
+from vectorized_counts import count_batch, require_pyarrow
+from ingredient_vocabulary import DEFAULT_VOCABULARY_FILE, IngredientVocabulary
+from ingredient_clusters import VariantClusterer, merge_counts
+from english_filter import EnglishFilter
+from ingredient_cooccurrence import DEFAULT_COOCCURRENCE_FILE, CooccurrenceAccumulator, read_vocabulary_csv, require_numpy
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# The only TSV columns the extractor reads
+TSV_COLUMNS = ('countries_en', 'ingredients_text_en', 'ingredients_text')
+
+# Incremental updates also need the product barcode
+PRODUCT_COLUMNS = ('code',) + TSV_COLUMNS
+
+# The database export also stores product names
+EXPORT_COLUMNS = ('code', 'product_name') + TSV_COLUMNS
+
+# Counts whole column batches with pyarrow compute kernels instead of reading rows
+VECTORIZED_READER = 'vectorized'
+EXTRACTOR_READERS = READER_ENGINES + (VECTORIZED_READER,)
+
+# TSV bytes per vectorized batch (pyarrow batches by size, not rows): some 40k rows of
+# the full dump; peak memory grows a few times this, larger blocks gain little
+VECTORIZED_BLOCK_SIZE = 1 << 27
+
+# Splits a '\n'-terminated line after each bare '\r', which text mode also reads as a line end
+BARE_CARRIAGE_RETURN = re.compile(rb'(?<=\r)(?!\n)')
+
+# Seconds between periodic checkpoints
+CHECKPOINT_INTERVAL = 60.0
+DEFAULT_CHECKPOINT_FILE = 'tsv_extraction.checkpoint.json'
+
+# Products count when countries_en contains any of these (case-insensitive)
+DEFAULT_COUNTRY_TERMS = ('united states', 'usa')
+
+# Very common words that aren't actual ingredients, removed with ingredients shorter
+# than MIN_FILTERED_LENGTH before the top ingredients are saved
+COMMON_WORDS = frozenset({
+    'and', 'or', 'the', 'of', 'in', 'with', 'from', 'by', 'for', 'on', 'at', 'to', 'as',
+    'may', 'contain', 'contains', 'including', 'made', 'using', 'added', 'per', 'each',
+    'less', 'than', 'more', 'some', 'other', 'also', 'natural', 'artificial', 'flavor',
+    'flavoring', 'flavour', 'flavouring', 'extract', 'powder', 'dried', 'fresh'
+})
+MIN_FILTERED_LENGTH = 3
+
+def rank_ingredients(counts: Dict[str, int], count: int = None) -> List[tuple]:
+    """(ingredient, frequency) pairs by descending frequency, ties alphabetically, so the
+    order and the top-N cutoff don't depend on the order ingredients were counted in."""
+    key = lambda item: (-item[1], item[0])
+    if count is None:
+        return sorted(counts.items(), key=key)
+    return heapq.nsmallest(count, counts.items(), key=key)
+
+def find_chunk_boundaries(filename: str, num_chunks: int, start: int = None) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Split the TSV body, from start if given, into byte ranges that start and end on line boundaries."""
+    with open(filename, 'rb') as file:
+        header_line = file.readline()
+        data_start = max(file.tell(), start or 0)
+        file_size = os.fstat(file.fileno()).st_size
+        
+        fieldnames = next(csv.reader([header_line.decode('utf-8')], delimiter='\t'), [])
+        
+        # Move each approximate split point forward to the start of the next line
+        chunk_size = max(1, (file_size - data_start) // max(1, num_chunks))
+        offsets = [data_start]
+        for i in range(1, num_chunks):
+            file.seek(data_start + i * chunk_size)
+            file.readline()
+            offset = file.tell()
+            if offset >= file_size:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+        offsets.append(file_size)
+    
+    chunks = [(offsets[i], offsets[i + 1]) for i in range(len(offsets) - 1) if offsets[i] < offsets[i + 1]]
+    return fieldnames, chunks
+
+class LineRangeReader:
+    """Iterate decoded lines of a binary file within [start, end), tracking the byte offset reached.
+    
+    Lines end where the text-mode readers' universal newlines end them: at '\\n',
+    '\\r\\n' or a bare '\\r', each yielded as '\\n'.
+    """
+    
+    def __init__(self, file, start: int, end: int = None):
+        self.file = file
+        self.position = start
+        self.end = end
+        
+    def __iter__(self) -> Iterator[str]:
+        self.file.seek(self.position)
+        while self.end is None or self.position < self.end:
+            line = self.file.readline()
+            if not line:
+                break
+            if b'\r' not in line:
+                self.position += len(line)
+                yield line.decode('utf-8')
+                continue
+            for piece in BARE_CARRIAGE_RETURN.split(line):
+                self.position += len(piece)
+                yield universal_newlines(piece).decode('utf-8')
+
+def _count_chunk(task: Tuple[str, int, int, List[str], Dict[str, Any]]) -> Tuple[Union[Counter, SpaceSaving], int, int, int,
+                                                                           Optional[CooccurrenceAccumulator]]:
+    """Worker entry point: count ingredients (and pairs, when enabled) for one byte range of the TSV file."""
+    filename, start, end, fieldnames, settings = task
+    extractor = TSVIngredientsExtractor(**settings)
+    row_count = extractor.process_byte_range(filename, start, end, fieldnames)
+    if extractor.cooccurrence is not None:
+        # Sort the chunk's pairs into one run here rather than in the parent
+        extractor.cooccurrence.pair_counts()
+    return extractor.ingredient_counts, extractor.processed_count, row_count, extractor.emitted_count, extractor.cooccurrence
+
 class TSVIngredientsExtractor:
-    def __init__(self):
-        self.ingredient_counts: Counter = Counter()
+    def __init__(self, country_terms: Tuple[str, ...] = DEFAULT_COUNTRY_TERMS, top_k_capacity: int = None,
+                 metrics: Metrics = None, english_only: bool = False, cooccurrence: bool = False,
+                 cooccurrence_vocabulary: List[str] = None):
+        # With top_k_capacity, counts are approximate but memory is bounded to that many ingredients
+        self.top_k_capacity = top_k_capacity
+        self.ingredient_counts: Union[Counter, SpaceSaving] = SpaceSaving(top_k_capacity) if top_k_capacity else Counter()
         self.processed_count = 0
+        self.emitted_count = 0
+        self.metrics = metrics or Metrics()
+        self.country_terms = tuple(term.lower() for term in country_terms)
+        self.reader_stats: Dict[str, int] = {}
+        # With english_only, foreign ingredients texts and tokens are left out
+        self.english_only = english_only
+        self.english_filter = EnglishFilter() if english_only else None
+        # {variant: canonical} once merge_variants has run
+        self.variant_map: Dict[str, str] = {}
+        # With cooccurrence, pairs of ingredients listed together are counted as well,
+        # only among cooccurrence_vocabulary when given
+        self.cooccurrence_vocabulary = cooccurrence_vocabulary
+        self.cooccurrence = CooccurrenceAccumulator(cooccurrence_vocabulary) if cooccurrence else None
         
     def extract_ingredients_with_parentheses(self, ingredients_text: str) -> List[str]:
         """Extract individual ingredients including content in parentheses."""
-        if not ingredients_text:
-            return []
+        return tokenize_with_parentheses(ingredients_text)
+    
+    def english_ingredients(self, ingredients_text: str) -> Optional[List[str]]:
+        """The ingredients of a text, only the English ones with english_only, or None if the text is foreign."""
+        english_filter = self.english_filter
+        if english_filter is None:
+            return self.extract_ingredients_with_parentheses(ingredients_text)
+        if not english_filter.is_english_text(ingredients_text):
+            return None
+        return english_filter.filter_tokens(self.extract_ingredients_with_parentheses(ingredients_text))
+    
+    def process_row(self, row: Dict[str, str]) -> None:
+        """Count the ingredients of a single TSV row if it is from a selected country."""
+        self.process_columns(*(row.get(column) for column in TSV_COLUMNS))
+    
+    def process_columns(self, countries: str, ingredients_text_en: str, ingredients_text: str) -> None:
+        """Count the ingredients of a product given its projected TSV columns."""
+        # Check if product is from one of the selected countries (USA by default)
+        countries = countries or ''
+        countries = countries.lower()
+        if not any(term in countries for term in self.country_terms):
+            return
+        
+        # Get ingredients text from the row (prefer English)
+        ingredients_text = ingredients_text_en or ingredients_text
+        
+        if ingredients_text:
+            ingredients = self.english_ingredients(ingredients_text)
+            if ingredients is None:
+                return
+            # Count each ingredient occurrence
+            self.ingredient_counts.update(ingredients)
+            if self.cooccurrence is not None:
+                self.cooccurrence.add(ingredients)
+            self.processed_count += 1
+            self.emitted_count += len(ingredients)
+    
+    def publish_metrics(self, row_count: int) -> None:
+        """Copy the running row and ingredient totals into the metrics registry."""
+        self.metrics.set_counter('extractor_rows_parsed_total', row_count)
+        self.metrics.set_counter('extractor_rows_selected_total', self.processed_count)
+        self.metrics.set_counter('extractor_rows_filtered_total', row_count - self.processed_count)
+        self.metrics.set_counter('extractor_ingredients_emitted_total', self.emitted_count)
+        self.metrics.set_gauge('extractor_unique_ingredients', len(self.ingredient_counts))
+        if self.reader_stats.get('total_rows'):
+            self.metrics.set_counter('extractor_rows_prefiltered_total', self.reader_stats['skipped_rows'])
+        if self.english_filter:
+            self.metrics.set_counter('extractor_foreign_texts_total', self.english_filter.texts_rejected)
+            self.metrics.set_counter('extractor_foreign_tokens_total', self.english_filter.tokens_rejected)
+        if self.cooccurrence is not None:
+            self.metrics.set_gauge('extractor_cooccurrence_pairs', len(self.cooccurrence))
+    
+    def worker_settings(self) -> Dict[str, Any]:
+        """Constructor arguments that give worker processes the same configuration."""
+        return {'country_terms': self.country_terms, 'top_k_capacity': self.top_k_capacity,
+                'english_only': self.english_only, 'cooccurrence': self.cooccurrence is not None,
+                'cooccurrence_vocabulary': self.cooccurrence_vocabulary}
+    
+    def process_byte_range(self, filename: str, start: int, end: int, fieldnames: List[str]) -> int:
+        """Process the rows of a TSV file that start within [start, end). Returns the row count."""
+        row_count = 0
+        with open(filename, 'rb') as file:
+            for columns in project_rows(LineRangeReader(file, start, end), fieldnames, TSV_COLUMNS):
+                self.process_columns(*columns)
+                row_count += 1
+        return row_count
+    
+    def process_tsv_file(self, filename: str, max_rows: int = None, workers: int = 1, reader: str = 'projected',
+                         checkpoint_file: str = None, resume: bool = False) -> None:
+        """Process TSV file and count ingredient frequencies.
+        
+        reader selects how rows are read: 'projected' pulls only the needed columns by
+        index, 'mmap' additionally skips lines not mentioning any country term before
+        parsing them, 'pandas'/'pyarrow' use those libraries when installed, 'dict'
+        builds a full dict per row.
+        
+        With checkpoint_file, progress is saved periodically and resume continues from
+        the last checkpoint; this always uses the projected reader.
+        
+        reader 'vectorized' counts whole column batches with pyarrow compute kernels
+        instead of reading rows (see process_tsv_file_vectorized), in a single process
+        without checkpoints.
+        
+        filename may also be a compressed dump (.gz, .bz2, .xz, .zst), a line-delimited
+        JSON export or a Parquet export; these are always processed serially without
+        checkpoints since they can't be split or resumed by byte offset.
+        """
+        if checkpoint_file and self.top_k_capacity:
+            logger.warning("Checkpoints are not supported with approximate top-K counting, running without them")
+            checkpoint_file = None
+        if checkpoint_file and self.cooccurrence is not None:
+            logger.warning("Checkpoints don't store co-occurrence counts, running without them")
+            checkpoint_file = None
+        
+        if reader == VECTORIZED_READER:
+            reader = self.check_vectorized_reader(filename)
+            if reader == VECTORIZED_READER:
+                if workers > 1 or checkpoint_file:
+                    logger.warning("The vectorized reader runs in one process without checkpoints; "
+                                   "pyarrow already parses the file on several threads")
+                self.process_tsv_file_vectorized(filename, max_rows)
+                return
         
-        # First, extract content from parentheses and add to main text
-        parentheses_content = re.findall(r'\(([^)]+)\)', ingredients_text)
+        if not is_plain_tsv_filename(filename) and (workers > 1 or checkpoint_file):
+            logger.warning(f"{filename} can't be split by byte offset, processing serially without checkpoints")
+            workers, checkpoint_file = 1, None
         
-        # Remove parentheses but keep the content
-        text_without_parens = re.sub(r'\([^)]*\)', '', ingredients_text)
+        if workers > 1:
+            if max_rows:
+                logger.warning("max_rows is not supported in parallel mode, processing serially")
+            else:
+                self.process_tsv_file_parallel(filename, workers, checkpoint_file, resume)
+                return
         
-        # Combine main text with parentheses content
-        all_text = text_without_parens
-        for content in parentheses_content:
-            all_text += ', ' + content
+        if checkpoint_file:
+            if reader != 'projected':
+                logger.warning(f"Checkpointing uses the projected reader instead of {reader}")
+            self.process_tsv_file_checkpointed(filename, checkpoint_file, max_rows, resume)
+            return
         
-        # Split by common separators (comma, semicolon, etc.)
-        ingredients = re.split(r'[,;]', all_text)
+        logger.info(f"Processing TSV file: {filename}")
         
-        clean_ingredients = []
-        for ingredient in ingredients:
-            # Clean up the text - keep only letters and spaces
-            cleaned = re.sub(r'[^a-zA-Z\s]', '', ingredient)
+        row_num = 0
+        try:
+            self.reader_stats = {}
+            rows = read_products(filename, TSV_COLUMNS, engine=reader,
+                                 prefilter_terms=self.country_terms, stats=self.reader_stats)
             
-            # Remove extra whitespace and convert to lowercase
-            cleaned = ' '.join(cleaned.split()).lower().strip()
+            for row_num, columns in enumerate(rows, 1):
+                if max_rows and row_num > max_rows:
+                    logger.info(f"Reached maximum rows limit: {max_rows}")
+                    break
+                
+                self.process_columns(*columns)
+                
+                # Log progress every 50000 rows
+                if row_num % 50000 == 0:
+                    logger.info(f"Processed {row_num} rows, found {len(self.ingredient_counts)} unique ingredients, {self.processed_count} USA products")
+                    self.publish_metrics(row_num)
             
-            # Only keep if it's a reasonable ingredient (not empty, not too short)
-            if cleaned and len(cleaned) >= 3:
-                # Split multi-word ingredients and add individual words too
-                words = cleaned.split()
-                if len(words) > 1:
-                    clean_ingredients.append(cleaned)  # Keep full phrase
-                    # Also add individual meaningful words
-                    for word in words:
-                        if len(word) >= 3:
-                            clean_ingredients.append(word)
-                else:
-                    clean_ingredients.append(cleaned)
+            self.publish_metrics(row_num)
+            if self.reader_stats.get('total_rows'):
+                logger.info(f"Prefilter skipped {self.reader_stats['skipped_rows']} of {self.reader_stats['total_rows']} rows without parsing them")
+                    
+        except FileNotFoundError:
+            logger.error(f"File {filename} not found")
+        except Exception as e:
+            logger.error(f"Error processing file: {e}")
+    
+    def check_vectorized_reader(self, filename: str) -> str:
+        """The vectorized reader if it can read filename, otherwise the projected reader with a warning."""
+        try:
+            require_pyarrow()
+        except ImportError:
+            logger.warning("pyarrow is not installed, falling back to the projected reader")
+            return 'projected'
+        if self.english_filter:
+            logger.warning("The vectorized reader has no English filter, falling back to the projected reader")
+            return 'projected'
+        if self.cooccurrence is not None:
+            logger.warning("The vectorized reader doesn't count co-occurrences, falling back to the projected reader")
+            return 'projected'
+        if not is_plain_tsv_filename(filename) and not filename.endswith(('.gz', '.bz2', '.zst')):
+            logger.warning(f"The vectorized reader only reads TSV dumps, falling back to the projected reader for {filename}")
+            return 'projected'
+        return VECTORIZED_READER
+    
+    def process_tsv_file_vectorized(self, filename: str, max_rows: int = None) -> None:
+        """Count ingredients a column batch at a time with pyarrow compute kernels.
+        
+        The counts equal those of the row readers; like the pyarrow reader, rows whose
+        column count doesn't match the header are skipped.
+        """
+        logger.info(f"Processing TSV file: {filename} in vectorized column batches")
+        
+        row_count = 0
+        try:
+            for batch in read_column_batches(filename, TSV_COLUMNS, VECTORIZED_BLOCK_SIZE):
+                if max_rows and row_count + batch.num_rows > max_rows:
+                    batch = batch.slice(0, max_rows - row_count)
+                
+                counts, selected, emitted = count_batch(*(batch.column(column) for column in TSV_COLUMNS),
+                                                        self.country_terms)
+                self.ingredient_counts.update(counts)
+                self.processed_count += selected
+                self.emitted_count += emitted
+                row_count += batch.num_rows
+                
+                logger.info(f"Processed {row_count} rows, found {len(self.ingredient_counts)} unique ingredients, {self.processed_count} USA products")
+                self.publish_metrics(row_count)
+                
+                if max_rows and row_count >= max_rows:
+                    logger.info(f"Reached maximum rows limit: {max_rows}")
+                    break
+                    
+        except FileNotFoundError:
+            logger.error(f"File {filename} not found")
+        except Exception as e:
+            logger.error(f"Error processing file: {e}")
+    
+    def save_checkpoint(self, checkpoint_file: str, filename: str, offset: int, row_count: int, completed: bool = False) -> None:
+        """Save the TSV byte offset reached and the counts so far."""
+        save_checkpoint(checkpoint_file, {
+            'input': os.path.abspath(filename),
+            'input_size': os.path.getsize(filename),
+            'country_terms': list(self.country_terms),
+            'english_only': self.english_only,
+            'offset': offset,
+            'row_count': row_count,
+            'processed_count': self.processed_count,
+            'completed': completed,
+            'ingredient_counts': dict(self.ingredient_counts)
+        })
+    
+    def restore_checkpoint(self, checkpoint_file: str, filename: str) -> Optional[Tuple[int, int, bool]]:
+        """Restore counts from a checkpoint of the same input. Returns (offset, row_count, completed)."""
+        state = load_checkpoint(checkpoint_file)
+        if not state:
+            logger.info(f"No usable checkpoint at {checkpoint_file}, starting from the beginning")
+            return None
         
-        return clean_ingredients
+        if (state.get('input') != os.path.abspath(filename) or state.get('input_size') != os.path.getsize(filename)
+                or tuple(state.get('country_terms', ())) != self.country_terms
+                or state.get('english_only', False) != self.english_only):
+            logger.warning(f"Checkpoint {checkpoint_file} was made for a different input, countries or language filter, starting from the beginning")
+            return None
+        
+        self.ingredient_counts = Counter(state['ingredient_counts'])
+        self.processed_count = state['processed_count']
+        self.emitted_count = sum(self.ingredient_counts.values())
+        logger.info(f"Resuming from checkpoint at byte {state['offset']}: {state['row_count']} rows, {self.processed_count} USA products")
+        return state['offset'], state['row_count'], state.get('completed', False)
     
-    def process_tsv_file(self, filename: str, max_rows: int = None) -> None:
-        """Process TSV file and count ingredient frequencies."""
-        logger.info(f"Processing TSV file: {filename}")
+    def process_tsv_file_checkpointed(self, filename: str, checkpoint_file: str, max_rows: int = None, resume: bool = False) -> None:
+        """Process TSV file serially, checkpointing the byte offset and counts periodically.
+        
+        A row that fails to read fails the run, leaving the last checkpoint to resume from.
+        """
+        logger.info(f"Processing TSV file: {filename} with checkpoints in {checkpoint_file}")
         
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                # Create CSV reader for TSV (tab-separated)
-                reader = csv.DictReader(file, delimiter='\t')
+            with open(filename, 'rb') as file:
+                fieldnames = next(csv.reader([file.readline().decode('utf-8')], delimiter='\t'), [])
+                offset, row_num = file.tell(), 0
+                
+                restored = self.restore_checkpoint(checkpoint_file, filename) if resume else None
+                if restored:
+                    offset, row_num, completed = restored
+                    if completed:
+                        logger.info("Checkpoint covers the whole file, nothing left to process")
+                        return
                 
-                for row_num, row in enumerate(reader, 1):
+                lines = LineRangeReader(file, offset)
+                next_checkpoint = time.monotonic() + CHECKPOINT_INTERVAL
+                
+                for columns in project_rows(lines, fieldnames, TSV_COLUMNS):
+                    row_num += 1
                     if max_rows and row_num > max_rows:
                         logger.info(f"Reached maximum rows limit: {max_rows}")
                         break
                     
-                    # Check if product is from USA
-                    countries = row.get('countries_en', '') or ''
-                    countries = countries.lower()
-                    if 'united states' not in countries and 'usa' not in countries:
-                        continue
-                    
-                    # Get ingredients text from the row (prefer English)
-                    ingredients_text = row.get('ingredients_text_en', '') or row.get('ingredients_text', '')
-                    
-                    if ingredients_text:
-                        ingredients = self.extract_ingredients_with_parentheses(ingredients_text)
-                        # Count each ingredient occurrence
-                        for ingredient in ingredients:
-                            self.ingredient_counts[ingredient] += 1
-                        self.processed_count += 1
+                    self.process_columns(*columns)
                     
                     # Log progress every 50000 rows
                     if row_num % 50000 == 0:
                         logger.info(f"Processed {row_num} rows, found {len(self.ingredient_counts)} unique ingredients, {self.processed_count} USA products")
-                        
+                        self.publish_metrics(row_num)
+                    
+                    # lines.position is now the end of this row, so the checkpoint never splits a row
+                    if row_num % 1000 == 0 and time.monotonic() >= next_checkpoint:
+                        self.save_checkpoint(checkpoint_file, filename, lines.position, row_num)
+                        next_checkpoint = time.monotonic() + CHECKPOINT_INTERVAL
+                else:
+                    self.save_checkpoint(checkpoint_file, filename, lines.position, row_num, completed=True)
+                self.publish_metrics(row_num)
+                    
         except FileNotFoundError:
             logger.error(f"File {filename} not found")
         except Exception as e:
+            # Keep the last checkpoint to resume from rather than saving partial counts as complete
             logger.error(f"Error processing file: {e}")
+            raise
     
-    def filter_common_words(self) -> None:
-        """Remove very common words that aren't actual ingredients."""
-        common_words = {
-            'and', 'or', 'the', 'of', 'in', 'with', 'from', 'by', 'for', 'on', 'at', 'to', 'as',
-            'may', 'contain', 'contains', 'including', 'made', 'using', 'added', 'per', 'each',
-            'less', 'than', 'more', 'some', 'other', 'also', 'natural', 'artificial', 'flavor',
-            'flavoring', 'flavour', 'flavouring', 'extract', 'powder', 'dried', 'fresh'
-        }
+    def process_tsv_file_parallel(self, filename: str, workers: int, checkpoint_file: str = None, resume: bool = False) -> None:
+        """Process TSV file in line-aligned byte-range chunks across a process pool.
+        
+        Per-chunk counters are merged in file order, so counts and tie order match
+        the serial run as long as every row sits on a single line. With checkpoint_file,
+        a checkpoint is saved after each merged chunk. A failed chunk fails the run.
+        """
+        logger.info(f"Processing TSV file: {filename} with {workers} workers")
+        
+        try:
+            start, total_rows = None, 0
+            restored = self.restore_checkpoint(checkpoint_file, filename) if checkpoint_file and resume else None
+            if restored:
+                start, total_rows, completed = restored
+                if completed:
+                    logger.info("Checkpoint covers the whole file, nothing left to process")
+                    return
+            
+            # Use several chunks per worker so one slow chunk doesn't stall the pool
+            fieldnames, chunks = find_chunk_boundaries(filename, workers * 4, start)
+            tasks = [(filename, start, end, fieldnames, self.worker_settings()) for start, end in chunks]
+            
+            with Pool(processes=workers) as pool:
+                for chunk_num, (counts, processed, rows, emitted, cooccurrence) in enumerate(pool.imap(_count_chunk, tasks), 1):
+                    self.ingredient_counts.update(counts)
+                    if cooccurrence is not None:
+                        self.cooccurrence.merge(cooccurrence)
+                    self.processed_count += processed
+                    self.emitted_count += emitted
+                    total_rows += rows
+                    self.publish_metrics(total_rows)
+                    logger.info(f"Merged chunk {chunk_num}/{len(tasks)}: {total_rows} rows, found {len(self.ingredient_counts)} unique ingredients, {self.processed_count} USA products")
+                    
+                    if checkpoint_file:
+                        self.save_checkpoint(checkpoint_file, filename, tasks[chunk_num - 1][2], total_rows,
+                                             completed=chunk_num == len(tasks))
+                    
+        except FileNotFoundError:
+            logger.error(f"File {filename} not found")
+        except Exception as e:
+            # The merged counts are missing the failed chunk onwards, so they mustn't be saved as complete
+            logger.error(f"Error processing file: {e}")
+            raise
+    
+    def remove_product(self, index: ProductIndex, code: str, changed: set) -> None:
+        """Subtract a product's previous ingredients from the counts and drop it from the index."""
+        for ingredient in index.ingredients(code):
+            remaining = self.ingredient_counts[ingredient] - 1
+            if remaining > 0:
+                self.ingredient_counts[ingredient] = remaining
+            else:
+                del self.ingredient_counts[ingredient]
+            changed.add(ingredient)
+        index.remove(code)
+    
+    def process_delta_file(self, filename: str, index_file: str = DEFAULT_INDEX_FILE, snapshot: bool = False) -> None:
+        """Update the counts persisted in index_file from a newer dump or a delta file.
+        
+        Each product is keyed on its code and fingerprinted on its source columns;
+        only new or changed products are tokenized, replacing their old contribution
+        to the counts. A product no longer matching the selected countries is removed.
+        With snapshot, filename is a complete dump and indexed products missing from
+        it are removed as well. The first run against an empty index is a full ingest.
         
+        Counts equal a full rescan of the same data, except that tied ingredients may
+        be listed in a different order and rows without a code or repeating a code
+        are not counted twice.
+        """
+        logger.info(f"Applying {filename} to ingredient index {index_file}")
+        
+        index = ProductIndex(index_file)
+        try:
+            index.check_country_terms(self.country_terms)
+            self.ingredient_counts = index.load_counts()
+            fingerprints = index.fingerprints()
+            stats = Counter()
+            changed = set()
+            seen = set()
+            row_num = 0
+            
+            for row_num, (code, countries, ingredients_text_en, ingredients_text) in enumerate(read_products(filename, PRODUCT_COLUMNS), 1):
+                if row_num % 50000 == 0:
+                    logger.info(f"Processed {row_num} rows: {dict(stats)}")
+                
+                if not code:
+                    stats['missing_code'] += 1
+                    continue
+                
+                text = ingredients_text_en or ingredients_text
+                lowered = (countries or '').lower()
+                if not text or not any(term in lowered for term in self.country_terms):
+                    if fingerprints.pop(code, None) is not None:
+                        self.remove_product(index, code, changed)
+                        stats['removed'] += 1
+                    continue
+                
+                seen.add(code)
+                fingerprint = product_fingerprint(countries, ingredients_text_en, ingredients_text)
+                previous = fingerprints.get(code)
+                if fingerprint == previous:
+                    stats['unchanged'] += 1
+                    continue
+                
+                if previous is not None:
+                    self.remove_product(index, code, changed)
+                    stats['updated'] += 1
+                else:
+                    stats['added'] += 1
+                
+                ingredients = self.extract_ingredients_with_parentheses(text)
+                self.ingredient_counts.update(ingredients)
+                changed.update(ingredients)
+                index.put(code, fingerprint, ingredients)
+                fingerprints[code] = fingerprint
+            
+            if snapshot:
+                for code in set(fingerprints) - seen:
+                    self.remove_product(index, code, changed)
+                    stats['removed'] += 1
+            
+            index.save_counts(self.ingredient_counts, changed)
+            index.set_meta('last_input', os.path.abspath(filename))
+            index.commit()
+            
+            self.processed_count = index.product_count()
+            for key, value in stats.items():
+                self.metrics.set_counter(f'extractor_delta_{key}_total', value)
+            self.metrics.set_counter('extractor_rows_parsed_total', row_num)
+            self.metrics.set_gauge('extractor_unique_ingredients', len(self.ingredient_counts))
+            logger.info(f"Index updated: {dict(stats)}, {len(changed)} ingredient counts changed")
+        
+        except FileNotFoundError:
+            logger.error(f"File {filename} not found")
+        except Exception as e:
+            logger.error(f"Error processing file: {e}")
+        finally:
+            index.close()
+    
+    def filter_common_words(self, common_words: Iterable[str] = COMMON_WORDS) -> None:
+        """Remove very common words that aren't actual ingredients."""
         # Remove common words and very short ingredients
         original_count = len(self.ingredient_counts)
         for word in common_words:
@@ -117,16 +595,35 @@ class TSVIngredientsExtractor:
                 del self.ingredient_counts[word]
         
         # Remove very short ingredients
-        to_remove = [ingredient for ingredient in self.ingredient_counts if len(ingredient) < 3]
+        to_remove = [ingredient for ingredient in self.ingredient_counts if len(ingredient) < MIN_FILTERED_LENGTH]
         for ingredient in to_remove:
             del self.ingredient_counts[ingredient]
         
         logger.info(f"Filtered {original_count - len(self.ingredient_counts)} common/short words")
     
+    def merge_variants(self) -> None:
+        """Merge the counts of near-duplicate ingredients (plurals, spacing, rare typos) into their canonical forms."""
+        clusterer = VariantClusterer()
+        self.variant_map = clusterer.cluster(self.ingredient_counts)
+        self.ingredient_counts = merge_counts(self.ingredient_counts, self.variant_map)
+        
+        stats = clusterer.stats
+        for key in ('spacing_links', 'plural_links', 'typo_links', 'merged_variants'):
+            self.metrics.set_counter(f'extractor_variant_{key}_total', stats[key])
+        self.metrics.set_gauge('extractor_unique_ingredients', len(self.ingredient_counts))
+        logger.info(f"Merged {stats['merged_variants']} ingredient variants in {stats['seconds']}s "
+                    f"({stats['spacing_links']} spacing, {stats['plural_links']} plural and {stats['typo_links']} typo links, "
+                    f"{stats['pairs_checked']} typo candidates verified)")
+    
     def get_top_ingredients(self, count: int = 10000) -> List[tuple]:
         """Get the top N most common ingredients."""
         self.filter_common_words()
-        return self.ingredient_counts.most_common(count)
+        if self.top_k_capacity:
+            bounds = self.ingredient_counts.error_bounds()
+            logger.info(f"Approximate counts: each overestimates by at most {bounds['max_error']} "
+                        f"(guaranteed bound {bounds['error_bound']} over {bounds['total']} occurrences)")
+            return self.ingredient_counts.most_common(count)
+        return rank_ingredients(self.ingredient_counts, count)
     
     def save_to_csv(self, filename: str = 'top_ingredients.csv', count: int = 10000) -> None:
         """Save top ingredients with frequencies to CSV file."""
@@ -151,6 +648,58 @@ class TSVIngredientsExtractor:
         
         logger.info(f"Saved top {len(top_ingredients)} ingredients to {filename}")
     
+    def iter_selected_products(self, filename: str) -> Iterator[Tuple[str, Optional[str], str, str, List[str]]]:
+        """Yield (code, name, countries, ingredients_text, ingredients) for the products the counts came from."""
+        for code, product_name, countries, ingredients_text_en, ingredients_text in read_products(filename, EXPORT_COLUMNS):
+            countries = countries or ''
+            if not any(term in countries.lower() for term in self.country_terms):
+                continue
+            text = ingredients_text_en or ingredients_text
+            if code and text:
+                ingredients = self.english_ingredients(text)
+                if ingredients is None:
+                    continue
+                if self.variant_map:
+                    ingredients = [self.variant_map.get(ingredient, ingredient) for ingredient in ingredients]
+                yield code, product_name, countries, text, ingredients
+    
+    def save_to_sqlite(self, filename: str, input_filename: str) -> None:
+        """Export the selected products, their ingredients and the frequencies to an indexed SQLite database.
+        
+        Re-reads input_filename for the products; ingredients removed by
+        filter_common_words are neither stored nor linked.
+        """
+        self.filter_common_words()
+        with IngredientDatabase.build(filename) as database:
+            database.add_ingredients(rank_ingredients(self.ingredient_counts))
+            product_count = database.add_products(self.iter_selected_products(input_filename))
+        
+        logger.info(f"Saved {product_count} products and {len(self.ingredient_counts)} ingredients to {filename}")
+    
+    def save_to_vocabulary(self, filename: str, input_filename: str) -> None:
+        """Save the ingredient counts and each selected product's ingredients as ID arrays to a memory-mappable vocabulary file.
+        
+        Re-reads input_filename for the products, like save_to_sqlite.
+        """
+        self.filter_common_words()
+        vocabulary = IngredientVocabulary.from_counts(self.ingredient_counts)
+        products = ((code, ingredients) for code, _, _, _, ingredients in self.iter_selected_products(input_filename))
+        product_count = vocabulary.save(filename, products)
+        
+        logger.info(f"Saved {len(vocabulary)} ingredients and {product_count} product ingredient lists to {filename}")
+    
+    def save_to_cooccurrence(self, filename: str, count: int = 10000) -> None:
+        """Save the co-occurrence counts among the top N ingredients, keyed by their rank in the CSV output.
+
+        After merge_variants, counts of merged ingredients are per listing, like their
+        frequencies: a product listing two variants of one counts twice.
+        """
+        top_ingredients = self.get_top_ingredients(count)
+        nonzero = self.cooccurrence.save(filename, top_ingredients, self.variant_map)
+        
+        logger.info(f"Saved {nonzero} co-occurrence counts among the top {len(top_ingredients)} ingredients "
+                    f"of {self.cooccurrence.product_count} products to {filename}")
+    
     def preview_results(self, count: int = 30) -> None:
         """Preview top N most common ingredients."""
         top_ingredients = self.get_top_ingredients(count)
@@ -160,35 +709,121 @@ class TSVIngredientsExtractor:
 
 def main():
     """Main function."""
-    extractor = TSVIngredientsExtractor()
+    parser = argparse.ArgumentParser(description='Extract top USA ingredients from the OpenFoodFacts TSV dump')
+    parser.add_argument('-i', '--input', default='en.openfoodfacts.org.products.tsv',
+                       help='TSV dump to process, optionally .gz/.bz2/.xz/.zst compressed, or a JSONL or Parquet export (default: en.openfoodfacts.org.products.tsv)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                       help='Number of worker processes, 0 for one per CPU (default: 1)')
+    parser.add_argument('--reader', choices=EXTRACTOR_READERS, default='projected',
+                       help='Row reader for serial runs, or vectorized to count whole column batches with pyarrow (default: projected)')
+    parser.add_argument('--countries', default=','.join(DEFAULT_COUNTRY_TERMS),
+                       help='Comma-separated terms to match in countries_en (default: united states,usa)')
+    parser.add_argument('--top-k-capacity', type=int,
+                       help='Count approximately with at most this many counters (Space-Saving) to bound memory')
+    parser.add_argument('--checkpoint', nargs='?', const=DEFAULT_CHECKPOINT_FILE,
+                       help=f'Save periodic checkpoints to this file (default file: {DEFAULT_CHECKPOINT_FILE})')
+    parser.add_argument('--resume', action='store_true',
+                       help='Resume from the last checkpoint, implies --checkpoint')
+    parser.add_argument('--index', nargs='?', const=DEFAULT_INDEX_FILE,
+                       help=f'Incrementally apply the input (a newer dump, or a JSON delta export) to this per-product index (default file: {DEFAULT_INDEX_FILE})')
+    parser.add_argument('--snapshot', action='store_true',
+                       help='With --index, the input is a complete dump: indexed products missing from it are removed')
+    parser.add_argument('--sqlite', nargs='?', const=DEFAULT_DATABASE_FILE,
+                       help=f'Also export products, ingredients and frequencies to this SQLite database (default file: {DEFAULT_DATABASE_FILE})')
+    parser.add_argument('--vocabulary', nargs='?', const=DEFAULT_VOCABULARY_FILE,
+                       help=f'Also save the counts and per-product ingredient IDs as a memory-mappable vocabulary file (default file: {DEFAULT_VOCABULARY_FILE})')
+    parser.add_argument('--cooccurrence', nargs='?', const=DEFAULT_COOCCURRENCE_FILE,
+                       help=f'Also count ingredient pairs per product and save them among the top ingredients as a sparse COO matrix (default file: {DEFAULT_COOCCURRENCE_FILE})')
+    parser.add_argument('--cooccurrence-vocabulary',
+                       help='Only count pairs among the ingredients of this earlier CSV output, to bound memory (default: every ingredient until the top ones are known)')
+    parser.add_argument('--english-only', action='store_true',
+                       help='Leave out foreign ingredients texts and tokens, by the English food lexicon in data/english_food_lexicon.txt')
+    parser.add_argument('--cluster-variants', action='store_true',
+                       help='Merge near-duplicate ingredients (plurals, spacing, rare typos) into one canonical form before saving')
+    add_metrics_arguments(parser)
+    
+    args = parser.parse_args()
+    if args.index and args.top_k_capacity:
+        parser.error('--index keeps exact counts and cannot be combined with --top-k-capacity')
+    if args.sqlite and args.top_k_capacity:
+        parser.error('--sqlite exports exact frequencies and cannot be combined with --top-k-capacity')
+    if args.sqlite and args.index:
+        parser.error('--sqlite exports the products scanned, only the delta with --index, and cannot be combined with --index')
+    if args.vocabulary and args.top_k_capacity:
+        parser.error('--vocabulary exports exact frequencies and cannot be combined with --top-k-capacity')
+    if args.vocabulary and args.index:
+        parser.error('--vocabulary saves the products scanned, only the delta with --index, and cannot be combined with --index')
+    if args.index and args.english_only:
+        parser.error('--english-only is not recorded in the index and cannot be combined with --index')
+    if args.cluster_variants and args.top_k_capacity:
+        parser.error('--cluster-variants merges exact frequencies and cannot be combined with --top-k-capacity')
+    if args.cooccurrence and (args.index or args.top_k_capacity):
+        parser.error('--cooccurrence needs a full scan with exact counts and cannot be combined with --index or --top-k-capacity')
+    if args.cooccurrence_vocabulary and not args.cooccurrence:
+        parser.error('--cooccurrence-vocabulary needs --cooccurrence')
+    if args.cooccurrence:
+        try:
+            require_numpy()
+        except ImportError as e:
+            parser.error(str(e))
+    
+    country_terms = tuple(term.strip() for term in args.countries.split(',') if term.strip())
+    metrics = Metrics()
+    cooccurrence_vocabulary = read_vocabulary_csv(args.cooccurrence_vocabulary) if args.cooccurrence_vocabulary else None
+    extractor = TSVIngredientsExtractor(country_terms, top_k_capacity=args.top_k_capacity, metrics=metrics,
+                                        english_only=args.english_only, cooccurrence=bool(args.cooccurrence),
+                                        cooccurrence_vocabulary=cooccurrence_vocabulary)
     
     # Configuration
-    TSV_FILENAME = 'en.openfoodfacts.org.products.tsv'
+    TSV_FILENAME = args.input
     TOP_COUNT = 10000
+    WORKERS = args.workers or os.cpu_count() or 1
+    CHECKPOINT_FILE = args.checkpoint or (DEFAULT_CHECKPOINT_FILE if args.resume else None)
     
-    try:
-        # Process entire TSV file to count all ingredient frequencies
-        extractor.process_tsv_file(TSV_FILENAME)
-        
-        # Preview results
-        extractor.preview_results(50)
-        
-        # Save results
-        extractor.save_to_csv('top_10000_usa_ingredients.csv', TOP_COUNT)
-        extractor.save_to_txt('top_10000_usa_ingredients.txt', TOP_COUNT)
-        
-        logger.info("Extraction completed!")
-        logger.info(f"Total USA products processed: {extractor.processed_count}")
-        logger.info(f"Total unique ingredients found: {len(extractor.ingredient_counts)}")
-        logger.info(f"Saved top {TOP_COUNT} most common USA ingredients")
-        
-    except KeyboardInterrupt:
-        logger.info("Extraction interrupted by user")
-        extractor.preview_results(20)
-        
-        if extractor.ingredient_counts:
-            extractor.save_to_csv('top_ingredients_partial.csv', 5000)
-            logger.info("Saved partial results")
+    with instrumented(args, metrics):
+        try:
+            with metrics.timer('extractor_process_seconds'):
+                if args.index:
+                    # Apply only new and changed products to the persisted counts
+                    extractor.process_delta_file(TSV_FILENAME, args.index, snapshot=args.snapshot)
+                else:
+                    # Process entire TSV file to count all ingredient frequencies
+                    extractor.process_tsv_file(TSV_FILENAME, workers=WORKERS, reader=args.reader,
+                                               checkpoint_file=CHECKPOINT_FILE, resume=args.resume)
+            
+            if args.cluster_variants:
+                with metrics.timer('extractor_cluster_seconds'):
+                    extractor.merge_variants()
+            
+            # Preview results
+            extractor.preview_results(50)
+            
+            # Save results
+            with metrics.timer('extractor_save_seconds'):
+                extractor.save_to_csv('top_10000_usa_ingredients.csv', TOP_COUNT)
+                extractor.save_to_txt('top_10000_usa_ingredients.txt', TOP_COUNT)
+                if args.sqlite:
+                    extractor.save_to_sqlite(args.sqlite, TSV_FILENAME)
+                if args.vocabulary:
+                    extractor.save_to_vocabulary(args.vocabulary, TSV_FILENAME)
+                if args.cooccurrence:
+                    extractor.save_to_cooccurrence(args.cooccurrence, TOP_COUNT)
+            
+            logger.info("Extraction completed!")
+            logger.info(f"Total USA products processed: {extractor.processed_count}")
+            logger.info(f"Total unique ingredients found: {len(extractor.ingredient_counts)}")
+            if extractor.english_filter:
+                logger.info(f"English filter left out {extractor.english_filter.texts_rejected} foreign texts "
+                            f"and {extractor.english_filter.tokens_rejected} foreign tokens")
+            logger.info(f"Saved top {TOP_COUNT} most common USA ingredients")
+            
+        except KeyboardInterrupt:
+            logger.info("Extraction interrupted by user")
+            extractor.preview_results(20)
+            
+            if extractor.ingredient_counts:
+                extractor.save_to_csv('top_ingredients_partial.csv', 5000)
+                logger.info("Saved partial results")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Vectorized Ingredient Counting
+
+Columnar version of the extractor's per-row loop on pyarrow record batches: the country
+filter, parenthesis handling, splitting and letter cleaning of tokenize_with_parentheses
+run as pyarrow compute kernels over a whole batch, and the tokens are aggregated with
+value_counts. The counts are the same as those of the row-by-row extractor.
+"""
+
+from typing import Dict, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+from ingredient_tokenizer import MIN_INGREDIENT_LENGTH
+
+def _whitespace_class(exclude: str = '') -> str:
+    """RE2 character class body matching exactly the characters Python's str.split and re's \\s treat as whitespace."""
+    codes = [code for code in range(0x3001) if chr(code).isspace() and chr(code) not in exclude]
+    ranges = []
+    for code in codes:
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return ''.join(f'\\x{{{low:x}}}' if low == high else f'\\x{{{low:x}}}-\\x{{{high:x}}}' for low, high in ranges)
+
+# RE2's \s is ASCII-only, while the tokenizer keeps Unicode whitespace such as no-break spaces
+WHITESPACE = _whitespace_class()
+
+# What tokenize_with_parentheses removes: anything but letters, whitespace and separators
+NON_LETTER_WITH_SEPARATORS = f'[^a-zA-Z{WHITESPACE},;]+'
+
+# Whitespace that differs from a single space; leaving the common single spaces
+# unmatched makes normalizing much cheaper than replacing every run
+IRREGULAR_WHITESPACE = f' [{WHITESPACE}]+|[{_whitespace_class(exclude=" ")}][{WHITESPACE}]*'
+
+# Parenthesis contents, as PARENTHESES_SPLIT finds them, each followed by ', '; the rest
+# of the text (with no complete pair left) becomes a single ', '
+PARENTHESES_CONTENTS = r'(?s)[^(]*\(([^)]*)\)|(?s).+'
+PARENTHESES = r'\([^)]*\)'
+
+def require_pyarrow() -> None:
+    """Raise ImportError when pyarrow is not installed."""
+    if pa is None:
+        raise ImportError("The vectorized engine requires the pyarrow package")
+
+def select_texts(countries: 'pa.Array', ingredients_text_en: 'pa.Array', ingredients_text: 'pa.Array',
+                 country_terms: Sequence[str]) -> 'pa.Array':
+    """Ingredients texts (English preferred) of the non-empty products from a selected country."""
+    countries = pc.utf8_lower(pc.fill_null(countries, ''))
+    selected = None
+    for term in country_terms:
+        matches = pc.match_substring(countries, term)
+        selected = matches if selected is None else pc.or_(selected, matches)
+    if selected is None:
+        return pa.array([], pa.string())
+
+    english = pc.fill_null(ingredients_text_en, '')
+    texts = pc.if_else(pc.not_equal(english, ''), english, pc.fill_null(ingredients_text, ''))
+    return pc.filter(texts, pc.and_(selected, pc.not_equal(texts, '')))
+
+def tokenize_texts(texts: 'pa.Array') -> 'pa.Array':
+    """The tokens tokenize_with_parentheses yields for every text, concatenated (in a different order)."""
+    # The text outside parentheses and their contents become separate parts: counts don't
+    # depend on order, so they needn't be rejoined per product
+    has_parentheses = pc.match_substring(texts, '(')
+    with_parentheses = pc.filter(texts, has_parentheses)
+    all_text = pa.concat_arrays([
+        pc.filter(texts, pc.invert(has_parentheses)),
+        pc.replace_substring_regex(with_parentheses, PARENTHESES, ''),
+        pc.replace_substring_regex(with_parentheses, PARENTHESES_CONTENTS, r'\1, ')
+    ])
+
+    all_text = pc.replace_substring_regex(all_text, NON_LETTER_WITH_SEPARATORS, '')
+    all_text = pc.replace_substring(pc.ascii_lower(all_text), ';', ',')
+    all_text = pc.replace_substring_regex(all_text, IRREGULAR_WHITESPACE, ' ')
+
+    # Each comma-separated ingredient with single spaces, like ' '.join(ingredient.split())
+    phrases = pc.utf8_trim(pc.list_flatten(pc.split_pattern(all_text, ',')), ' ')
+    phrases = pc.filter(phrases, pc.not_equal(phrases, ''))
+    multi_word = pc.greater(pc.count_substring(phrases, ' '), 0)
+
+    # Multi-word phrases always count; single words only when long enough
+    long_enough = pc.greater_equal(pc.utf8_length(phrases), MIN_INGREDIENT_LENGTH)
+    phrase_tokens = pc.filter(phrases, pc.or_(multi_word, long_enough))
+
+    # Plus each long enough word of the multi-word phrases
+    words = pc.list_flatten(pc.split_pattern(pc.filter(phrases, multi_word), ' '))
+    word_tokens = pc.filter(words, pc.greater_equal(pc.utf8_length(words), MIN_INGREDIENT_LENGTH))
+
+    return pa.concat_arrays([phrase_tokens, word_tokens])
+
+def count_batch(countries: 'pa.Array', ingredients_text_en: 'pa.Array', ingredients_text: 'pa.Array',
+                country_terms: Sequence[str]) -> Tuple[Dict[str, int], int, int]:
+    """Ingredient counts of one batch. Returns (counts, selected products, tokens emitted)."""
+    texts = select_texts(countries, ingredients_text_en, ingredients_text, country_terms)
+    if not len(texts):
+        return {}, 0, 0
+
+    tokens = tokenize_texts(texts)
+    counts = pc.value_counts(tokens)
+    return (dict(zip(counts.field('values').to_pylist(), counts.field('counts').to_pylist())),
+            len(texts), len(tokens))